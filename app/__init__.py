@@ -25,6 +25,38 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     csrf.init_app(app)
 
+    # Realtime event bus cho SSE (PostgreSQL LISTEN/NOTIFY, fallback in-memory)
+    from app import realtime
+    realtime.init_app(app)
+
+    # Theo dõi số connection đang checkout khỏi pool (xem /sse/admin/stats)
+    from app import db_metrics
+    db_metrics.init_app(app)
+
+    # Bộ đếm thông báo theo user (user_notification_counters)
+    from app import notification_service
+    notification_service.init_app(app)
+
+    # Bảng tổng hợp task_stats cho dashboard / hub (cộng / trừ theo nhóm bị ảnh hưởng khi flush)
+    from app import task_stats
+    task_stats.init_app(app)
+
+    # Cache 2 tầng (trong process + filesystem / redis dùng chung giữa các worker)
+    from app import cache
+    cache.init_app(app)
+
+    # Badge hub: cache theo user, xóa khi có ghi vào bảng liên quan
+    from app import hub_stats
+    hub_stats.init_app(app)
+
+    # Web Push: gửi thông báo tới thiết bị qua hàng đợi nền (tắt nếu chưa cấu hình VAPID)
+    from app import webpush
+    webpush.init_app(app)
+
+    # Outbox: request chỉ ghi lệnh gửi thông báo, thread nền tạo thông báo sau commit
+    from app import notification_outbox
+    notification_outbox.init_app(app)
+
     login_manager.login_view = 'auth.login'
     login_manager.login_message = None
 
@@ -0,0 +1,449 @@
+"""
+Cache - lớp cache dùng chung cho các số liệu tính tốn kém (hub, thống kê)
+- 2 tầng: LRU + TTL trong process (luôn có) -> tầng chia sẻ giữa các worker (tùy chọn)
+- CACHE_BACKEND: 'memory' (chỉ trong process), 'filesystem' (file JSON trong CACHE_DIR,
+  dùng chung cho các worker gunicorn trên cùng máy), 'redis' (CACHE_REDIS_URL, cần package redis -
+  chưa cài / không kết nối được -> dùng 'memory')
+- Namespace: nhóm key cùng loại dữ liệu, TTL riêng, tự xóa khi commit có ghi vào các model khai báo
+  trong invalidate_on (ORM flush + insert / update / delete hàng loạt qua session)
+- Xóa namespace = đổi generation của namespace (lưu ở tầng chia sẻ): mọi key cũ ở mọi worker
+  tự thành miss, không cần quét / xóa từng key
+- Generation được nhớ trong process GENERATION_TTL giây (CACHE_GENERATION_TTL): cache hit không cần
+  round-trip tới tầng chia sẻ; worker tự xóa thấy ngay, xóa từ worker khác thấy chậm tối đa GENERATION_TTL.
+  get_or_set đọc generation 1 lần: giá trị tính trong lúc namespace bị xóa ghi vào generation cũ (bỏ đi),
+  không ghi đè vào generation mới
+- Giá trị lưu dạng JSON ở tầng chia sẻ: chỉ cache dict / list / str / số
+- stats(): hit (local / shared) / miss / set / invalidate theo namespace (/sse/admin/stats)
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_TTL = 30
+LOCAL_MAX_ITEMS = 5000
+GENERATION_TTL = 1          # giây - nhớ generation của namespace trong process
+FILE_PURGE_EVERY = 500      # số lần set giữa 2 lần dọn file hết hạn
+
+_PENDING_KEY = 'cache_invalidate'
+_events_registered = False
+
+# Mọi namespace đã khai báo: tên -> Namespace
+namespaces = {}
+
+
+# ============================================================
+# TẦNG TRONG PROCESS
+# ============================================================
+class LocalTier:
+    """LRU có hạn mức, mỗi mục kèm thời điểm hết hạn (time.time())"""
+
+    def __init__(self, max_items=LOCAL_MAX_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# ============================================================
+# TẦNG CHIA SẺ - get / set (JSON, có hạn) + generation của namespace
+# ============================================================
+class MemoryStore:
+    """Không có tầng chia sẻ: generation chỉ nằm trong process"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, expires_at):
+        pass
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, '0')
+
+    def bump(self, namespace):
+        with self._lock:
+            self._generations[namespace] = os.urandom(8).hex()
+
+
+class FileStore:
+    """
+    1 file JSON / key trong `directory` (tên file = sha1 của key), ghi tạm rồi os.replace
+    để worker khác không đọc phải file dở. File hết hạn xóa khi đọc và định kỳ khi set.
+    """
+
+    name = 'filesystem'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sets = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, key):
+        path = self._path(key)
+        item = self._read(path)
+        if item is None:
+            return None
+        if item['expires_at'] <= time.time():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        return item['expires_at'], item['value']
+
+    def set(self, key, value, expires_at):
+        self._write(self._path(key), {'expires_at': expires_at, 'value': value})
+        with self._lock:
+            self._sets += 1
+            purge = self._sets % FILE_PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self):
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(('.', 'gen-')):
+                continue
+            item = self._read(entry.path)
+            if item is None or item['expires_at'] <= now:
+                try:
+                    os.unlink(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _generation_path(self, namespace):
+        return os.path.join(self.directory, f'gen-{namespace}')
+
+    def generation(self, namespace):
+        try:
+            with open(self._generation_path(namespace), 'r', encoding='utf-8') as f:
+                return f.read().strip() or '0'
+        except OSError:
+            return '0'
+
+    def bump(self, namespace):
+        # Token ngẫu nhiên thay vì +1: 2 worker cùng bump không bao giờ ghi ra cùng 1 giá trị
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(os.urandom(8).hex())
+        os.replace(tmp_path, self._generation_path(namespace))
+
+
+class RedisStore:
+    """Redis (hoặc server tương thích): SETEX theo TTL, generation = INCR"""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='cache:'):
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.prefix = prefix
+        self.client.ping()
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        item = json.loads(raw)
+        return item['expires_at'], item['value']
+
+    def set(self, key, value, expires_at):
+        ttl = max(1, int(expires_at - time.time()))
+        self.client.setex(self.prefix + key, ttl, json.dumps({'expires_at': expires_at, 'value': value}))
+
+    def generation(self, namespace):
+        value = self.client.get(f'{self.prefix}gen:{namespace}')
+        return value.decode() if value is not None else '0'
+
+    def bump(self, namespace):
+        self.client.incr(f'{self.prefix}gen:{namespace}')
+
+
+class CacheBackend:
+    """Tầng local + tầng chia sẻ của 1 app (app.extensions['cache'])"""
+
+    def __init__(self, store, local_max_items=LOCAL_MAX_ITEMS, generation_ttl=GENERATION_TTL):
+        self.store = store
+        self.local = LocalTier(local_max_items)
+        self.generation_ttl = generation_ttl
+        self._generations = {}      # namespace -> (hết hạn, generation)
+        self._bumps = {}            # namespace -> số lần worker này bump
+        self._lock = threading.Lock()
+
+    def _shared(self, method, *args, default=None):
+        # Tầng chia sẻ lỗi (redis mất kết nối, hết dung lượng đĩa...) -> coi như miss, không làm hỏng request
+        try:
+            return getattr(self.store, method)(*args)
+        except Exception as e:
+            print(f"⚠️ Cache {self.store.name}.{method} error: {e}")
+            return default
+
+    def generation(self, namespace):
+        item = self._generations.get(namespace)
+        if item is not None and item[0] > time.time():
+            return item[1]
+        bumps = self._bumps.get(namespace, 0)
+        generation = self._shared('generation', namespace, default='0')
+        with self._lock:
+            # Worker này bump trong lúc đang đọc -> giá trị vừa đọc có thể đã cũ, không nhớ
+            if self._bumps.get(namespace, 0) == bumps:
+                self._generations[namespace] = (time.time() + self.generation_ttl, generation)
+        return generation
+
+    def bump(self, namespace):
+        self._shared('bump', namespace)
+        # Lần đọc sau của worker này lấy generation mới từ tầng chia sẻ
+        with self._lock:
+            self._bumps[namespace] = self._bumps.get(namespace, 0) + 1
+            self._generations.pop(namespace, None)
+
+
+# ============================================================
+# NAMESPACE
+# ============================================================
+class Namespace:
+    """
+    Nhóm key cùng loại dữ liệu:
+        performance = cache.Namespace('hub_performance', ttl=30, invalidate_on=(Task, TaskAssignment))
+        data = performance.get_or_set(('director', date_from, date_to), lambda: compute(...))
+    ttl <= 0: không cache (luôn gọi hàm tính).
+    """
+
+    def __init__(self, name, ttl=DEFAULT_TTL, invalidate_on=()):
+        if name in namespaces:
+            raise ValueError(f'Cache namespace {name!r} đã tồn tại')
+        self.name = name
+        self.ttl = ttl
+        self.invalidate_on = tuple(invalidate_on)
+        self._lock = threading.Lock()
+        self.metrics = dict.fromkeys(('local_hits', 'shared_hits', 'misses', 'sets', 'invalidations'), 0)
+        namespaces[name] = self
+
+    def _count(self, metric):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _key(self, key, generation):
+        parts = key if isinstance(key, tuple) else (key,)
+        return ':'.join([self.name, generation] + ['' if part is None else str(part) for part in parts])
+
+    def get(self, key, default=None):
+        backend = get_backend()
+        if backend is None or self.ttl <= 0:
+            return default
+        return self._get(backend, self._key(key, backend.generation(self.name)), default)
+
+    def _get(self, backend, full_key, default):
+        item = backend.local.get(full_key)
+        if item is not None:
+            self._count('local_hits')
+            return item[1]
+
+        item = backend._shared('get', full_key)
+        if item is not None:
+            backend.local.set(full_key, item[1], item[0])
+            self._count('shared_hits')
+            return item[1]
+
+        self._count('misses')
+        return default
+
+    def set(self, key, value):
+        backend = get_backend()
+        if backend is None or self.ttl <= 0:
+            return
+        self._set(backend, self._key(key, backend.generation(self.name)), value)
+
+    def _set(self, backend, full_key, value):
+        expires_at = time.time() + self.ttl
+        backend.local.set(full_key, value, expires_at)
+        backend._shared('set', full_key, value, expires_at)
+        self._count('sets')
+
+    def get_or_set(self, key, compute):
+        backend = get_backend()
+        if backend is None or self.ttl <= 0:
+            return compute()
+
+        # Generation đọc TRƯỚC khi tính: namespace bị xóa trong lúc tính -> giá trị nằm ở generation cũ
+        full_key = self._key(key, backend.generation(self.name))
+        missing = object()
+        value = self._get(backend, full_key, missing)
+        if value is missing:
+            value = compute()
+            self._set(backend, full_key, value)
+        return value
+
+    def invalidate(self):
+        """Bỏ toàn bộ key của namespace (mọi worker dùng chung tầng chia sẻ)"""
+        backend = get_backend()
+        if backend is None:
+            return
+        backend.bump(self.name)
+        self._count('invalidations')
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, ttl=self.ttl)
+
+
+# ============================================================
+# WRITE-TRIGGERED INVALIDATION
+# ============================================================
+def _mark(session, model_class):
+    for namespace in namespaces.values():
+        if namespace.invalidate_on and issubclass(model_class, namespace.invalidate_on):
+            session.info.setdefault(_PENDING_KEY, set()).add(namespace.name)
+
+
+def _after_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        _mark(session, type(obj))
+
+
+def _do_orm_execute(orm_execute_state):
+    # insert() / query.update() / query.delete() hàng loạt không qua flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        _mark(orm_execute_state.session, mapper.class_)
+
+
+def _after_commit(session):
+    for name in session.info.pop(_PENDING_KEY, ()):
+        namespaces[name].invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _register_events():
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous: _after_rollback(session))
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+def _create_store(app):
+    backend = app.config.get('CACHE_BACKEND', 'memory')
+
+    if backend == 'filesystem':
+        directory = app.config.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'app-cache')
+        try:
+            return FileStore(directory)
+        except OSError as e:
+            print(f"⚠️ Cache: không tạo được thư mục {directory} ({e}) - dùng memory")
+
+    elif backend == 'redis':
+        if redis is None:
+            print("⚠️ Cache: chưa cài package redis - dùng memory")
+        else:
+            try:
+                return RedisStore(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+            except Exception as e:
+                print(f"⚠️ Cache: không kết nối được redis ({e}) - dùng memory")
+
+    return MemoryStore()
+
+
+def init_app(app):
+    store = _create_store(app)
+    app.extensions['cache'] = CacheBackend(
+        store,
+        app.config.get('CACHE_LOCAL_MAX_ITEMS', LOCAL_MAX_ITEMS),
+        app.config.get('CACHE_GENERATION_TTL', GENERATION_TTL)
+    )
+    print(f"✅ Cache backend: {store.name}")
+    _register_events()
+
+
+def get_backend():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('cache')
+
+
+def stats():
+    backend = get_backend()
+    return {
+        'backend': backend.store.name if backend else None,
+        'local_items': len(backend.local) if backend else 0,
+        'namespaces': {name: namespace.stats() for name, namespace in namespaces.items()}
+    }
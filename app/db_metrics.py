@@ -0,0 +1,76 @@
+"""
+DB Pool Metrics - theo dõi số connection đang bị checkout khỏi pool
+Dùng để kiểm chứng SSE chỉ giữ connection trong lúc query (không giữ suốt stream)
+"""
+
+from flask import current_app
+from sqlalchemy import event
+import threading
+import time
+
+
+class PoolMetrics:
+    """Đếm checkout/checkin của pool, lưu đỉnh (peak) kể từ lúc khởi động / reset"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.engine = None
+        self.checked_out = 0
+        self.peak = 0
+        self.peak_at = None
+        self.total_checkouts = 0
+
+    def attach(self, engine):
+        self.engine = engine
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checked_out += 1
+            self.total_checkouts += 1
+            if self.checked_out > self.peak:
+                self.peak = self.checked_out
+                self.peak_at = time.time()
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def reset_peak(self):
+        with self._lock:
+            self.peak = self.checked_out
+            self.peak_at = time.time()
+
+    def snapshot(self):
+        pool = self.engine.pool if self.engine is not None else None
+
+        # NullPool / StaticPool (SQLite) không có size / overflow
+        def pool_value(name):
+            method = getattr(pool, name, None)
+            return method() if callable(method) else None
+
+        with self._lock:
+            return {
+                'pool_class': type(pool).__name__ if pool is not None else None,
+                'pool_size': pool_value('size'),
+                'checked_out': self.checked_out,
+                'overflow': pool_value('overflow'),
+                'checked_in': pool_value('checkedin'),
+                'peak_checked_out': self.peak,
+                'peak_at': self.peak_at,
+                'total_checkouts': self.total_checkouts
+            }
+
+
+def init_app(app):
+    from app import db
+
+    metrics = PoolMetrics()
+    with app.app_context():
+        metrics.attach(db.engine)
+    app.extensions['pool_metrics'] = metrics
+
+
+def get_metrics():
+    return current_app.extensions['pool_metrics']
@@ -1,37 +1,47 @@
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required, current_user
-from app.models import Task, TaskAssignment, Salary, Employee, News, Notification, User
-from datetime import datetime, timedelta
+from app.models import Task, TaskAssignment, Salary, Employee, User
+from datetime import datetime
 from app.utils import utc_to_vn, vn_to_utc
-from app import db
+from app import db, cache, hub_stats
 from sqlalchemy import func, case
 
 bp = Blueprint('hub', __name__, url_prefix='/hub')
 
 
 # ========================================
-# CACHE ĐƠN GIẢN TRONG BỘ NHỚ
+# CACHE (app/cache.py) - dùng chung giữa các worker nếu bật CACHE_BACKEND chia sẻ,
+# tự xóa khi task / assignment / user thay đổi
 # ========================================
-import time as _time
+PERFORMANCE_CACHE_TTL = 30
 
-_cache_store = {}
-_cache_ttl_store = {}
+performance_cache = cache.Namespace(
+    'hub_performance', ttl=PERFORMANCE_CACHE_TTL, invalidate_on=(Task, TaskAssignment, User)
+)
+top_bottom_cache = cache.Namespace(
+    'hub_top_bottom', ttl=PERFORMANCE_CACHE_TTL, invalidate_on=(Task, TaskAssignment, User)
+)
 
-def _cache_get(key):
-    if key in _cache_store:
-        if _time.time() - _cache_ttl_store.get(key, 0) < 30:  # TTL 30 giây
-            return _cache_store[key]
-    return None
 
-def _cache_set(key, value):
-    _cache_store[key] = value
-    _cache_ttl_store[key] = _time.time()
+def _performance_scope():
+    """Phạm vi user của bảng performance: director / manager dùng chung theo role, còn lại theo user"""
+    if current_user.role in ['director', 'manager']:
+        return current_user.role
+    return f'user-{current_user.id}'
 
 
 # ========================================
 # PERFORMANCE DATA - TỐI ƯU: 1 QUERY TỔNG HỢP thay vì N*4 queries
 # ========================================
 def get_team_performance_data(date_from=None, date_to=None):
+    """Performance data theo phạm vi của current_user - qua cache"""
+    return performance_cache.get_or_set(
+        (_performance_scope(), date_from, date_to),
+        lambda: _compute_team_performance(date_from, date_to)
+    )
+
+
+def _compute_team_performance(date_from=None, date_to=None):
     """
     Lấy performance data - dùng GROUP BY thay vì loop từng user
     Từ N*4 queries → 1 query duy nhất
@@ -147,6 +157,14 @@ def get_team_performance_data(date_from=None, date_to=None):
 # TOP/BOTTOM USERS - TỐI ƯU: 1 QUERY thay vì N queries
 # ========================================
 def get_top_bottom_users_data(date_from=None, date_to=None):
+    """Top & bottom users (giống nhau với mọi user) - qua cache"""
+    return top_bottom_cache.get_or_set(
+        (date_from, date_to),
+        lambda: _compute_top_bottom_users(date_from, date_to)
+    )
+
+
+def _compute_top_bottom_users(date_from=None, date_to=None):
     """
     Lấy top & bottom users - 1 query GROUP BY thay vì loop
     """
@@ -226,87 +244,16 @@ def get_top_bottom_users_data(date_from=None, date_to=None):
 @bp.route('/')
 @login_required
 def workflow_hub():
-    now = datetime.utcnow()
-
-    # Công việc cá nhân - dùng subquery thay vì load all assignments
-    my_task_ids_subq = db.session.query(TaskAssignment.task_id).filter(
-        TaskAssignment.user_id == current_user.id,
-        TaskAssignment.accepted == True
-    ).subquery()
-
-    my_pending_tasks = Task.query.filter(
-        Task.id.in_(my_task_ids_subq),
-        Task.status == 'PENDING'
-    ).count()
-
-    my_in_progress = Task.query.filter(
-        Task.id.in_(my_task_ids_subq),
-        Task.status == 'IN_PROGRESS'
-    ).count()
-
-    three_days_later = now + timedelta(days=3)
-    my_due_soon = Task.query.filter(
-        Task.id.in_(my_task_ids_subq),
-        Task.due_date >= now,
-        Task.due_date <= three_days_later,
-        Task.status.in_(['PENDING', 'IN_PROGRESS'])
-    ).count()
-
-    my_overdue = Task.query.filter(
-        Task.id.in_(my_task_ids_subq),
-        Task.due_date < now,
-        Task.status.in_(['PENDING', 'IN_PROGRESS'])
-    ).count()
-
-    # Quản lý
-    tasks_need_rating = 0
-    my_tasks_need_rating = 0
-    tasks_need_approval = 0
-
-    if current_user.role in ['director', 'manager']:
-        tasks_need_rating = Task.query.filter(
-            Task.status == 'DONE',
-            Task.performance_rating == None
-        ).count()
-
-        my_tasks_need_rating = Task.query.filter(
-            Task.creator_id == current_user.id,
-            Task.status == 'DONE',
-            Task.performance_rating == None
-        ).count()
-
-        query = Task.query.filter(
-            Task.requires_approval == True,
-            Task.approved == None
-        )
-        if current_user.role == 'manager':
-            query = query.join(User, Task.creator_id == User.id).filter(
-                User.role == 'hr'
-            )
-        tasks_need_approval = query.count()
+    # Badge công việc / thông báo / lương: 1 query tổng hợp (dùng chung cache với realtime-stats)
+    stats = hub_stats.get(current_user)
 
     # Lương
     total_salaries = 0
     total_employees = 0
-    pending_penalties = 0
-    pending_advances = 0
 
     if current_user.role in ['director', 'accountant']:
         total_salaries = Salary.query.count()
         total_employees = Employee.query.filter_by(is_active=True).count()
-        from app.models import Penalty, Advance
-        pending_penalties = Penalty.query.filter_by(is_deducted=False).count()
-        pending_advances = Advance.query.filter_by(is_deducted=False).count()
-
-    # Thông báo - dùng scalar count thay vì load objects
-    unread_notifications = db.session.query(func.count(Notification.id)).filter(
-        Notification.user_id == current_user.id,
-        Notification.read == False
-    ).scalar() or 0
-
-    unconfirmed_news = db.session.query(func.count(News.id)).filter(
-        ~News.confirmations.any(user_id=current_user.id)
-    ).scalar() or 0
 
     # Admin
     total_users = 0
@@ -323,19 +270,19 @@ def workflow_hub():
     marquee_config = MarqueeConfig.get_config()
 
     return render_template('hub.html',
-                           my_pending_tasks=my_pending_tasks,
-                           my_in_progress=my_in_progress,
-                           my_due_soon=my_due_soon,
-                           my_overdue=my_overdue,
-                           tasks_need_rating=tasks_need_rating,
-                           my_tasks_need_rating=my_tasks_need_rating,
-                           tasks_need_approval=tasks_need_approval,
+                           my_pending_tasks=stats['my_pending_tasks'],
+                           my_in_progress=stats['my_in_progress'],
+                           my_due_soon=stats['my_due_soon'],
+                           my_overdue=stats['my_overdue'],
+                           tasks_need_rating=stats['tasks_need_rating'],
+                           my_tasks_need_rating=stats['my_tasks_need_rating'],
+                           tasks_need_approval=stats['tasks_need_approval'],
                            total_salaries=total_salaries,
                            total_employees=total_employees,
-                           pending_penalties=pending_penalties,
-                           pending_advances=pending_advances,
-                           unread_notifications=unread_notifications,
-                           unconfirmed_news=unconfirmed_news,
+                           pending_penalties=stats['pending_penalties'],
+                           pending_advances=stats['pending_advances'],
+                           unread_notifications=stats['unread_notifications'],
+                           unconfirmed_news=stats['unconfirmed_news'],
                            total_users=total_users,
                            active_users=active_users,
                            initial_performance=initial_performance,
@@ -344,122 +291,15 @@ def workflow_hub():
 
 
 # ========================================
-# API: REAL-TIME STATS - TỐI ƯU với scalar counts
+# API: REAL-TIME STATS - 1 QUERY TỔNG HỢP + CACHE THEO USER (app/hub_stats.py)
 # ========================================
 @bp.route('/api/realtime-stats')
 @login_required
 def get_realtime_stats():
     try:
-        now = datetime.utcnow()
-
-        # Dùng subquery thay vì load all assignments
-        my_task_ids_subq = db.session.query(TaskAssignment.task_id).filter(
-            TaskAssignment.user_id == current_user.id,
-            TaskAssignment.accepted == True
-        ).subquery()
-
-        my_overdue = db.session.query(func.count(Task.id)).filter(
-            Task.id.in_(my_task_ids_subq),
-            Task.due_date < now,
-            Task.status.in_(['PENDING', 'IN_PROGRESS'])
-        ).scalar() or 0
-
-        three_days_later = now + timedelta(days=3)
-        my_due_soon = db.session.query(func.count(Task.id)).filter(
-            Task.id.in_(my_task_ids_subq),
-            Task.due_date >= now,
-            Task.due_date <= three_days_later,
-            Task.status.in_(['PENDING', 'IN_PROGRESS'])
-        ).scalar() or 0
-
-        my_pending_tasks = db.session.query(func.count(Task.id)).filter(
-            Task.id.in_(my_task_ids_subq),
-            Task.status == 'PENDING'
-        ).scalar() or 0
-
-        my_in_progress = db.session.query(func.count(Task.id)).filter(
-            Task.id.in_(my_task_ids_subq),
-            Task.status == 'IN_PROGRESS'
-        ).scalar() or 0
-
-        unread_notifications = db.session.query(func.count(Notification.id)).filter(
-            Notification.user_id == current_user.id,
-            Notification.read == False
-        ).scalar() or 0
-
-        unconfirmed_news = db.session.query(func.count(News.id)).filter(
-            ~News.confirmations.any(user_id=current_user.id)
-        ).scalar() or 0
-
-        # Manager/Director stats
-        team_overdue = 0
-        team_pending = 0
-        tasks_need_rating = 0
-        my_tasks_need_rating = 0
-        tasks_need_approval = 0
-
-        if current_user.role in ['director', 'manager']:
-            team_overdue = db.session.query(func.count(Task.id)).filter(
-                Task.due_date < now,
-                Task.status.in_(['PENDING', 'IN_PROGRESS'])
-            ).scalar() or 0
-
-            team_pending = db.session.query(func.count(Task.id)).filter(
-                Task.status == 'PENDING'
-            ).scalar() or 0
-
-            tasks_need_rating = db.session.query(func.count(Task.id)).filter(
-                Task.status == 'DONE',
-                Task.performance_rating == None
-            ).scalar() or 0
-
-            my_tasks_need_rating = db.session.query(func.count(Task.id)).filter(
-                Task.creator_id == current_user.id,
-                Task.status == 'DONE',
-                Task.performance_rating == None
-            ).scalar() or 0
-
-            approval_query = Task.query.filter(
-                Task.requires_approval == True,
-                Task.approved == None
-            )
-            if current_user.role == 'manager':
-                approval_query = approval_query.join(User, Task.creator_id == User.id).filter(
-                    User.role == 'hr'
-                )
-            tasks_need_approval = approval_query.count()
-
-        # Lương
-        pending_penalties = 0
-        pending_advances = 0
-        if current_user.role in ['director', 'accountant']:
-            from app.models import Penalty, Advance
-            pending_penalties = db.session.query(func.count(Penalty.id)).filter(
-                Penalty.is_deducted == False
-            ).scalar() or 0
-            pending_advances = db.session.query(func.count(Advance.id)).filter(
-                Advance.is_deducted == False
-            ).scalar() or 0
-
-        return jsonify({
-            'my_overdue': my_overdue,
-            'my_due_soon': my_due_soon,
-            'my_pending_tasks': my_pending_tasks,
-            'my_in_progress': my_in_progress,
-            'unread_notifications': unread_notifications,
-            'unconfirmed_news': unconfirmed_news,
-            'team_overdue': team_overdue,
-            'team_pending': team_pending,
-            'tasks_need_rating': tasks_need_rating,
-            'my_tasks_need_rating': my_tasks_need_rating,
-            'tasks_need_approval': tasks_need_approval,
-            'pending_penalties': pending_penalties,
-            'pending_advances': pending_advances,
-            'work_badge': my_overdue + my_due_soon,
-            'info_badge': unconfirmed_news + unread_notifications,
-            'salary_badge': pending_penalties + pending_advances,
-            'timestamp': datetime.now().isoformat()
-        })
+        stats = hub_stats.get(current_user)
+        stats['timestamp'] = datetime.now().isoformat()
+        return jsonify(stats)
 
     except Exception as e:
         print(f"❌ Error in get_realtime_stats: {str(e)}")
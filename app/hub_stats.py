@@ -0,0 +1,168 @@
+"""
+Hub Stats - số liệu badge của hub (/hub/api/realtime-stats, trang hub)
+- 1 câu SELECT / lần tính: mỗi nguồn là 1 CTE tổng hợp 1 dòng (COUNT / SUM ... FILTER),
+  các CTE ghép bằng CROSS JOIN -> 1 round-trip thay vì ~13 query scalar
+- Đếm theo status lấy từ bảng tổng hợp task_stats (app/task_stats.py),
+  quá hạn / sắp đến hạn phụ thuộc thời điểm hiện tại nên đếm trực tiếp trên tasks
+- Cache theo user (namespace 'hub_stats' của app/cache.py), TTL vài giây (HUB_STATS_CACHE_TTL):
+  trang hub polling / nhiều tab không query lại
+- Ghi qua ORM vào các bảng liên quan (task, tin tức, phạt / tạm ứng) -> xóa cache khi commit.
+  Thông báo không nằm trong danh sách: mỗi thông báo tạo / đọc sẽ xóa cache của mọi user -
+  số chưa đọc trên badge chậm tối đa 1 TTL (dropdown / SSE vẫn cập nhật ngay qua notification_service).
+  CACHE_BACKEND = memory: cache nằm trong từng worker, thay đổi từ worker khác hiển thị chậm tối đa 1 TTL
+"""
+
+from sqlalchemy import func, select, true, and_
+from datetime import datetime, timedelta
+
+from app import db, cache
+from app.models import (
+    Task, TaskAssignment, TaskStat, User, News, NewsConfirmation,
+    UserNotificationCounter, Penalty, Advance
+)
+
+DEFAULT_CACHE_TTL = 5
+DUE_SOON_DAYS = 3
+
+OPEN_STATUSES = ('PENDING', 'IN_PROGRESS')
+MANAGER_ROLES = ('director', 'manager')
+SALARY_ROLES = ('director', 'accountant')
+
+# Ghi vào các bảng này làm cache cũ đi (không gồm thông báo - xem docstring)
+WATCHED_MODELS = (Task, TaskAssignment, News, NewsConfirmation, Penalty, Advance)
+
+
+# Badge theo user: key = user_id, xóa khi commit có ghi vào WATCHED_MODELS
+stats_cache = cache.Namespace('hub_stats', ttl=DEFAULT_CACHE_TTL, invalidate_on=WATCHED_MODELS)
+
+
+# ============================================================
+# QUERY
+# ============================================================
+def _count(condition=None):
+    count = func.count()
+    return count.filter(condition) if condition is not None else count
+
+
+def _sum_stats(condition):
+    return func.coalesce(func.sum(TaskStat.task_count).filter(condition), 0)
+
+
+def build_query(user_id, role, now):
+    """1 câu SELECT trả về 1 dòng: các cột badge theo role"""
+    due_soon_until = now + timedelta(days=DUE_SOON_DAYS)
+    is_overdue = Task.due_date < now
+
+    # Task được giao (đã nhận) còn mở: quá hạn / sắp đến hạn.
+    # IN (task_id của user) thay vì EXISTS: đi từ assignments của 1 user, không dò từng task còn mở
+    my_task_ids = select(TaskAssignment.task_id).where(
+        TaskAssignment.user_id == user_id,
+        TaskAssignment.accepted == True
+    )
+    my_open = select(
+        _count(is_overdue).label('my_overdue'),
+        _count(and_(Task.due_date >= now, Task.due_date <= due_soon_until)).label('my_due_soon')
+    ).where(Task.id.in_(my_task_ids), Task.status.in_(OPEN_STATUSES)).cte('my_open')
+
+    my_stats = select(
+        _sum_stats(TaskStat.status == 'PENDING').label('my_pending_tasks'),
+        _sum_stats(TaskStat.status == 'IN_PROGRESS').label('my_in_progress')
+    ).where(TaskStat.user_id == user_id).cte('my_stats')
+
+    # Counter chưa có (user mới / sau invalidate): NULL -> get() tính lại qua notification_service
+    counter = select(
+        func.max(UserNotificationCounter.unread_count).label('unread_notifications')
+    ).where(UserNotificationCounter.user_id == user_id).cte('counter_row')
+
+    news = select(_count().label('unconfirmed_news')).select_from(News).where(
+        ~select(NewsConfirmation.id).where(
+            NewsConfirmation.news_id == News.id,
+            NewsConfirmation.user_id == user_id
+        ).exists()
+    ).cte('unconfirmed')
+
+    ctes = [my_open, my_stats, counter, news]
+
+    if role in MANAGER_ROLES:
+        # Mỗi CTE 1 điều kiện đơn giản để dùng được index (OR giữa 2 nhóm -> quét toàn bảng)
+        team_overdue = select(_count().label('team_overdue')).select_from(Task).where(
+            Task.status.in_(OPEN_STATUSES),
+            is_overdue
+        ).cte('team_overdue')
+
+        my_need_rating = select(_count().label('my_tasks_need_rating')).select_from(Task).where(
+            Task.creator_id == user_id,
+            Task.status == 'DONE',
+            Task.performance_rating.is_(None)
+        ).cte('my_need_rating')
+
+        team_stats = select(
+            _sum_stats(TaskStat.status == 'PENDING').label('team_pending'),
+            _sum_stats(and_(TaskStat.status == 'DONE', TaskStat.rated == False)).label('tasks_need_rating')
+        ).where(TaskStat.user_id == TaskStat.ALL_USERS).cte('team_stats')
+
+        approval = select(_count().label('tasks_need_approval')).select_from(Task).where(
+            Task.requires_approval == True,
+            Task.approved.is_(None)
+        )
+        if role == 'manager':
+            approval = approval.join(User, Task.creator_id == User.id).where(User.role == 'hr')
+
+        ctes += [team_overdue, my_need_rating, team_stats, approval.cte('approvals')]
+
+    if role in SALARY_ROLES:
+        penalties = select(_count().label('pending_penalties')).select_from(Penalty).where(
+            Penalty.is_deducted == False
+        ).cte('penalty_count')
+        advances = select(_count().label('pending_advances')).select_from(Advance).where(
+            Advance.is_deducted == False
+        ).cte('advance_count')
+        ctes += [penalties, advances]
+
+    # Mỗi CTE đúng 1 dòng (aggregate không GROUP BY) -> CROSS JOIN
+    from_clause = ctes[0]
+    for cte in ctes[1:]:
+        from_clause = from_clause.join(cte, true())
+
+    return select(*[column for cte in ctes for column in cte.c]).select_from(from_clause)
+
+
+def compute(user_id, role, now=None):
+    """Tính badge (không qua cache)"""
+    now = now or datetime.utcnow()
+    row = db.session.execute(build_query(user_id, role, now)).mappings().one()
+
+    stats = {
+        'my_overdue': 0,
+        'my_due_soon': 0,
+        'my_pending_tasks': 0,
+        'my_in_progress': 0,
+        'unread_notifications': 0,
+        'unconfirmed_news': 0,
+        'team_overdue': 0,
+        'team_pending': 0,
+        'tasks_need_rating': 0,
+        'my_tasks_need_rating': 0,
+        'tasks_need_approval': 0,
+        'pending_penalties': 0,
+        'pending_advances': 0,
+    }
+    stats.update({key: int(value or 0) for key, value in row.items()})
+
+    if row['unread_notifications'] is None:
+        from app import notification_service
+        stats['unread_notifications'] = notification_service.get_unread_count(user_id)
+
+    stats['work_badge'] = stats['my_overdue'] + stats['my_due_soon']
+    stats['info_badge'] = stats['unconfirmed_news'] + stats['unread_notifications']
+    stats['salary_badge'] = stats['pending_penalties'] + stats['pending_advances']
+    return stats
+
+
+def get(user):
+    """Badge của user - qua cache TTL. Trả về bản sao, caller sửa thoải mái."""
+    return dict(stats_cache.get_or_set(user.id, lambda: compute(user.id, user.role)))
+
+
+def init_app(app):
+    stats_cache.ttl = app.config.get('HUB_STATS_CACHE_TTL', DEFAULT_CACHE_TTL)
@@ -1,8 +1,10 @@
 from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import validates
 from datetime import datetime
 import json
+import re
 import secrets
 
 # Role priorities
@@ -26,6 +28,10 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
 
+    # Chế độ tổng hợp (director / manager): hoàn thành & nhắc đánh giá gom thành thông báo định kỳ
+    notification_digest = db.Column(db.Boolean, default=False)
+    last_digest_at = db.Column(db.DateTime, nullable=True)
+
     # Relationships - SỬA: Xóa backref, thay bằng back_populates
     created_tasks = db.relationship(
         'Task',
@@ -96,6 +102,12 @@ class User(UserMixin, db.Model):
     def can_assign_tasks(self):
         return self.role in ['director', 'manager']
 
+    def can_use_digest(self):
+        return self.role in ['director', 'manager']
+
+    def wants_digest(self):
+        return bool(self.notification_digest) and self.can_use_digest()
+
     def __repr__(self):
         return f'<User {self.email}>'
 
@@ -208,6 +220,9 @@ class Task(db.Model):
         db.Index('idx_task_created_at', 'created_at'),
         db.Index('idx_task_updated_at', 'updated_at'),
         db.Index('idx_task_completed_overdue', 'completed_overdue'),
+        # Hub: task của người tạo theo status (cần đánh giá, quyền xem creator_id = user)
+        db.Index('idx_task_creator_status', 'creator_id', 'status'),
+        db.Index('idx_task_status_due_date', 'status', 'due_date'),
     )
 
     def is_assigned_to(self, user_id):
@@ -289,7 +304,8 @@ class TaskAssignment(db.Model):
     )
 
     __table_args__ = (
-        db.Index('idx_assignment_user_accepted', 'user_id', 'accepted'),
+        # Có task_id: EXISTS / semi-join của app/task_queries.py chỉ đọc index (không quét assignment của user)
+        db.Index('idx_assignment_user_accepted_task', 'user_id', 'accepted', 'task_id'),
         db.Index('idx_assignment_task_user', 'task_id', 'user_id'),
     )
 
@@ -297,6 +313,40 @@ class TaskAssignment(db.Model):
         return f'<TaskAssignment task={self.task_id} user={self.user_id}>'
 
 
+class TaskStat(db.Model):
+    """
+    Bảng tổng hợp số task theo (người được giao, trạng thái, tag, đã đánh giá, ngày tạo giờ VN).
+    user_id = ALL_USERS: toàn công ty (mỗi task 1 lần). Duy trì bởi app/task_stats.py -
+    dashboard / hub đọc vài chục dòng này thay vì quét bảng tasks.
+    """
+    __tablename__ = 'task_stats'
+
+    ALL_USERS = 0
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)  # không FK: 0 = toàn công ty
+    status = db.Column(db.String(20), nullable=False)
+    is_urgent = db.Column(db.Boolean, nullable=False, default=False)
+    is_important = db.Column(db.Boolean, nullable=False, default=False)
+    is_recurring = db.Column(db.Boolean, nullable=False, default=False)
+    rated = db.Column(db.Boolean, nullable=False, default=False)
+    day = db.Column(db.Date, nullable=False)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # 1 dòng / nhóm - đích ON CONFLICT của task_stats.apply_deltas, prefix (user_id, day) cho dashboard / hub
+        db.Index(
+            'uq_task_stats_bucket',
+            'user_id', 'day', 'status', 'is_urgent', 'is_important', 'is_recurring', 'rated',
+            unique=True
+        ),
+        db.Index('idx_task_stats_day', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<TaskStat user={self.user_id} {self.status} {self.day} count={self.task_count}>'
+
+
 class File(db.Model):
     __tablename__ = 'files'
 
@@ -332,6 +382,13 @@ class Notification(db.Model):
     link = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Đối tượng thông báo trỏ tới (task / news) - tự điền từ link, dùng khi xóa task / tin tức
+    target_type = db.Column(db.String(20))
+    target_id = db.Column(db.Integer)
+
+    # Thông báo gộp (COALESCED_TYPE): số tin nhắn dồn vào 1 dòng chưa đọc / người nhận / task
+    item_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
     # SỬA: Thêm back_populates
     user = db.relationship(
         'User',
@@ -339,10 +396,146 @@ class Notification(db.Model):
         back_populates='notifications'
     )
 
+    # '/tasks/12', '/tasks/12/discussion', '/news/5'
+    TARGET_LINK_PATTERN = re.compile(r'^/(tasks|news)/(\d+)(?:/|$)')
+    TARGET_TYPES = {'tasks': 'task', 'news': 'news'}
+    COALESCED_TYPE = 'task_comment'
+    # Tiêu đề thông báo gộp: {subject} = tiêu đề task (dữ liệu người dùng), {count} = item_count.
+    # Tách theo '{count}' trên template (không phải tiêu đề đã điền) -> tiêu đề task chứa '{count}' không làm lệch
+    COALESCED_TITLE = '💬 Tin nhắn mới trong nhiệm vụ {subject}'
+    COALESCED_COUNTED_TITLE = '💬 {count} tin nhắn mới trong nhiệm vụ {subject}'
+
+    @classmethod
+    def parse_target(cls, link):
+        """(target_type, target_id) từ link, (None, None) nếu link không trỏ tới task / tin tức"""
+        match = cls.TARGET_LINK_PATTERN.match(link or '')
+        if not match:
+            return None, None
+        return cls.TARGET_TYPES[match.group(1)], int(match.group(2))
+
+    @validates('link')
+    def _sync_target(self, key, link):
+        self.target_type, self.target_id = self.parse_target(link)
+        return link
+
+    # Mọi query đều lọc user_id + read và sắp theo created_at (hub, SSE, unread-count)
+    __table_args__ = (
+        db.Index('idx_notification_user_read_created', 'user_id', 'read', 'created_at'),
+        # Trang /notifications: keyset (created_at, id) trên toàn bộ thông báo của user
+        db.Index('idx_notification_user_created_id', 'user_id', 'created_at', 'id'),
+        # Xóa task / tin tức: DELETE ... WHERE target_type = ? AND target_id IN (...)
+        db.Index('idx_notification_target', 'target_type', 'target_id'),
+        # Tối đa 1 thông báo task_comment CHƯA ĐỌC / người nhận / task - đích ON CONFLICT của notify_coalesced
+        db.Index(
+            'uq_notification_unread_thread',
+            'user_id', 'target_type', 'target_id',
+            unique=True,
+            postgresql_where=db.text("type = 'task_comment' AND read = false"),
+            sqlite_where=db.text("type = 'task_comment' AND read = 0")
+        ),
+        # Partial index chỉ chứa thông báo chưa đọc - nhỏ, luôn nằm trong cache
+        db.Index(
+            'idx_notification_user_unread',
+            'user_id', 'created_at',
+            postgresql_where=db.text('read = false'),
+            sqlite_where=db.text('read = 0')
+        ),
+    )
+
     def __repr__(self):
         return f'<Notification {self.title}>'
 
 
+class UserNotificationCounter(db.Model):
+    """
+    Bộ đếm thông báo theo user - badge chỉ cần đọc 1 dòng theo khóa chính.
+    Được cập nhật trong cùng transaction với thay đổi Notification (app/notification_service.py).
+    """
+    __tablename__ = 'user_notification_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserNotificationCounter user={self.user_id} unread={self.unread_count}>'
+
+
+class PushSubscription(db.Model):
+    """Web Push subscription của 1 trình duyệt / thiết bị (gửi qua app/webpush.py)"""
+    __tablename__ = 'push_subscriptions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    endpoint = db.Column(db.String(500), nullable=False, unique=True)
+    p256dh = db.Column(db.String(200), nullable=False)
+    auth = db.Column(db.String(100), nullable=False)
+    user_agent = db.Column(db.String(300))
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_success_at = db.Column(db.DateTime)
+
+    def info(self):
+        """subscription_info theo định dạng PushSubscription.toJSON() của trình duyệt"""
+        return {'endpoint': self.endpoint, 'keys': {'p256dh': self.p256dh, 'auth': self.auth}}
+
+    def __repr__(self):
+        return f'<PushSubscription {self.id} user={self.user_id}>'
+
+
+class NotificationArchive(db.Model):
+    """
+    Thông báo đã đọc, cũ hơn NOTIFICATION_ARCHIVE_AFTER_DAYS - chuyển khỏi bảng notifications
+    bởi job archive_notifications. Giữ nguyên id gốc, không có cột read (luôn đã đọc).
+    """
+    __tablename__ = 'notification_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text)
+    link = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_notification_archive_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('idx_notification_archive_archived_at', 'archived_at'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationArchive {self.id} user={self.user_id}>'
+
+
+class NotificationOutbox(db.Model):
+    """
+    Lệnh gửi thông báo chờ xử lý (transactional outbox) - request chỉ ghi 1 dòng trong transaction
+    của nó, worker nền (app/notification_outbox.py) mở rộng thành thông báo cho từng người nhận.
+    Dòng xử lý xong bị xóa; dòng lỗi giữ lại với attempts / last_error, thử lại sau available_at.
+    """
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON tham số của notification_service
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('idx_notification_outbox_available', 'available_at', 'id'),
+    )
+
+    def get_payload(self):
+        return json.loads(self.payload)
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} {self.kind} attempts={self.attempts}>'
+
+
 class Note(db.Model):
     __tablename__ = 'notes'
 
@@ -1018,6 +1211,54 @@ class TaskCommentRead(db.Model):
         return f'<TaskCommentRead user={self.user_id} comment={self.comment_id}>'
 
 
+class CommentTombstone(db.Model):
+    """
+    Nhật ký comment đã xóa (task / news).
+    Stream đồng bộ xóa bằng `id > tombstone cuối đã thấy` thay vì so toàn bộ danh sách comment.
+    """
+    __tablename__ = 'comment_tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)  # task, news
+    target_id = db.Column(db.Integer, nullable=False)
+    comment_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_tombstone_target', 'target_type', 'target_id', 'id'),
+        db.Index('idx_tombstone_deleted_at', 'deleted_at'),
+    )
+
+    @classmethod
+    def record(cls, target_type, target_id, comment_id):
+        """Ghi tombstone trong cùng transaction với lệnh xóa comment"""
+        tombstone = cls(target_type=target_type, target_id=target_id, comment_id=comment_id)
+        db.session.add(tombstone)
+        return tombstone
+
+    @classmethod
+    def latest_id(cls, target_type, target_id):
+        return db.session.query(db.func.max(cls.id)).filter(
+            cls.target_type == target_type,
+            cls.target_id == target_id
+        ).scalar() or 0
+
+    @classmethod
+    def after(cls, target_type, target_id, last_id=0, since=None):
+        """Danh sách (tombstone_id, comment_id) mới hơn `last_id` (hoặc xóa sau thời điểm `since`)"""
+        query = db.session.query(cls.id, cls.comment_id).filter(
+            cls.target_type == target_type,
+            cls.target_id == target_id,
+            cls.id > last_id
+        )
+        if since is not None:
+            query = query.filter(cls.deleted_at > since)
+        return query.order_by(cls.id.asc()).all()
+
+    def __repr__(self):
+        return f'<CommentTombstone {self.target_type}={self.target_id} comment={self.comment_id}>'
+
+
 class SeasonalEffectConfig(db.Model):
     """Cấu hình hiệu ứng theo mùa - áp dụng cho toàn hệ thống"""
     __tablename__ = 'seasonal_effect_config'
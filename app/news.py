@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from app import db
-from app.models import News, NewsComment, NewsConfirmation, User, Notification
+from app import db, notification_service
+from app.models import News, NewsComment, NewsConfirmation, User, Notification, CommentTombstone
 from app.decorators import role_required
 from datetime import datetime
 import os
@@ -173,17 +173,15 @@ def create_news():
         db.session.add(news)
         db.session.commit()
 
-        # Gửi thông báo cho tất cả users
-        all_users = User.query.filter(User.id != current_user.id, User.is_active == True).all()
-        for user in all_users:
-            notif = Notification(
-                user_id=user.id,
-                type='news_posted',
-                title='Tin tức mới',
-                body=f'{current_user.full_name} đã đăng tin tức: {title}',
-                link=f'/news/{news.id}'
-            )
-            db.session.add(notif)
+        # Gửi thông báo cho tất cả users (query người nhận + INSERT chạy ở worker outbox)
+        notification_service.notify_audience(
+            'active_users',
+            exclude=[current_user.id],
+            type='news_posted',
+            title='Tin tức mới',
+            body=f'{current_user.full_name} đã đăng tin tức: {title}',
+            link=f'/news/{news.id}'
+        )
 
         db.session.commit()
 
@@ -294,7 +292,7 @@ def delete_news(news_id):
             print(f"[CẢNH BÁO] Không tìm thấy ảnh: {image_path}")
 
     # Xóa thông báo liên quan
-    Notification.query.filter(Notification.link == f'/news/{news_id}').delete()
+    notification_service.delete_for_targets('news', [news_id])
 
     db.session.delete(news)
     db.session.commit()
@@ -393,6 +391,7 @@ def delete_comment(comment_id):
         return redirect(url_for('news.news_detail', news_id=news_id))
 
     db.session.delete(comment)
+    CommentTombstone.record('news', news_id, comment_id)
     db.session.commit()
 
     print(f"[DEBUG] Comment deleted: id={comment_id}")
@@ -0,0 +1,215 @@
+"""
+Notification Outbox - tách việc tạo thông báo khỏi request
+- Request ghi 1 dòng notification_outbox trong chính transaction của nó (commit cùng task / tin tức,
+  rollback thì lệnh gửi cũng mất) - thời gian request không còn tăng theo số người nhận
+- Sau commit: đánh thức thread nền của worker hiện tại -> mở rộng dòng outbox thành
+  thông báo + counter + sự kiện realtime + Web Push (notification_service.deliver)
+- Mỗi dòng 1 transaction: claim = DELETE dòng outbox trước khi gửi, tạo thông báo rồi commit cùng lúc.
+  DELETE xóa được 0 dòng / bị khóa -> consumer khác (thread của worker khác, scheduler) đã lấy: bỏ qua.
+  PostgreSQL: chọn dòng bằng FOR UPDATE SKIP LOCKED -> các consumer không chờ nhau
+- Lỗi: tăng attempts, thử lại sau OUTBOX_RETRY_DELAY * attempts; quá OUTBOX_MAX_ATTEMPTS thì giữ lại để kiểm tra
+- Scheduler quét lại định kỳ (process_pending) phòng khi worker chết trước khi xử lý
+- Tắt mặc định (NOTIFICATION_OUTBOX=false): notification_service tạo thông báo ngay trong request như trước.
+  Bật: cần thread nền của web worker hoặc job process_notification_outbox của scheduler - không có
+  process nào xử lý thì thông báo nằm trong bảng; job cảnh báo khi tồn đọng quá OUTBOX_BACKLOG_WARNING dòng
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, delete
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import json
+import threading
+
+OUTBOX_POLL_INTERVAL = 5      # giây - thread nền tự quét lại dù không được đánh thức
+OUTBOX_RETRY_DELAY = 30       # giây, nhân theo số lần lỗi
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BATCH_LIMIT = 500      # số dòng tối đa mỗi lượt quét
+OUTBOX_BACKLOG_WARNING = 1000  # số dòng tồn đọng để scheduler ghi cảnh báo
+
+_PENDING_KEY = 'notification_outbox_pending'
+_events_registered = False
+
+
+# ============================================================
+# WORKER
+# ============================================================
+class OutboxWorker:
+    """Thread nền của 1 worker - khởi động ở lần enqueue đầu tiên"""
+
+    def __init__(self, app):
+        self.app = app
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+
+    def wake(self):
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=OUTBOX_POLL_INTERVAL)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    processed, failed = process_pending()
+                self.processed += processed
+                self.failed += failed
+            except Exception as e:
+                self.app.logger.error(f"Notification outbox error: {e}")
+
+    def stats(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'processed': self.processed,
+            'failed': self.failed
+        }
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+def init_app(app):
+    enabled = app.config.get('NOTIFICATION_OUTBOX', False)
+    app.extensions['notification_outbox'] = OutboxWorker(app) if enabled else None
+    _register_events()
+
+
+def get_worker():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('notification_outbox')
+
+
+def is_enabled():
+    return get_worker() is not None
+
+
+def enqueue(session, kind, **payload):
+    """Ghi 1 lệnh gửi thông báo vào transaction hiện tại của session (caller commit)"""
+    from app.models import NotificationOutbox
+
+    session.add(NotificationOutbox(kind=kind, payload=json.dumps(payload, ensure_ascii=False)))
+    session.info[_PENDING_KEY] = True
+
+
+def process_pending(limit=OUTBOX_BATCH_LIMIT):
+    """Xử lý các dòng outbox đến hạn (cần app context). Trả về (số dòng xong, số dòng lỗi)."""
+    from app import db
+    from app.models import NotificationOutbox
+
+    processed = failed = 0
+    for _ in range(limit):
+        row = db.session.execute(
+            select(NotificationOutbox)
+            .where(
+                NotificationOutbox.available_at <= datetime.utcnow(),
+                NotificationOutbox.attempts < OUTBOX_MAX_ATTEMPTS
+            )
+            .order_by(NotificationOutbox.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar()
+        if row is None:
+            break
+
+        row_id = row.id
+        try:
+            claimed = _claim(row_id)
+        except OperationalError:
+            # SQLite: consumer khác đang giữ khóa ghi -> để nó xử lý, lượt quét sau thử lại
+            db.session.rollback()
+            break
+        if not claimed:
+            # Consumer khác đã xử lý xong dòng này
+            db.session.rollback()
+            continue
+
+        try:
+            _deliver(row)
+            db.session.commit()
+            processed += 1
+        except Exception as e:
+            db.session.rollback()
+            _record_failure(row_id, e)
+            failed += 1
+
+    return processed, failed
+
+
+def pending_count():
+    from app import db
+    from app.models import NotificationOutbox
+
+    return db.session.query(NotificationOutbox.id).count()
+
+
+def _claim(row_id):
+    """
+    Xóa dòng outbox trong transaction hiện tại - chỉ 1 consumer xóa được (rowcount == 1).
+    Gửi lỗi -> rollback trả dòng lại cho lần thử sau.
+    """
+    from app import db
+    from app.models import NotificationOutbox
+
+    outbox = NotificationOutbox.__table__
+    result = db.session.execute(delete(outbox).where(outbox.c.id == row_id))
+    return result.rowcount == 1
+
+
+def _deliver(row):
+    from app import notification_service
+
+    notification_service.deliver(row.kind, row.get_payload())
+
+
+def _record_failure(row_id, error):
+    from app import db
+    from app.models import NotificationOutbox
+
+    current_app.logger.error(f"Notification outbox #{row_id} failed: {error}")
+    row = db.session.get(NotificationOutbox, row_id)
+    if row is None:
+        return
+    row.attempts += 1
+    row.last_error = str(error)[:1000]
+    row.available_at = datetime.utcnow() + timedelta(seconds=OUTBOX_RETRY_DELAY * row.attempts)
+    db.session.commit()
+
+
+# ============================================================
+# SESSION HOOKS
+# ============================================================
+def _after_commit(session):
+    if not session.info.pop(_PENDING_KEY, None):
+        return
+    worker = get_worker()
+    if worker is not None:
+        worker.wake()
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _register_events():
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous: _after_rollback(session))
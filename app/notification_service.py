@@ -0,0 +1,647 @@
+"""
+Notification Service
+- notify_many: gửi cùng 1 thông báo cho nhiều user bằng 1 câu INSERT nhiều dòng + 1 sự kiện realtime
+- notify_coalesced: thông báo gộp (tin nhắn task) bằng 1 câu INSERT ... ON CONFLICT DO UPDATE
+- notify_audience: gửi cho 1 nhóm user (AUDIENCES) - query người nhận cũng chạy ngoài request
+- NOTIFICATION_OUTBOX bật: không tạo thông báo trong request - ghi 1 dòng outbox, worker nền gọi deliver
+  (app/notification_outbox.py); tắt (mặc định): tạo ngay trong transaction của request
+- Bộ đếm thông báo theo user (bảng user_notification_counters):
+- Thêm / đọc / xóa từng Notification qua ORM: counter cập nhật trong cùng transaction (mapper events)
+- Update / delete hàng loạt (query.update / query.delete) không qua mapper events:
+  gọi mark_all_read / after_bulk_delete / recount_counters ngay trong transaction đó
+- Chưa có counter (user mới): tạo trong upsert của lần ghi đầu tiên (đếm từ notifications, không mất delta nào)
+  hoặc bởi flask upgrade-notifications. Lần đọc khi chưa có counter chỉ COUNT(*), không ghi -
+  GET / SSE không commit nên dòng ghi ở đó sẽ bị rollback và lần đọc sau lại đếm
+- list_page: phân trang keyset (created_at, id); archive_read / purge_archive: lưu trữ & retention
+- delete_for_targets: xóa thông báo của task / tin tức bị xóa theo index (target_type, target_id)
+- Mọi thông báo mới đều được đưa vào hàng đợi Web Push sau khi commit (app/webpush.py)
+- send_digests: thông báo tổng hợp định kỳ cho user bật chế độ digest (scheduler)
+- get_state / sync_rows: polling fallback /notifications/sync (ETag theo counter.updated_at)
+"""
+
+from sqlalchemy import (
+    event, func, case, select, insert, inspect, literal, literal_column, false, cast, String, or_, and_
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+from datetime import datetime, timedelta
+from app import db, realtime, webpush, notification_outbox
+from app.models import (
+    Notification, UserNotificationCounter, NotificationArchive, User, Task, TaskCompletionReport
+)
+
+# Payload pg_notify giới hạn ~8000 bytes: danh sách user lớn hơn thì gửi sự kiện không kèm users
+BULK_EVENT_MAX_USERS = 200
+
+# Mỗi lô archive 1 transaction ngắn - không khóa bảng notifications lâu
+ARCHIVE_BATCH_SIZE = 1000
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+SYNC_ITEMS_LIMIT = 10
+
+# Nhóm người nhận của notify_audience (điều kiện trên User, tính lúc gửi)
+AUDIENCES = {
+    'active_users': lambda: User.is_active == True,
+    # Director / manager nhận từng thông báo (người bật digest nhận bản tổng hợp)
+    'managers': lambda: and_(
+        User.role.in_(['director', 'manager']),
+        User.is_active == True,
+        User.notification_digest.isnot(True)
+    ),
+}
+
+_events_registered = False
+
+
+# ============================================================
+# GỬI THÔNG BÁO HÀNG LOẠT
+# ============================================================
+def notify_many(user_ids, type, title, body=None, link=None):
+    """
+    Gửi cùng 1 thông báo cho nhiều user, gắn với transaction hiện tại (caller commit).
+    Outbox bật: chỉ ghi 1 dòng notification_outbox, worker nền tạo thông báo sau commit.
+    Trả về số người nhận.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0
+
+    if notification_outbox.is_enabled():
+        notification_outbox.enqueue(
+            db.session, 'many', user_ids=user_ids, type=type, title=title, body=body, link=link
+        )
+        return len(user_ids)
+    return _insert_many(user_ids, type, title, body, link)
+
+
+def notify_audience(audience, type, title, body=None, link=None, exclude=()):
+    """
+    Như notify_many nhưng người nhận là 1 nhóm trong AUDIENCES - với outbox,
+    cả câu query danh sách người nhận cũng chạy ở worker nền thay vì trong request.
+    """
+    if notification_outbox.is_enabled():
+        notification_outbox.enqueue(
+            db.session, 'audience', audience=audience, exclude=list(exclude),
+            type=type, title=title, body=body, link=link
+        )
+        return
+    _insert_many(audience_user_ids(audience, exclude), type, title, body, link)
+
+
+def notify_coalesced(user_ids, subject, body, link):
+    """
+    Thông báo gộp: mỗi người nhận chỉ có 1 dòng COALESCED_TYPE chưa đọc cho mỗi task.
+    Chưa có -> tạo với Notification.COALESCED_TITLE; đã có -> tăng item_count, tiêu đề theo
+    Notification.COALESCED_COUNTED_TITLE. `subject` = tiêu đề task.
+    Outbox bật: upsert chạy ở worker nền sau commit.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return
+
+    if notification_outbox.is_enabled():
+        notification_outbox.enqueue(
+            db.session, 'coalesced', user_ids=user_ids, subject=subject, body=body, link=link
+        )
+        return
+    _upsert_coalesced(user_ids, subject, body, link)
+
+
+def audience_user_ids(audience, exclude=()):
+    criteria = AUDIENCES[audience]()
+    query = db.session.query(User.id).filter(criteria)
+    if exclude:
+        query = query.filter(User.id.notin_(exclude))
+    return [user_id for user_id, in query]
+
+
+def deliver(kind, payload):
+    """Thực hiện 1 lệnh gửi từ notification_outbox trong transaction hiện tại (worker commit)"""
+    if kind == 'many':
+        _insert_many(payload['user_ids'], payload['type'], payload['title'], payload['body'], payload['link'])
+    elif kind == 'audience':
+        user_ids = audience_user_ids(payload['audience'], payload['exclude'])
+        _insert_many(user_ids, payload['type'], payload['title'], payload['body'], payload['link'])
+    elif kind == 'coalesced':
+        _upsert_coalesced(payload['user_ids'], payload['subject'], payload['body'], payload['link'])
+    else:
+        raise ValueError(f'Unknown outbox kind: {kind}')
+
+
+def _insert_many(user_ids, type, title, body, link):
+    """1 câu INSERT nhiều dòng + 1 câu UPDATE counter + 1 sự kiện realtime, thay vì N object ORM"""
+    if not user_ids:
+        return 0
+
+    now = datetime.utcnow()
+    # Bulk insert không qua @validates -> tự điền target
+    target_type, target_id = Notification.parse_target(link)
+    db.session.execute(insert(Notification), [
+        {
+            'user_id': user_id,
+            'type': type,
+            'title': title,
+            'body': body,
+            'link': link,
+            'target_type': target_type,
+            'target_id': target_id,
+            'read': False,
+            'created_at': now
+        }
+        for user_id in user_ids
+    ])
+
+    # Bulk insert không qua mapper events -> tự cập nhật counter
+    _count_new(user_ids)
+    _publish_bulk(user_ids)
+    webpush.queue_push(db.session, user_ids, webpush.payload_for(title, body, link))
+
+    return len(user_ids)
+
+
+def _counted_title_parts(subject):
+    """(prefix, suffix) quanh {count} của COALESCED_COUNTED_TITLE, mỗi phần đã điền subject"""
+    prefix, _, suffix = Notification.COALESCED_COUNTED_TITLE.partition('{count}')
+    return prefix.format(subject=subject), suffix.format(subject=subject)
+
+
+def _upsert_coalesced(user_ids, subject, body, link):
+    """1 câu INSERT ... ON CONFLICT DO UPDATE cho mọi người nhận"""
+    notifications = Notification.__table__
+    now = datetime.utcnow()
+    title = Notification.COALESCED_TITLE.format(subject=subject)
+    target_type, target_id = Notification.parse_target(link)
+
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = dialect_insert(notifications).values([
+        {
+            'user_id': user_id,
+            'type': Notification.COALESCED_TYPE,
+            'title': title,
+            'body': body,
+            'link': link,
+            'target_type': target_type,
+            'target_id': target_id,
+            'item_count': 1,
+            'read': False,
+            'created_at': now
+        }
+        for user_id in user_ids
+    ])
+
+    count = notifications.c.item_count + 1
+    prefix, suffix = _counted_title_parts(subject)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'target_type', 'target_id'],
+        # Điều kiện phải trùng partial index (literal, không bind param) để DB suy ra được index
+        index_where=and_(
+            notifications.c.type == literal_column(f"'{Notification.COALESCED_TYPE}'"),
+            notifications.c.read == false()
+        ),
+        set_={
+            'item_count': count,
+            'title': literal(prefix) + cast(count, String) + literal(suffix),
+            'body': statement.excluded.body
+        }
+    ).returning(notifications.c.user_id, notifications.c.item_count, notifications.c.title)
+    rows = db.session.execute(statement).all()
+
+    # item_count == 1 -> dòng mới (cập nhật luôn >= 2), chỉ dòng mới làm tăng counter
+    created = [row.user_id for row in rows if row.item_count == 1]
+    _count_new(created)
+    # Dòng được gộp không đổi số đếm nhưng đổi nội dung -> đổi updated_at để ETag của /sync đổi theo
+    updated = [row.user_id for row in rows if row.item_count > 1]
+    if updated:
+        counter = UserNotificationCounter.__table__
+        db.session.execute(counter.update().where(counter.c.user_id.in_(updated)).values(updated_at=now))
+    _publish_bulk(user_ids)
+
+    # Cùng tag (link) -> thiết bị thay thông báo cũ bằng tiêu đề có số tin nhắn mới nhất
+    by_title = {}
+    for row in rows:
+        by_title.setdefault(row.title, []).append(row.user_id)
+    for row_title, recipients in by_title.items():
+        webpush.queue_push(db.session, recipients, webpush.payload_for(row_title, body, link))
+
+    return len(created)
+
+
+def _count_new(user_ids):
+    _upsert_counters(db.session.connection(), user_ids, unread_delta=1, total_delta=1)
+
+
+def _publish_bulk(user_ids):
+    payload = {'type': 'notification'}
+    if len(user_ids) <= BULK_EVENT_MAX_USERS:
+        payload['users'] = user_ids
+    realtime.publish(db.session, realtime.NOTIFICATIONS_BROADCAST, payload)
+
+
+# ============================================================
+# DIGEST - thay cho thông báo hoàn thành / nhắc đánh giá từng task
+# ============================================================
+def digest_user_ids():
+    """Id các user đang bật chế độ tổng hợp"""
+    return {
+        user_id for user_id, in db.session.query(User.id).filter(
+            User.notification_digest == True,
+            User.is_active == True,
+            User.role.in_(['director', 'manager'])
+        )
+    }
+
+
+def build_digest(user, since, until):
+    """(title, body) tổng hợp nhiệm vụ hoàn thành trong (since, until], None nếu không có gì mới"""
+    completed, overdue = db.session.query(
+        func.count(TaskCompletionReport.id),
+        func.coalesce(func.sum(case((TaskCompletionReport.was_overdue == True, 1), else_=0)), 0)
+    ).filter(
+        TaskCompletionReport.completed_at > since,
+        TaskCompletionReport.completed_at <= until,
+        TaskCompletionReport.completed_by != user.id
+    ).one()
+
+    if not completed:
+        return None
+
+    needs_rating = db.session.query(func.count(Task.id)).filter(
+        Task.creator_id == user.id,
+        Task.status == 'DONE',
+        Task.performance_rating.is_(None)
+    ).scalar()
+
+    lines = [f'- {completed} nhiệm vụ hoàn thành ({completed - overdue} đúng hạn, {overdue} quá hạn)']
+    if needs_rating:
+        lines.append(f'- {needs_rating} nhiệm vụ bạn giao đang chờ đánh giá')
+    return f'📋 Tổng hợp: {completed} nhiệm vụ hoàn thành', '\n'.join(lines)
+
+
+def send_digests(interval_minutes):
+    """1 thông báo tổng hợp cho mỗi user digest có hoạt động mới. Trả về số thông báo đã tạo."""
+    now = datetime.utcnow()
+    users = User.query.filter(User.id.in_(digest_user_ids())).all()
+
+    sent = 0
+    for user in users:
+        since = user.last_digest_at or now - timedelta(minutes=interval_minutes)
+        digest = build_digest(user, since, now)
+        user.last_digest_at = now
+        if digest is None:
+            continue
+
+        title, body = digest
+        db.session.add(Notification(
+            user_id=user.id,
+            type='notification_digest',
+            title=title,
+            body=body,
+            link='/tasks/status/DONE'
+        ))
+        sent += 1
+
+    db.session.commit()
+    return sent
+
+
+# ============================================================
+# ĐỌC
+# ============================================================
+def get_state(user_id):
+    """(unread, total, updated_at) của user - 1 lần đọc theo khóa chính"""
+    row = db.session.execute(
+        select(
+            UserNotificationCounter.unread_count,
+            UserNotificationCounter.total_count,
+            UserNotificationCounter.updated_at
+        ).where(UserNotificationCounter.user_id == user_id)
+    ).first()
+
+    if row is None:
+        return _count(user_id)
+    return row.unread_count, row.total_count, row.updated_at
+
+
+def get_counts(user_id):
+    """(unread, total) của user"""
+    return get_state(user_id)[:2]
+
+
+def get_unread_count(user_id):
+    return get_state(user_id)[0]
+
+
+def sync_rows(user_id, since):
+    """
+    1 query chỉ lấy cột cần thiết qua partial index thông báo chưa đọc:
+    id của mọi thông báo chưa đọc, nội dung chỉ với thông báo có id > since (còn lại NULL).
+    """
+    is_new = Notification.id > since
+    return db.session.execute(
+        select(
+            Notification.id,
+            case((is_new, Notification.type)).label('type'),
+            case((is_new, Notification.title)).label('title'),
+            case((is_new, Notification.body)).label('body'),
+            case((is_new, Notification.link)).label('link'),
+            case((is_new, Notification.created_at)).label('created_at')
+        )
+        .where(Notification.user_id == user_id, Notification.read == False)
+        .order_by(Notification.id.desc())
+    ).all()
+
+
+def _upsert_counters(connection, user_ids, unread_delta=0, total_delta=0, recount=False):
+    """
+    Cộng delta vào counter của các user trong transaction của `connection`.
+    Chưa có counter -> INSERT ... SELECT đếm từ notifications trong CÙNG transaction
+    (đã thấy thay đổi vừa flush nên không cộng delta nữa); đã có -> ON CONFLICT cộng delta.
+    recount=True: đã có cũng ghi đè bằng số vừa đếm. user_ids=None: mọi user.
+    """
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+    counter = UserNotificationCounter.__table__
+    now = datetime.utcnow()
+    dialect_insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+
+    counts = select(
+        User.id,
+        func.coalesce(func.sum(case((Notification.read == False, 1), else_=0)), 0),
+        func.count(Notification.id),
+        literal(now)
+    ).select_from(User).outerjoin(
+        Notification, Notification.user_id == User.id
+    ).group_by(User.id)
+    if user_ids is not None:
+        counts = counts.where(User.id.in_(user_ids))
+
+    statement = dialect_insert(counter).from_select(
+        ['user_id', 'unread_count', 'total_count', 'updated_at'], counts
+    )
+    if recount:
+        values = {'unread_count': statement.excluded.unread_count, 'total_count': statement.excluded.total_count}
+    else:
+        values = {
+            'unread_count': counter.c.unread_count + unread_delta,
+            'total_count': counter.c.total_count + total_delta
+        }
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_=dict(values, updated_at=now)
+    ))
+
+
+def _count(user_id):
+    """(unread, total, None) đếm trực tiếp từ notifications - chỉ đọc, dùng khi user chưa có counter"""
+    row = db.session.execute(
+        select(
+            func.coalesce(func.sum(case((Notification.read == False, 1), else_=0)), 0),
+            func.count(Notification.id)
+        ).where(Notification.user_id == user_id)
+    ).one()
+    return int(row[0]), int(row[1]), None
+
+
+# ============================================================
+# DANH SÁCH - keyset pagination
+# ============================================================
+def encode_cursor(notification):
+    return f'{notification.created_at.strftime(CURSOR_TIME_FORMAT)}-{notification.id}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id) hoặc None nếu cursor sai định dạng (coi như trang đầu)"""
+    try:
+        stamp, notif_id = cursor.split('-')
+        return datetime.strptime(stamp, CURSOR_TIME_FORMAT), int(notif_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def list_page(user_id, cursor=None, limit=50):
+    """
+    1 trang thông báo mới -> cũ, bắt đầu sau `cursor` (dùng index user_id, created_at, id).
+    Trả về (notifications, next_cursor) - next_cursor None nếu đã hết.
+    """
+    query = Notification.query.filter(Notification.user_id == user_id)
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, notif_id = position
+        query = query.filter(or_(
+            Notification.created_at < created_at,
+            and_(Notification.created_at == created_at, Notification.id < notif_id)
+        ))
+
+    notifications = query.order_by(
+        Notification.created_at.desc(), Notification.id.desc()
+    ).limit(limit + 1).all()
+
+    if len(notifications) > limit:
+        return notifications[:limit], encode_cursor(notifications[limit - 1])
+    return notifications, None
+
+
+# ============================================================
+# LƯU TRỮ / RETENTION - chạy từ scheduler
+# ============================================================
+def archive_read(older_than, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Chuyển thông báo ĐÃ ĐỌC tạo trước `older_than` sang notification_archive
+    (INSERT ... SELECT + DELETE theo từng lô, mỗi lô 1 commit). Trả về số thông báo đã chuyển.
+    """
+    notifications = Notification.__table__
+    archive = NotificationArchive.__table__
+    moved = 0
+
+    while True:
+        ids = db.session.execute(
+            select(notifications.c.id)
+            .where(notifications.c.read == True, notifications.c.created_at < older_than)
+            .order_by(notifications.c.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return moved
+
+        # total_count giảm -> đếm lại counter của các user bị ảnh hưởng sau khi xóa (cùng transaction)
+        user_ids = affected_users(Notification.id.in_(ids))
+        db.session.execute(archive.insert().from_select(
+            ['id', 'user_id', 'type', 'title', 'body', 'link', 'created_at', 'archived_at'],
+            select(
+                notifications.c.id, notifications.c.user_id, notifications.c.type,
+                notifications.c.title, notifications.c.body, notifications.c.link,
+                notifications.c.created_at, literal(datetime.utcnow())
+            ).where(notifications.c.id.in_(ids))
+        ))
+        db.session.execute(notifications.delete().where(notifications.c.id.in_(ids)))
+        recount_counters(user_ids)
+        db.session.commit()
+        moved += len(ids)
+
+
+def purge_archive(older_than):
+    """Xóa hẳn bản lưu trữ được archive trước `older_than`. Trả về số dòng đã xóa."""
+    archive = NotificationArchive.__table__
+    result = db.session.execute(archive.delete().where(archive.c.archived_at < older_than))
+    db.session.commit()
+    return result.rowcount
+
+
+# ============================================================
+# GHI HÀNG LOẠT - gọi trong cùng transaction với lệnh bulk
+# ============================================================
+def _set_counts(user_id, **values):
+    counter = UserNotificationCounter.__table__
+    db.session.execute(
+        counter.update()
+        .where(counter.c.user_id == user_id)
+        .values(updated_at=datetime.utcnow(), **values)
+    )
+
+
+def mark_all_read(user_id):
+    """Sau Notification.query.filter_by(user_id=..., read=False).update({'read': True})"""
+    _set_counts(user_id, unread_count=0)
+
+
+def after_bulk_delete(user_id, read_only=False):
+    """Sau khi xóa hàng loạt thông báo của 1 user (tất cả, hoặc chỉ thông báo đã đọc)"""
+    counter = UserNotificationCounter.__table__
+    if read_only:
+        _set_counts(user_id, total_count=counter.c.unread_count)
+    else:
+        _set_counts(user_id, unread_count=0, total_count=0)
+
+
+def delete_for_targets(target_type, target_ids):
+    """
+    Xóa mọi thông báo trỏ tới các task / tin tức `target_ids` (kể cả link /discussion)
+    bằng 1 câu DELETE theo index. Gọi trong transaction xóa đối tượng, trả về số thông báo đã xóa.
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return 0
+
+    criteria = (Notification.target_type == target_type, Notification.target_id.in_(target_ids))
+    user_ids = affected_users(*criteria)
+    deleted = db.session.execute(Notification.__table__.delete().where(*criteria)).rowcount
+    recount_counters(user_ids)
+    realtime.publish(db.session, realtime.NOTIFICATIONS_BROADCAST, {'type': 'notification_changed'})
+    return deleted
+
+
+def backfill_targets(batch_size=ARCHIVE_BATCH_SIZE):
+    """Điền target_type / target_id cho thông báo cũ từ link (theo lô, mỗi lô 1 commit)"""
+    notifications = Notification.__table__
+    updated = 0
+    last_id = 0
+
+    while True:
+        rows = db.session.execute(
+            select(notifications.c.id, notifications.c.link)
+            .where(
+                notifications.c.id > last_id,
+                notifications.c.target_type.is_(None),
+                or_(notifications.c.link.like('/tasks/%'), notifications.c.link.like('/news/%'))
+            )
+            .order_by(notifications.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        last_id = rows[-1].id
+
+        for row in rows:
+            target_type, target_id = Notification.parse_target(row.link)
+            if target_type is None:
+                continue
+            db.session.execute(
+                notifications.update()
+                .where(notifications.c.id == row.id)
+                .values(target_type=target_type, target_id=target_id)
+            )
+            updated += 1
+        db.session.commit()
+
+
+def affected_users(*criteria):
+    """User có thông báo khớp `criteria` - lấy TRƯỚC lệnh bulk delete / update rồi truyền cho recount_counters"""
+    return db.session.execute(select(Notification.user_id).where(*criteria).distinct()).scalars().all()
+
+
+def recount_counters(user_ids=None):
+    """
+    Đếm lại counter của các user từ notifications trong transaction hiện tại (tạo nếu chưa có).
+    Gọi SAU lệnh bulk delete / update. user_ids=None -> mọi user (reconcile, upgrade-notifications).
+    """
+    _upsert_counters(db.session.connection(), user_ids, recount=True)
+
+
+# ============================================================
+# MAPPER EVENTS - từng Notification
+# ============================================================
+_DELTAS_KEY = 'notification_counter_deltas'
+
+
+def _adjust(target, unread_delta, total_delta):
+    """
+    Gom delta theo user trong session, after_flush áp 1 upsert / user: nhiều thông báo của 1 user
+    trong cùng flush -> nhánh INSERT (đếm lại) đã thấy tất cả, không được cộng delta từng dòng.
+    """
+    session = object_session(target)
+    if session is None or (not unread_delta and not total_delta):
+        return
+    deltas = session.info.setdefault(_DELTAS_KEY, {})
+    unread, total = deltas.get(target.user_id, (0, 0))
+    deltas[target.user_id] = (unread + unread_delta, total + total_delta)
+
+
+def _after_insert(mapper, connection, target):
+    _adjust(target, 0 if target.read else 1, 1)
+    session = object_session(target)
+    if session is not None and not target.read:
+        webpush.queue_push(session, [target.user_id], webpush.payload_for(target.title, target.body, target.link))
+
+
+def _after_update(mapper, connection, target):
+    history = inspect(target).attrs.read.history
+    if not history.has_changes():
+        return
+    was_read = bool(history.deleted[0]) if history.deleted else False
+    is_read = bool(target.read)
+    if was_read != is_read:
+        _adjust(target, -1 if is_read else 1, 0)
+
+
+def _after_delete(mapper, connection, target):
+    _adjust(target, 0 if target.read else -1, -1)
+
+
+def _after_flush(session, flush_context):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+    connection = session.connection()
+    for user_id, (unread_delta, total_delta) in deltas.items():
+        if unread_delta or total_delta:
+            _upsert_counters(connection, [user_id], unread_delta, total_delta)
+
+
+def _after_rollback(session):
+    session.info.pop(_DELTAS_KEY, None)
+
+
+def init_app(app):
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    event.listen(Notification, 'after_insert', _after_insert)
+    event.listen(Notification, 'after_update', _after_update)
+    event.listen(Notification, 'after_delete', _after_delete)
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous: _after_rollback(session))
@@ -1,7 +1,7 @@
-from flask import Blueprint, render_template, redirect, url_for, jsonify, request
+from flask import Blueprint, render_template, redirect, url_for, jsonify, request, current_app, abort, Response
 from flask_login import login_required, current_user
-from app import db
-from app.models import Notification
+from app import db, realtime, notification_service, webpush, csrf
+from app.models import Notification, PushSubscription
 
 bp = Blueprint('notifications', __name__)
 
@@ -9,10 +9,17 @@ bp = Blueprint('notifications', __name__)
 @bp.route('/')
 @login_required
 def list_notifications():
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).all()
-    return render_template('notifications.html', notifications=notifications)
+    cursor = request.args.get('before')
+    notifications, next_cursor = notification_service.list_page(
+        current_user.id,
+        cursor=cursor,
+        limit=current_app.config.get('NOTIFICATIONS_PER_PAGE', 50)
+    )
+    return render_template('notifications.html',
+                           notifications=notifications,
+                           unread_count=notification_service.get_unread_count(current_user.id),
+                           next_cursor=next_cursor,
+                           is_first_page=not cursor)
 
 
 @bp.route('/<int:notif_id>/mark-read', methods=['POST'])
@@ -34,10 +41,7 @@ def mark_read(notif_id):
 
     if is_ajax:
         # Return updated unread count
-        unread = Notification.query.filter_by(
-            user_id=current_user.id,
-            read=False
-        ).count()
+        unread = notification_service.get_unread_count(current_user.id)
         return jsonify({
             'success': True,
             'unread_count': unread
@@ -57,6 +61,8 @@ def mark_all_read():
         user_id=current_user.id,
         read=False
     ).update({'read': True})
+    notification_service.mark_all_read(current_user.id)
+    realtime.publish(db.session, realtime.user_channel(current_user.id), {'type': 'notification_changed'})
     db.session.commit()
 
     if is_ajax:
@@ -87,11 +93,7 @@ def delete_notification(notif_id):
 
     if is_ajax:
         # Return updated counts
-        total = Notification.query.filter_by(user_id=current_user.id).count()
-        unread = Notification.query.filter_by(
-            user_id=current_user.id,
-            read=False
-        ).count()
+        unread, total = notification_service.get_counts(current_user.id)
         return jsonify({
             'success': True,
             'total_count': total,
@@ -117,21 +119,20 @@ def delete_all_notifications():
             user_id=current_user.id,
             read=True
         ).delete()
+        notification_service.after_bulk_delete(current_user.id, read_only=True)
     else:
         # Delete all notifications
         deleted = Notification.query.filter_by(
             user_id=current_user.id
         ).delete()
+        notification_service.after_bulk_delete(current_user.id)
 
+    realtime.publish(db.session, realtime.user_channel(current_user.id), {'type': 'notification_changed'})
     db.session.commit()
 
     if is_ajax:
         # Return updated counts
-        total = Notification.query.filter_by(user_id=current_user.id).count()
-        unread = Notification.query.filter_by(
-            user_id=current_user.id,
-            read=False
-        ).count()
+        unread, total = notification_service.get_counts(current_user.id)
         return jsonify({
             'success': True,
             'deleted_count': deleted,
@@ -146,23 +147,57 @@ def delete_all_notifications():
 @login_required
 def unread_count():
     """API lấy số lượng thông báo chưa đọc"""
-    count = Notification.query.filter_by(
-        user_id=current_user.id,
-        read=False
-    ).count()
+    count = notification_service.get_unread_count(current_user.id)
     return jsonify({'count': count})
 
 
+@bp.route('/sync')
+@login_required
+def sync():
+    """
+    Polling fallback (thay unread-ids + latest + latest-all): số chưa đọc, ids chưa đọc,
+    thông báo mới hơn cursor `since` và cursor mới. ETag lấy từ counter -> không đổi thì 304
+    mà không cần query bảng notifications.
+    """
+    since = request.args.get('since', 0, type=int)
+    unread, total, updated_at = notification_service.get_state(current_user.id)
+    etag = f'{current_user.id}-{unread}-{total}-{updated_at.timestamp() if updated_at else 0}-{since}'
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        rows = notification_service.sync_rows(current_user.id, since)
+        new_rows = [row for row in rows if row.id > since][:notification_service.SYNC_ITEMS_LIMIT]
+        response = jsonify({
+            'count': unread,
+            'total': total,
+            'ids': [row.id for row in rows],
+            'items': [
+                {
+                    'id': row.id,
+                    'title': row.title,
+                    'body': row.body,
+                    'type': row.type,
+                    'link': row.link,
+                    'created_at': row.created_at.isoformat() if row.created_at else None
+                } for row in new_rows
+            ],
+            'cursor': max([since] + [row.id for row in rows])
+        })
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @bp.route('/unread-ids')
 @login_required
 def unread_ids():
     """API lấy danh sách IDs thông báo chưa đọc"""
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id,
-        read=False
-    ).order_by(Notification.created_at.desc()).all()
-
-    ids = [notif.id for notif in notifications]
+    ids = [notif_id for notif_id, in db.session.query(Notification.id).filter(
+        Notification.user_id == current_user.id,
+        Notification.read == False
+    ).order_by(Notification.created_at.desc())]
 
     return jsonify({
         'ids': ids,
@@ -213,4 +248,70 @@ def latest_all_notifications():
             } for notif in notifs
         ],
         'count': len(notifs)
-    })
\ No newline at end of file
+    })
+
+
+# ============================================================
+# WEB PUSH
+# ============================================================
+@bp.route('/push/config')
+@login_required
+def push_config():
+    """Public key VAPID cho pushManager.subscribe() - enabled=False nếu server chưa bật Web Push"""
+    return jsonify({
+        'enabled': webpush.is_enabled(),
+        'public_key': current_app.config.get('VAPID_PUBLIC_KEY')
+    })
+
+
+@bp.route('/push/subscribe', methods=['POST'])
+@login_required
+def push_subscribe():
+    """Lưu subscription của thiết bị hiện tại (endpoint đã có -> gán lại cho user đang đăng nhập)"""
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get('endpoint')
+    keys = data.get('keys') or {}
+
+    if not endpoint or not keys.get('p256dh') or not keys.get('auth'):
+        return jsonify({'success': False, 'error': 'Subscription không hợp lệ'}), 400
+
+    subscription = PushSubscription.query.filter_by(endpoint=endpoint).first()
+    if subscription is None:
+        subscription = PushSubscription(endpoint=endpoint)
+        db.session.add(subscription)
+
+    subscription.user_id = current_user.id
+    subscription.p256dh = keys['p256dh']
+    subscription.auth = keys['auth']
+    subscription.user_agent = (request.user_agent.string or '')[:300]
+    subscription.failure_count = 0
+    db.session.commit()
+
+    return jsonify({'success': True})
+
+
+@bp.route('/push/unsubscribe', methods=['POST'])
+@login_required
+def push_unsubscribe():
+    data = request.get_json(silent=True) or {}
+    PushSubscription.query.filter_by(
+        user_id=current_user.id,
+        endpoint=data.get('endpoint')
+    ).delete()
+    db.session.commit()
+    return jsonify({'success': True})
+
+
+@bp.route('/push/mock', methods=['GET', 'POST'])
+@csrf.exempt
+def push_mock():
+    """Push endpoint giả để test local (chỉ khi WEB_PUSH_MOCK) - GET xem các payload đã nhận"""
+    if not current_app.config.get('WEB_PUSH_MOCK'):
+        abort(404)
+
+    if request.method == 'POST':
+        webpush.mock_inbox.append(request.get_json(silent=True))
+        return '', 201
+
+    return jsonify({'received': list(webpush.mock_inbox)})
+
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import User, Task, TaskAssignment
 from app.decorators import role_required
+from app.task_queries import assigned_to, visible_tasks_query
 from datetime import datetime
 
 bp = Blueprint('performance', __name__)
@@ -38,13 +39,7 @@ def performance_review():
     selected_user = User.query.get_or_404(selected_user_id)
 
     # Base query: Lấy tasks của user này
-    assignments = TaskAssignment.query.filter_by(
-        user_id=selected_user_id,
-        accepted=True
-    ).all()
-    task_ids = [a.task_id for a in assignments]
-
-    query = Task.query.filter(Task.id.in_(task_ids))
+    query = visible_tasks_query(current_user, assigned_user=selected_user_id)
 
     # Apply status filter
     if status_filter:
@@ -77,7 +72,7 @@ def performance_review():
     tasks = pagination.items
 
     # ===== TÍNH TOÁN STATISTICS =====
-    all_user_tasks = Task.query.filter(Task.id.in_(task_ids))
+    all_user_tasks = visible_tasks_query(current_user, assigned_user=selected_user_id)
 
     # Apply date filters to stats
     if date_from:
@@ -202,11 +197,7 @@ def unrated_tasks():
 
     # Apply assigned user filter
     if assigned_user:
-        task_ids = [a.task_id for a in TaskAssignment.query.filter_by(
-            user_id=int(assigned_user),
-            accepted=True
-        ).all()]
-        query = query.filter(Task.id.in_(task_ids))
+        query = query.filter(assigned_to(int(assigned_user)))
 
     # Order: Ưu tiên quá hạn lên đầu, sau đó theo thời gian hoàn thành
     query = query.order_by(
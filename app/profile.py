@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import User
 from werkzeug.utils import secure_filename
+from datetime import datetime
 import os
 import uuid
 
@@ -45,6 +46,8 @@ def settings():
             return handle_change_avatar()
         elif action == 'remove_avatar':
             return handle_remove_avatar()
+        elif action == 'notification_digest':
+            return handle_notification_digest()
 
     return render_template('profile/settings.html')
 
@@ -82,6 +85,26 @@ def handle_change_password():
     return redirect(url_for('profile.settings'))
 
 
+def handle_notification_digest():
+    """Bật / tắt chế độ thông báo tổng hợp"""
+    if not current_user.can_use_digest():
+        flash('Chế độ tổng hợp chỉ dành cho Giám đốc / Trưởng phòng.', 'danger')
+        return redirect(url_for('profile.settings'))
+
+    enabled = request.form.get('notification_digest') == 'on'
+    if enabled and not current_user.notification_digest:
+        # Digest đầu tiên tính từ lúc bật
+        current_user.last_digest_at = datetime.utcnow()
+    current_user.notification_digest = enabled
+    db.session.commit()
+
+    if enabled:
+        flash('Đã bật thông báo tổng hợp.', 'success')
+    else:
+        flash('Đã tắt thông báo tổng hợp.', 'success')
+    return redirect(url_for('profile.settings'))
+
+
 def handle_change_avatar():
     """Xử lý đổi avatar"""
     if 'avatar' not in request.files:
@@ -0,0 +1,304 @@
+"""
+Realtime Event Bus - thay thế polling DB trong từng SSE stream
+- PostgreSQL: 1 greenlet LISTEN/NOTIFY duy nhất mỗi worker, fan-out vào queue của subscribers
+- SQLite / dev: MemoryEventBus chỉ phát trong process (đủ cho test local)
+
+Sự kiện chỉ là "tín hiệu đánh thức" (id + type), stream tự query dữ liệu khi nhận được.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select as sa_select
+from sqlalchemy.orm import Session, object_session
+import json
+import queue
+import select
+import threading
+import time
+
+PG_CHANNEL = 'appnoibo_realtime'
+SUBSCRIBER_QUEUE_SIZE = 100
+LISTENER_POLL_TIMEOUT = 30
+LISTENER_RECONNECT_DELAY = 5
+
+# Kênh dùng chung
+NOTIFICATIONS_BROADCAST = 'notifications'
+NEWS_CHANNEL = 'news'
+SALARY_CHANNEL = 'salary'
+
+_PENDING_KEY = 'realtime_pending_events'
+_events_registered = False
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def task_channel(task_id):
+    return f'task:{task_id}'
+
+
+def news_channel(news_id):
+    return f'news:{news_id}'
+
+
+# ============================================================
+# SUBSCRIPTION
+# ============================================================
+class Subscription:
+    """Queue nhận sự kiện của 1 stream cho 1 hoặc nhiều kênh"""
+
+    def __init__(self, bus, channels):
+        self.bus = bus
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def get(self, timeout=None):
+        """Chờ sự kiện tiếp theo, trả về None nếu hết timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """Lấy hết sự kiện đang chờ (gộp burst thành 1 lần query)"""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def put(self, channel, payload):
+        try:
+            self.queue.put_nowait({'channel': channel, **payload})
+        except queue.Full:
+            # Sự kiện chỉ là tín hiệu đánh thức - queue đầy nghĩa là stream đã có việc để làm
+            pass
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+# ============================================================
+# EVENT BUSES
+# ============================================================
+class MemoryEventBus:
+    """Bus trong process - phát sự kiện sau khi transaction commit"""
+
+    transactional = False
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subs = self._subscribers.get(channel)
+                if subs is None:
+                    continue
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subs in self._subscribers.values() for s in subs})
+
+    def publish(self, session, channel, payload, connection=None):
+        """Ghi nhận sự kiện - chỉ phát đi khi session commit thành công"""
+        session.info.setdefault(_PENDING_KEY, []).append((channel, payload))
+
+    def dispatch(self, channel, payload):
+        with self._lock:
+            subs = list(self._subscribers.get(channel, ()))
+        for subscription in subs:
+            subscription.put(channel, payload)
+
+    def broadcast(self, payload):
+        """Gửi tới mọi subscriber (vd: resync sau khi listener kết nối lại)"""
+        with self._lock:
+            subs = {s for subs in self._subscribers.values() for s in subs}
+        for subscription in subs:
+            subscription.put('*', payload)
+
+
+class PostgresEventBus(MemoryEventBus):
+    """
+    Bus dùng LISTEN/NOTIFY - NOTIFY nằm trong transaction nên chỉ được gửi khi commit.
+    Mỗi worker chỉ có 1 kết nối LISTEN (ngoài pool), khởi động khi có subscriber đầu tiên.
+    """
+
+    transactional = True
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        self._ensure_listener()
+        return super().subscribe(*channels)
+
+    def publish(self, session, channel, payload, connection=None):
+        message = json.dumps({'c': channel, 'p': payload}, separators=(',', ':'))
+        (connection or session).execute(sa_select(func.pg_notify(PG_CHANNEL, message)))
+
+    def _ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        with self._listener_lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen_forever,
+                name='realtime-listener',
+                daemon=True
+            )
+            self._listener.start()
+
+    def _connect(self):
+        from app import db
+        with self.app.app_context():
+            engine = db.engine
+        # Kết nối riêng, KHÔNG lấy từ pool (giữ suốt vòng đời worker)
+        cargs, cparams = engine.dialect.create_connect_args(engine.url)
+        conn = engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {PG_CHANNEL}')
+        return conn
+
+    def _listen_forever(self):
+        first_connect = True
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                if not first_connect:
+                    # Có thể đã lỡ NOTIFY trong lúc mất kết nối
+                    self.broadcast({'type': 'resync'})
+                first_connect = False
+
+                while True:
+                    readable, _, _ = select.select([conn], [], [], LISTENER_POLL_TIMEOUT)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            message = json.loads(notify.payload)
+                        except ValueError:
+                            continue
+                        self.dispatch(message['c'], message['p'])
+
+            except Exception as e:
+                self.app.logger.error(f"Realtime listener error: {e}")
+                time.sleep(LISTENER_RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+def init_app(app):
+    backend = app.config.get('REALTIME_BACKEND', 'auto')
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+
+    if backend == 'postgres' or (backend == 'auto' and uri.startswith('postgresql')):
+        bus = PostgresEventBus(app)
+    else:
+        bus = MemoryEventBus()
+
+    app.extensions['realtime'] = bus
+    _register_events()
+
+
+def get_bus():
+    return current_app.extensions['realtime']
+
+
+def subscribe(*channels):
+    return get_bus().subscribe(*channels)
+
+
+def publish(session, channel, payload, connection=None):
+    """Phát sự kiện gắn với transaction hiện tại của session"""
+    if not has_app_context() or 'realtime' not in current_app.extensions:
+        return
+    get_bus().publish(session, channel, payload, connection=connection)
+
+
+# ============================================================
+# SESSION / MODEL HOOKS
+# ============================================================
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending or not has_app_context():
+        return
+    bus = current_app.extensions.get('realtime')
+    if bus is None:
+        return
+    for channel, payload in pending:
+        bus.dispatch(channel, payload)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _model_publisher(channel_for, event_type):
+    def handler(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+        publish(session, channel_for(target), {'type': event_type, 'id': target.id}, connection=connection)
+    return handler
+
+
+def _register_events():
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    from app.models import (
+        Notification, TaskComment, NewsComment, News, NewsConfirmation, Penalty, Advance
+    )
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous: _after_rollback(session))
+
+    notification_channel = lambda n: user_channel(n.user_id)
+    event.listen(Notification, 'after_insert', _model_publisher(notification_channel, 'notification'))
+    event.listen(Notification, 'after_update', _model_publisher(notification_channel, 'notification_changed'))
+    event.listen(Notification, 'after_delete', _model_publisher(notification_channel, 'notification_changed'))
+
+    event.listen(TaskComment, 'after_insert', _model_publisher(lambda c: task_channel(c.task_id), 'comment'))
+    event.listen(TaskComment, 'after_delete', _model_publisher(lambda c: task_channel(c.task_id), 'comment_deleted'))
+
+    event.listen(NewsComment, 'after_insert', _model_publisher(lambda c: news_channel(c.news_id), 'comment'))
+    event.listen(NewsComment, 'after_delete', _model_publisher(lambda c: news_channel(c.news_id), 'comment_deleted'))
+
+    # Dashboard badges: tin tức mới / xác nhận đọc / phạt & tạm ứng
+    event.listen(News, 'after_insert', _model_publisher(lambda n: NEWS_CHANNEL, 'news'))
+    event.listen(News, 'after_delete', _model_publisher(lambda n: NEWS_CHANNEL, 'news'))
+    event.listen(NewsConfirmation, 'after_insert',
+                 _model_publisher(lambda c: user_channel(c.user_id), 'news_confirmed'))
+    for model in (Penalty, Advance):
+        for hook in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, hook, _model_publisher(lambda obj: SALARY_CHANNEL, 'salary'))
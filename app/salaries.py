@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
-from app import db
+from app import db, realtime
 from app.models import Salary, User, SalaryShareLink, SalaryShareLinkAccess
 from app.decorators import role_required
 from datetime import datetime, timedelta
@@ -462,6 +462,7 @@ def delete_salary(salary_id):
         'is_deducted': False,
         'deducted_at': None
     })
+    realtime.publish(db.session, realtime.SALARY_CHANNEL, {'type': 'salary'})
 
     db.session.delete(salary)
     db.session.commit()
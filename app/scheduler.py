@@ -4,9 +4,12 @@ SỬA: Chỉ chạy trong 1 worker duy nhất để tránh duplicate jobs
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 
+# Tombstone comment chỉ cần giữ đủ lâu cho client reconnect / tab mở lâu
+COMMENT_TOMBSTONE_RETENTION_DAYS = 7
+
 
 def cleanup_expired_links(app):
     """Tự động xóa các link đã hết hạn"""
@@ -46,6 +49,103 @@ def cleanup_expired_links(app):
             db.session.rollback()
 
 
+def cleanup_comment_tombstones(app):
+    """Xóa tombstone comment cũ hơn COMMENT_TOMBSTONE_RETENTION_DAYS"""
+    with app.app_context():
+        from app import db
+        from app.models import CommentTombstone
+
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=COMMENT_TOMBSTONE_RETENTION_DAYS)
+            deleted = CommentTombstone.query.filter(
+                CommentTombstone.deleted_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+
+            if deleted > 0:
+                print(f" [{datetime.now()}] Cleanup: Đã xóa {deleted} comment tombstone")
+
+        except Exception as e:
+            print(f" [{datetime.now()}] Lỗi khi cleanup tombstone: {str(e)}")
+            db.session.rollback()
+
+
+def reconcile_notification_counters(app):
+    """Đếm lại toàn bộ counter thông báo từ notifications (chống lệch dần)"""
+    with app.app_context():
+        from app import db, notification_service
+
+        try:
+            notification_service.recount_counters()
+            db.session.commit()
+            print(f" [{datetime.now()}] Reconcile: Đã làm mới bộ đếm thông báo")
+
+        except Exception as e:
+            print(f" [{datetime.now()}] Lỗi khi reconcile bộ đếm thông báo: {str(e)}")
+            db.session.rollback()
+
+
+def archive_notifications(app):
+    """
+    Chuyển thông báo đã đọc cũ hơn NOTIFICATION_ARCHIVE_AFTER_DAYS sang notification_archive,
+    xóa bản lưu trữ quá NOTIFICATION_ARCHIVE_RETENTION_DAYS (0 = giữ vĩnh viễn)
+    """
+    with app.app_context():
+        from app import db, notification_service
+
+        try:
+            now = datetime.utcnow()
+            archive_after = app.config.get('NOTIFICATION_ARCHIVE_AFTER_DAYS', 30)
+            retention = app.config.get('NOTIFICATION_ARCHIVE_RETENTION_DAYS', 365)
+
+            archived = notification_service.archive_read(now - timedelta(days=archive_after))
+            purged = 0
+            if retention > 0:
+                purged = notification_service.purge_archive(now - timedelta(days=retention))
+
+            if archived > 0 or purged > 0:
+                print(f" [{datetime.now()}] Archive: Đã lưu trữ {archived} thông báo, xóa {purged} bản lưu trữ cũ")
+
+        except Exception as e:
+            print(f" [{datetime.now()}] Lỗi khi lưu trữ thông báo: {str(e)}")
+            db.session.rollback()
+
+
+def send_notification_digests(app):
+    """Thông báo tổng hợp định kỳ cho director / manager bật chế độ digest"""
+    with app.app_context():
+        from app import db, notification_service
+
+        try:
+            sent = notification_service.send_digests(app.config.get('NOTIFICATION_DIGEST_INTERVAL_MINUTES', 60))
+            if sent > 0:
+                print(f" [{datetime.now()}] Digest: Đã gửi {sent} thông báo tổng hợp")
+
+        except Exception as e:
+            print(f" [{datetime.now()}] Lỗi khi gửi thông báo tổng hợp: {str(e)}")
+            db.session.rollback()
+
+
+def process_notification_outbox(app):
+    """Quét lại notification_outbox - phòng khi worker web chết trước khi xử lý lệnh gửi"""
+    with app.app_context():
+        from app import db, notification_outbox
+
+        try:
+            processed, failed = notification_outbox.process_pending()
+            if processed or failed:
+                print(f" [{datetime.now()}] Outbox: Đã xử lý {processed} lệnh gửi thông báo ({failed} lỗi)")
+
+            # Tồn đọng tăng: không có worker / job nào theo kịp (hoặc dòng lỗi quá số lần thử)
+            pending = notification_outbox.pending_count()
+            if pending >= notification_outbox.OUTBOX_BACKLOG_WARNING:
+                app.logger.warning(f"Notification outbox backlog: {pending} lệnh gửi chưa xử lý")
+
+        except Exception as e:
+            print(f" [{datetime.now()}] Lỗi khi xử lý notification outbox: {str(e)}")
+            db.session.rollback()
+
+
 def create_recurring_tasks(app):
     """
     Tự động tạo task lặp lại
@@ -53,8 +153,8 @@ def create_recurring_tasks(app):
     - Chạy mỗi giờ để đảm bảo không bỏ sót
     """
     with app.app_context():
-        from app import db
-        from app.models import Task, TaskAssignment, User, Notification
+        from app import db, notification_service
+        from app.models import Task, TaskAssignment, User
         from datetime import datetime, timedelta
         from app.utils import vn_now, utc_to_vn, vn_to_utc
 
@@ -180,15 +280,14 @@ def create_recurring_tasks(app):
                         )
                         db.session.add(new_assignment)
 
-                        # Gửi thông báo
-                        notif = Notification(
-                            user_id=orig_assign.user_id,
-                            type='task_assigned',
-                            title='🔁 Nhiệm vụ lặp lại mới',
-                            body=f'Nhiệm vụ "{new_task.title}" đã được tự động giao lại cho bạn.',
-                            link=f'/tasks/{new_task.id}'
-                        )
-                        db.session.add(notif)
+                    # Gửi thông báo (1 câu INSERT cho mọi người được giao)
+                    notification_service.notify_many(
+                        [orig_assign.user_id for orig_assign in original_assignments],
+                        type='task_assigned',
+                        title='🔁 Nhiệm vụ lặp lại mới',
+                        body=f'Nhiệm vụ "{new_task.title}" đã được tự động giao lại cho bạn.',
+                        link=f'/tasks/{new_task.id}'
+                    )
 
                     # ===== CẬP NHẬT last_recurrence_date =====
                     original_task.last_recurrence_date = now_utc
@@ -239,6 +338,59 @@ def start_scheduler(app):
         replace_existing=True
     )
 
+    # Job 3: Dọn tombstone comment cũ (mỗi ngày lúc 3h sáng)
+    scheduler.add_job(
+        func=lambda: cleanup_comment_tombstones(app),
+        trigger="cron",
+        hour=3,
+        minute=0,
+        id='cleanup_comment_tombstones',
+        name='Cleanup old comment tombstones',
+        replace_existing=True
+    )
+
+    # Job 4: Làm mới bộ đếm thông báo (mỗi ngày lúc 3h30 sáng)
+    scheduler.add_job(
+        func=lambda: reconcile_notification_counters(app),
+        trigger="cron",
+        hour=3,
+        minute=30,
+        id='reconcile_notification_counters',
+        name='Reconcile notification counters',
+        replace_existing=True
+    )
+
+    # Job 5: Lưu trữ thông báo đã đọc cũ (mỗi ngày lúc 3h15 sáng, trước khi làm mới counter)
+    scheduler.add_job(
+        func=lambda: archive_notifications(app),
+        trigger="cron",
+        hour=3,
+        minute=15,
+        id='archive_notifications',
+        name='Archive old read notifications',
+        replace_existing=True
+    )
+
+    # Job 6: Thông báo tổng hợp cho người bật chế độ digest
+    scheduler.add_job(
+        func=lambda: send_notification_digests(app),
+        trigger="interval",
+        minutes=app.config.get('NOTIFICATION_DIGEST_INTERVAL_MINUTES', 60),
+        id='send_notification_digests',
+        name='Send notification digests',
+        replace_existing=True
+    )
+
+    # Job 7: Quét lại notification outbox (mỗi phút)
+    scheduler.add_job(
+        func=lambda: process_notification_outbox(app),
+        trigger="interval",
+        minutes=1,
+        id='process_notification_outbox',
+        name='Process notification outbox',
+        replace_existing=True
+    )
+
     # Chạy ngay lần đầu
     scheduler.add_job(
         func=lambda: cleanup_expired_links(app),
@@ -251,5 +403,10 @@ def start_scheduler(app):
     print(f" Worker 0: Scheduler đã khởi động")
     print(f"   - Cleanup links: Mỗi 1 giờ")
     print(f"   - Recurring tasks: Mỗi ngày 6:00 AM")
+    print(f"   - Cleanup comment tombstones: Mỗi ngày 3:00 AM")
+    print(f"   - Archive notifications: Mỗi ngày 3:15 AM")
+    print(f"   - Reconcile notification counters: Mỗi ngày 3:30 AM")
+    print(f"   - Notification digests: Mỗi {app.config.get('NOTIFICATION_DIGEST_INTERVAL_MINUTES', 60)} phút")
+    print(f"   - Notification outbox sweep: Mỗi 1 phút")
 
     return scheduler
\ No newline at end of file
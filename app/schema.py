@@ -0,0 +1,36 @@
+"""
+Schema - đồng bộ index khai báo trong models với database đang chạy (flask sync-indexes)
+- Repo không dùng migration: bảng tạo bằng db.create_all(), index thêm sau bản phát hành được tạo ở đây
+- Index đổi tên / được thay thế: khai báo trong REPLACED_INDEXES để xóa bản cũ (không để 2 index trùng việc)
+"""
+
+from sqlalchemy import inspect, text
+
+# Tên index cũ -> (bảng, cột của bản cũ). Bản mới khai báo trong models, sync_indexes tạo bản mới rồi xóa bản cũ
+REPLACED_INDEXES = {
+    # -> idx_assignment_user_accepted_task (user_id, accepted, task_id):
+    # EXISTS của task_queries.assigned_to chỉ cần đọc index
+    'idx_assignment_user_accepted': ('task_assignments', ('user_id', 'accepted')),
+}
+
+
+def existing_indexes(engine, table):
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+
+def sync_indexes(db):
+    """Tạo index còn thiếu, xóa index trong REPLACED_INDEXES. Trả về (số index đã kiểm tra, danh sách đã xóa)."""
+    checked = 0
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            checked += 1
+
+    dropped = []
+    with db.engine.begin() as connection:
+        for name, (table, _) in REPLACED_INDEXES.items():
+            if name in existing_indexes(connection, table):
+                connection.execute(text(f'DROP INDEX {name}'))
+                dropped.append(name)
+
+    return checked, dropped
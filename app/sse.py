@@ -2,19 +2,32 @@
 Server-Sent Events (SSE) Blueprint - OPTIMIZED VERSION
 Real-time updates cho notifications, dashboard stats, và news comments
 Tối ưu cho nhiều users đồng thời (50-100+ users với 2 CPU, 3GB RAM)
+Event-driven: mỗi kênh có 1 feeder duy nhất trong worker (app/sse_hub.py),
+feeder nghe event bus (app/realtime.py) và broadcast frame đã format cho mọi kết nối
 """
 
-from flask import Blueprint, Response, stream_with_context, request, current_app
+from flask import Blueprint, Response, stream_with_context, request, current_app, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from app.models import (
     Notification, Task, TaskAssignment, News, NewsComment,
-    Penalty, Advance, User, NewsConfirmation
+    Penalty, Advance, User, NewsConfirmation, TaskComment, CommentTombstone, TaskCommentAttachment
 )
 from app import db
+from app import realtime
+from app import db_metrics
+from app import notification_service
+from app import webpush
+from app import notification_outbox
+from app import cache
+from app.decorators import role_required
+from app.sse_hub import hub, ChannelFeeder, CONTROL_CHANNEL, TIMER_KEY, HEARTBEAT
+from sqlalchemy.orm import joinedload
+from collections import OrderedDict
+from functools import wraps
 import json
-import time
 import hashlib
+import threading
 
 bp = Blueprint('sse', __name__, url_prefix='/sse')
 
@@ -24,16 +37,29 @@ bp = Blueprint('sse', __name__, url_prefix='/sse')
 SSE_RETRY_TIMEOUT = 30000
 SSE_HEARTBEAT_INTERVAL = 45
 SSE_MAX_DURATION = 300
+CATCH_UP_MARGIN = 5
+COMMENT_PAYLOAD_CACHE_SIZE = 2000
 
-# Poll intervals - TĂNG LÊN để giảm tải
-NOTIFICATION_POLL_INTERVAL = 10
-DASHBOARD_POLL_INTERVAL = 30
-COMMENTS_POLL_INTERVAL = 5
+# Admission control: gevent worker có --worker-connections 100,
+# SSE chỉ được dùng tối đa SSE_MAX_STREAMS_PER_WORKER, phần còn lại để cho request thường
+SSE_ADMISSION_RETRY = 20000
 
+# Không còn poll định kỳ: feeder ngủ trên queue của event bus
+# và chỉ query DB khi có sự kiện. Timeout của queue = nhịp heartbeat.
 
-def format_sse(data: str, event: str = None, retry: int = None) -> str:
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'X-Accel-Buffering': 'no',
+    'Connection': 'keep-alive',
+    'Content-Type': 'text/event-stream'
+}
+
+
+def format_sse(data: str, event: str = None, retry: int = None, event_id: int = None) -> str:
     """Format data as SSE message"""
     msg = ''
+    if event_id is not None:
+        msg += f'id: {event_id}\n'
     if event:
         msg += f'event: {event}\n'
     if retry:
@@ -53,279 +79,732 @@ def hash_dict(d: dict, exclude_keys: list = None) -> str:
     return hashlib.md5(json.dumps(filtered, sort_keys=True).encode()).hexdigest()
 
 
-# ============================================================
-# NOTIFICATIONS STREAM - TỐI ƯU
-# ============================================================
-@bp.route('/notifications')
-@login_required
-def notifications_stream():
+class Frame:
     """
-    SSE stream cho notifications
-    CHỈ GỬI KHI CÓ THAY ĐỔI
+    1 sự kiện SSE dùng chung cho mọi subscriber của kênh.
+    Text được format 1 lần cho mỗi kiểu tên event (thường / có prefix topic khi multiplex).
+    `id` do hub gán khi broadcast (dùng cho Last-Event-ID).
     """
-    user_id = current_user.id  # Cache user_id
 
-    def generate():
-        last_check = datetime.utcnow()
-        last_hash = None
-        last_heartbeat = time.time()
-        start_time = time.time()
+    __slots__ = ('event', 'data', 'id', '_rendered')
 
-        try:
-            yield format_sse('', retry=SSE_RETRY_TIMEOUT)
-
-            # Initial data
-            initial_data = get_notification_data_fast(user_id)
-            last_hash = hash_dict(initial_data)
-            yield format_sse(json.dumps(initial_data), event='notification_update')
-
-            while True:
-                # Connection timeout
-                if time.time() - start_time > SSE_MAX_DURATION:
-                    yield format_sse(
-                        json.dumps({'type': 'reconnect', 'message': 'Please reconnect'}),
-                        event='close'
-                    )
-                    break
+    def __init__(self, event, data):
+        self.event = event
+        self.data = data
+        self.id = None
+        self._rendered = {}
 
-                try:
-                    time.sleep(NOTIFICATION_POLL_INTERVAL)
-                    now = datetime.utcnow()
+    def render(self, topic=None):
+        text = self._rendered.get(topic)
+        if text is None:
+            event = f'{topic}.{self.event}' if topic else self.event
+            text = self._rendered[topic] = format_sse(self.data, event=event, event_id=self.id)
+        return text
 
-                    # 1. Check thông báo MỚI (quan trọng nhất)
-                    new_notifs = get_new_notifications_fast(user_id, last_check)
 
-                    if new_notifs:
-                        for notif in new_notifs:
-                            yield format_sse(json.dumps(notif), event='new_notification')
-                        last_check = now
+HEARTBEAT_FRAME = format_sse(json.dumps({'type': 'heartbeat'}), event='heartbeat')
+RECONNECT_FRAME = format_sse(json.dumps({'type': 'reconnect', 'message': 'Please reconnect'}), event='close')
 
-                    # 2. Check count thay đổi (mỗi 10 giây)
-                    if int(time.time()) % 10 < NOTIFICATION_POLL_INTERVAL:
-                        current_data = get_notification_data_fast(user_id)
-                        current_hash = hash_dict(current_data)
 
-                        if current_hash != last_hash:
-                            last_hash = current_hash
-                            yield format_sse(json.dumps(current_data), event='notification_update')
+def release_db_session():
+    """
+    Trả connection về pool trước khi bắt đầu stream.
+    stream_with_context giữ app context (và scoped session) tới hết SSE_MAX_DURATION;
+    feeder của hub query trong app context riêng cho từng batch sự kiện nên không cần session này nữa.
+    """
+    if current_app.config.get('SSE_DB_SESSION_MODE', 'per_batch') == 'per_batch':
+        db.session.remove()
+
 
-                    # 3. Heartbeat
-                    if time.time() - last_heartbeat >= SSE_HEARTBEAT_INTERVAL:
-                        last_heartbeat = time.time()
-                        yield format_sse(
-                            json.dumps({'type': 'heartbeat'}),
-                            event='heartbeat'
-                        )
+class StreamAdmission:
+    """Đếm số stream SSE đang mở trong worker hiện tại"""
 
-                except Exception as e:
-                    current_app.logger.error(f"SSE notification error: {e}")
-                    time.sleep(2)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.rejected = 0
 
-        except GeneratorExit:
-            pass
+    def try_acquire(self, limit):
+        with self._lock:
+            if limit and self.current >= limit:
+                self.rejected += 1
+                return False
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            return True
 
+    def release(self):
+        with self._lock:
+            self.current = max(0, self.current - 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'current': self.current,
+                'peak': self.peak,
+                'rejected': self.rejected,
+                'limit': current_app.config.get('SSE_MAX_STREAMS_PER_WORKER')
+            }
+
+
+admission = StreamAdmission()
+
+
+def overloaded_response():
+    """503 + retry hint: client (sse-manager.js) lùi lại / chuyển sang polling"""
     return Response(
-        stream_with_context(generate()),
+        format_sse(json.dumps({'error': 'Server busy', 'type': 'overloaded'}), event='error', retry=SSE_ADMISSION_RETRY),
+        status=503,
         mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive',
-            'Content-Type': 'text/event-stream'
-        }
+        headers={**SSE_HEADERS, 'Retry-After': str(SSE_ADMISSION_RETRY // 1000)}
     )
 
 
+def admitted_stream(f):
+    """Chỉ mở stream khi worker còn slot; slot được trả khi response đóng"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not admission.try_acquire(current_app.config.get('SSE_MAX_STREAMS_PER_WORKER')):
+            current_app.logger.warning(f"SSE admission rejected user {current_user.id}: worker at capacity")
+            return overloaded_response()
+
+        try:
+            response = f(*args, **kwargs)
+        except Exception:
+            admission.release()
+            raise
+        response.call_on_close(admission.release)
+        return response
+    return decorated_function
+
+
+def sse_response(generator):
+    release_db_session()
+    return Response(
+        stream_with_context(generator),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+
+def hub_stream(listener, initial_items=()):
+    """
+    Generator chung cho mọi stream: chuyển frame từ hub ra client.
+    Heartbeat khi rảnh / đóng khi quá SSE_MAX_DURATION do timer wheel của hub gửi vào queue,
+    greenlet chỉ thức dậy khi có việc.
+    """
+    timer = None
+
+    try:
+        yield format_sse('', retry=SSE_RETRY_TIMEOUT)
+
+        for key, frame in initial_items:
+            yield frame.render(listener.topics.get(key))
+
+        timer = hub.timers.schedule(listener, SSE_HEARTBEAT_INTERVAL, SSE_MAX_DURATION)
+
+        while not listener.overflowed:
+            key, frame = listener.get()
+
+            if key is TIMER_KEY:
+                if frame != HEARTBEAT:
+                    break
+                yield HEARTBEAT_FRAME
+                continue
+
+            yield frame.render(listener.topics.get(key))
+
+        yield RECONNECT_FRAME
+
+    except GeneratorExit:
+        pass
+    finally:
+        if timer is not None:
+            hub.timers.cancel(timer)
+        listener.close()
+
+
+class CommentPayloadCache:
+    """
+    LRU: JSON đã serialize của từng comment, key = (loại, id, updated_at).
+    Sửa comment -> updated_at đổi -> key mới; xóa comment -> evict.
+    """
+
+    def __init__(self, max_size=COMMENT_PAYLOAD_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._items.get(key)
+            if payload is not None:
+                self._items.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        with self._lock:
+            self._items[key] = payload
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def evict(self, kind, comment_ids):
+        comment_ids = set(comment_ids)
+        with self._lock:
+            for key in [k for k in self._items if k[0] == kind and k[1] in comment_ids]:
+                del self._items[key]
+
+
+comment_payloads = CommentPayloadCache()
+
+
 # ============================================================
-# DASHBOARD STATS STREAM - TỐI ƯU MẠNH
+# CHANNEL FEEDERS - 1 instance / kênh / worker
 # ============================================================
-@bp.route('/dashboard-stats')
-@login_required
-def dashboard_stats_stream():
+def concerns_user(events, user_id):
+    """Bỏ sự kiện broadcast của notify_many không gửi cho user này (sự kiện không kèm 'users' -> giữ)"""
+    return any('users' not in e or user_id in e['users'] for e in events)
+
+
+class NotificationFeeder(ChannelFeeder):
+    """Kênh user:{id} - dùng chung cho mọi tab của 1 user"""
+
+    # Tab ẩn vẫn phát âm thanh / đọc thông báo -> không gom
+    defer_when_hidden = False
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.bus_channels = (realtime.user_channel(user_id), realtime.NOTIFICATIONS_BROADCAST)
+
+    def load(self):
+        self.last_check = datetime.utcnow()
+        data = get_notification_data_fast(self.user_id)
+        self.last_hash = hash_dict(data)
+        self.update_frame = Frame('notification_update', json.dumps(data))
+
+    def snapshot(self):
+        return [self.update_frame]
+
+    def on_events(self, events):
+        if not concerns_user(events, self.user_id):
+            return []
+
+        frames = []
+        now = datetime.utcnow()
+
+        # 1. Thông báo MỚI
+        for notif in get_new_notifications_fast(self.user_id, self.last_check):
+            frames.append(Frame('new_notification', json.dumps(notif)))
+        self.last_check = now
+
+        # 2. Count / danh sách chưa đọc thay đổi
+        data = get_notification_data_fast(self.user_id)
+        current_hash = hash_dict(data)
+        if current_hash != self.last_hash:
+            self.last_hash = current_hash
+            self.update_frame = Frame('notification_update', json.dumps(data))
+            frames.append(self.update_frame)
+
+        return frames
+
+
+class DashboardFeeder(ChannelFeeder):
+    """Kênh dashboard:{user_id} - badges của hub"""
+
+    def __init__(self, user_id, user_role):
+        self.user_id = user_id
+        self.user_role = user_role
+        channels = [
+            realtime.user_channel(user_id),
+            realtime.NOTIFICATIONS_BROADCAST,
+            realtime.NEWS_CHANNEL
+        ]
+        if user_role in ['director', 'accountant']:
+            channels.append(realtime.SALARY_CHANNEL)
+        self.bus_channels = tuple(channels)
+
+    def load(self):
+        stats = get_dashboard_stats_fast(self.user_id, self.user_role)
+        self.last_hash = hash_dict(stats)
+        self.stats_frame = Frame('stats_update', json.dumps(stats))
+
+    def snapshot(self):
+        return [self.stats_frame]
+
+    def on_events(self, events):
+        if not concerns_user(events, self.user_id):
+            return []
+
+        stats = get_dashboard_stats_fast(self.user_id, self.user_role)
+        current_hash = hash_dict(stats)
+
+        # CHỈ GỬI KHI CÓ THAY ĐỔI
+        if current_hash == self.last_hash:
+            return []
+        self.last_hash = current_hash
+        self.stats_frame = Frame('stats_update', json.dumps(stats))
+        return [self.stats_frame]
+
+
+class CommentFeeder(ChannelFeeder):
     """
-    SSE stream cho dashboard stats
-    CHỈ GỬI KHI CÓ THAY ĐỔI - Poll mỗi 15 giây
+    Kênh task:{id} / news:{id} - query comment mới 1 lần cho mọi người đang xem.
+    Payload không chứa thông tin riêng của từng user (can_delete tính ở client)
+    để mọi subscriber nhận cùng 1 frame.
+    """
+
+    model = None
+    parent_key = None
+    tombstone_type = None
+
+    def __init__(self, parent_id):
+        self.parent_id = parent_id
+
+    @property
+    def parent_column(self):
+        return getattr(self.model, self.parent_key)
+
+    def serialize(self, comment, related):
+        raise NotImplementedError
+
+    def load_related(self, comments):
+        """Dữ liệu phụ cho các comment cần serialize - 1 query cho cả batch"""
+        return {}
+
+    def fetch_comments(self, *criteria):
+        """Comments của kênh, user load cùng query (joinedload)"""
+        return self.model.query.options(joinedload(self.model.user)).filter(
+            self.parent_column == self.parent_id,
+            *criteria
+        ).order_by(self.model.created_at.asc()).all()
+
+    def payloads(self, comments):
+        """JSON của từng comment - lấy từ cache, chỉ serialize những comment chưa có"""
+        keys = [(self.tombstone_type, c.id, c.updated_at) for c in comments]
+        result = [comment_payloads.get(key) for key in keys]
+
+        missing = [c for c, payload in zip(comments, result) if payload is None]
+        if missing:
+            related = self.load_related(missing)
+            for i, (comment, key) in enumerate(zip(comments, keys)):
+                if result[i] is None:
+                    result[i] = json.dumps(self.serialize(comment, related))
+                    comment_payloads.set(key, result[i])
+
+        return result
+
+    def load(self):
+        self.last_check = datetime.utcnow() - timedelta(seconds=1)
+        self.known_ids = {
+            row[0] for row in db.session.query(self.model.id).filter(self.parent_column == self.parent_id)
+        }
+        self.last_tombstone_id = CommentTombstone.latest_id(self.tombstone_type, self.parent_id)
+
+    def new_comments_frame(self, comments):
+        # Ghép JSON đã cache thay vì dumps lại từng comment
+        return Frame(
+            'new_comments',
+            '{"comments": [%s], "total_count": %d}' % (', '.join(self.payloads(comments)), len(self.known_ids))
+        )
+
+    def deleted_frame(self, deleted_ids):
+        return Frame('comments_sync', json.dumps({
+            'deleted_ids': sorted(deleted_ids),
+            'total_count': len(self.known_ids)
+        }))
+
+    def catch_up(self, since):
+        """Comments tạo / xóa sau `since` (timestamp client gửi lên) - chạy 1 lần khi kết nối"""
+        frames = []
+
+        comments = self.fetch_comments(self.model.created_at > since)
+        if comments:
+            frames.append(self.new_comments_frame(comments))
+
+        deleted_ids = {
+            comment_id for _, comment_id in CommentTombstone.after(self.tombstone_type, self.parent_id, since=since)
+        }
+        if deleted_ids:
+            frames.append(self.deleted_frame(deleted_ids))
+
+        return frames
+
+    def on_events(self, events):
+        frames = []
+        event_types = {e['type'] for e in events}
+        now = datetime.utcnow()
+
+        # 1. Comments MỚI
+        new_comments = [
+            c for c in self.fetch_comments(self.model.created_at > self.last_check)
+            if c.id not in self.known_ids
+        ]
+        self.last_check = now
+
+        if new_comments:
+            self.known_ids.update(c.id for c in new_comments)
+            frames.append(self.new_comments_frame(new_comments))
+
+        # 2. Comments bị XÓA - đọc tombstone mới hơn tombstone cuối đã thấy (O(số lần xóa))
+        if event_types & {'comment_deleted', 'resync'}:
+            tombstones = CommentTombstone.after(self.tombstone_type, self.parent_id, self.last_tombstone_id)
+            if tombstones:
+                self.last_tombstone_id = tombstones[-1][0]
+                deleted_ids = {comment_id for _, comment_id in tombstones}
+                self.known_ids -= deleted_ids
+                comment_payloads.evict(self.tombstone_type, deleted_ids)
+                frames.append(self.deleted_frame(deleted_ids))
+
+        return frames
+
+
+class NewsCommentFeeder(CommentFeeder):
+    model = NewsComment
+    parent_key = 'news_id'
+    tombstone_type = 'news'
+
+    def __init__(self, news_id):
+        super().__init__(news_id)
+        self.bus_channels = (realtime.news_channel(news_id),)
+
+    def serialize(self, comment, related):
+        from app.utils import utc_to_vn
+        vn_time = utc_to_vn(comment.created_at)
+        return {
+            'id': comment.id,
+            'user_id': comment.user_id,
+            'content': comment.content,
+            'created_at': comment.created_at.isoformat(),
+            'created_at_timestamp': comment.created_at.timestamp(),
+            'created_at_display': vn_time.strftime('%d/%m/%Y %H:%M'),
+            'user': {
+                'id': comment.user_id,
+                'full_name': comment.user.full_name,
+                'role': comment.user.role,
+                'avatar': comment.user.avatar,
+                'avatar_letter': comment.user.full_name[0].upper()
+            }
+        }
+
+
+class TaskCommentFeeder(CommentFeeder):
+    model = TaskComment
+    parent_key = 'task_id'
+    tombstone_type = 'task'
+
+    def __init__(self, task_id):
+        super().__init__(task_id)
+        self.bus_channels = (realtime.task_channel(task_id),)
+
+    def serialize(self, comment, related):
+        from app.utils import utc_to_vn
+        vn_time = utc_to_vn(comment.created_at)
+
+        comment_dict = {
+            'id': comment.id,
+            'user_id': comment.user_id,
+            'content': comment.content,
+            'created_at': comment.created_at.isoformat(),
+            'created_at_timestamp': comment.created_at.timestamp(),
+            'created_at_display': vn_time.strftime('%d/%m/%Y %H:%M'),
+            'user': {
+                'id': comment.user_id,
+                'full_name': comment.user.full_name,
+                'role': comment.user.role,
+                'avatar': comment.user.avatar,
+                'avatar_letter': comment.user.full_name[0].upper()
+            },
+            'has_attachment': comment.has_attachment,
+            'attachments': []
+        }
+
+        if comment.has_attachment:
+            for att in related.get(comment.id, []):
+                comment_dict['attachments'].append({
+                    'id': att.id,
+                    'filename': att.original_filename,
+                    'file_type': att.file_type,
+                    'file_size': att.file_size,
+                    'download_url': build_url('tasks.download_comment_attachment',
+                                              task_id=self.parent_id,
+                                              comment_id=comment.id,
+                                              attachment_id=att.id)
+                })
+
+        return comment_dict
+
+    def load_related(self, comments):
+        """Attachments của cả batch trong 1 query (thay cho comment.attachments.all() từng comment)"""
+        comment_ids = [c.id for c in comments if c.has_attachment]
+        if not comment_ids:
+            return {}
+
+        attachments = {}
+        for att in TaskCommentAttachment.query.filter(
+            TaskCommentAttachment.comment_id.in_(comment_ids)
+        ).order_by(TaskCommentAttachment.uploaded_at.asc()):
+            attachments.setdefault(att.comment_id, []).append(att)
+        return attachments
+
+
+def build_url(endpoint, **values):
+    """url_for không cần request context (feeder chạy nền)"""
+    adapter = current_app.url_map.bind('', script_name=current_app.config.get('APPLICATION_ROOT') or '/')
+    return adapter.build(endpoint, values)
+
+
+# ============================================================
+# TOPICS - ánh xạ tên topic của client -> kênh hub
+# ============================================================
+def can_view_task_comments(task_id, user_id, user_role):
+    task = Task.query.get(task_id)
+    if not task:
+        return False
+
+    assignment = TaskAssignment.query.filter_by(
+        task_id=task_id,
+        user_id=user_id,
+        accepted=True
+    ).first()
+
+    return bool(assignment) or task.creator_id == user_id or user_role in ['director', 'manager']
+
+
+def get_last_event_id():
+    """
+    Id cuối client đã nhận: header Last-Event-ID (EventSource tự reconnect)
+    hoặc ?last_event_id= (sse-manager.js tạo EventSource mới khi reconnect)
+    """
+    raw = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def subscribe_topic(topic, listener=None, multiplexed=False):
+    """
+    Đăng ký `topic` (notifications | dashboard | task:<id> | news:<id>) cho user hiện tại.
+    Trả về listener, hoặc None nếu topic không hợp lệ / không có quyền.
     """
     user_id = current_user.id
     user_role = current_user.role
+    options = {
+        'listener': listener,
+        'topic': topic if multiplexed else None,
+        'last_event_id': get_last_event_id()
+    }
 
-    def generate():
-        last_hash = None
-        last_heartbeat = time.time()
-        start_time = time.time()
+    if topic == 'notifications':
+        return hub.subscribe(realtime.user_channel(user_id), lambda: NotificationFeeder(user_id), **options)
 
-        try:
-            yield format_sse('', retry=SSE_RETRY_TIMEOUT)
-
-            # Initial data
-            initial_data = get_dashboard_stats_fast(user_id, user_role)
-            last_hash = hash_dict(initial_data)
-            yield format_sse(json.dumps(initial_data), event='stats_update')
-
-            while True:
-                if time.time() - start_time > SSE_MAX_DURATION:
-                    yield format_sse(
-                        json.dumps({'type': 'reconnect'}),
-                        event='close'
-                    )
-                    break
+    if topic == 'dashboard':
+        return hub.subscribe(f'dashboard:{user_id}', lambda: DashboardFeeder(user_id, user_role), **options)
 
-                try:
-                    time.sleep(DASHBOARD_POLL_INTERVAL)
+    kind, _, raw_id = topic.partition(':')
+    if not raw_id.isdigit():
+        return None
+    object_id = int(raw_id)
 
-                    # Chỉ query khi cần
-                    stats = get_dashboard_stats_fast(user_id, user_role)
-                    current_hash = hash_dict(stats)
+    if kind == 'news':
+        return hub.subscribe(realtime.news_channel(object_id), lambda: NewsCommentFeeder(object_id), **options)
 
-                    # CHỈ GỬI KHI CÓ THAY ĐỔI
-                    if current_hash != last_hash:
-                        last_hash = current_hash
-                        yield format_sse(json.dumps(stats), event='stats_update')
+    if kind == 'task':
+        if not can_view_task_comments(object_id, user_id, user_role):
+            return None
+        return hub.subscribe(realtime.task_channel(object_id), lambda: TaskCommentFeeder(object_id), **options)
 
-                    # Heartbeat
-                    if time.time() - last_heartbeat >= SSE_HEARTBEAT_INTERVAL:
-                        last_heartbeat = time.time()
-                        yield format_sse(
-                            json.dumps({'type': 'heartbeat'}),
-                            event='heartbeat'
-                        )
+    return None
 
-                except Exception as e:
-                    current_app.logger.error(f"SSE stats error: {e}")
-                    time.sleep(2)
 
-        except GeneratorExit:
-            pass
+def comments_catch_up(listener):
+    """
+    Gửi bù comments tạo giữa lúc render trang (hoặc lúc mất kết nối) và lúc kết nối SSE.
+    Kênh đã replay từ ring buffer thì bỏ qua.
+    """
+    last_event_id = get_last_event_id()
+    if last_event_id is not None:
+        # Event id là mốc thời gian (ms, UTC) - lùi 1 khoảng để bù commit chậm, client tự lọc trùng
+        since = datetime.utcfromtimestamp(last_event_id / 1000) - timedelta(seconds=CATCH_UP_MARGIN)
+    else:
+        last_timestamp = request.args.get('last_timestamp', type=float, default=0)
+        if last_timestamp <= 0:
+            return []
+        since = datetime.fromtimestamp(last_timestamp)
 
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive',
-            'Content-Type': 'text/event-stream'
-        }
-    )
+    items = []
+    for channel in listener.channels:
+        if isinstance(channel.feeder, CommentFeeder) and not listener.replayed.get(channel.key):
+            items.extend((channel.key, frame) for frame in channel.feeder.catch_up(since))
+    return items
+
+
+def client_key(client_id):
+    """Client id của tab, gắn với user để không ai đổi trạng thái tab của người khác"""
+    return f'{current_user.id}:{client_id}' if client_id else None
+
+
+def open_stream(listener, catch_up=False):
+    """
+    Mở response SSE cho listener đã đăng ký kênh.
+    Listener được gỡ khỏi kênh khi response đóng - kể cả khi client ngắt trước lần next() đầu tiên
+    (generator chưa chạy nên finally của hub_stream không bao giờ tới).
+    """
+    try:
+        initial_items = comments_catch_up(listener) if catch_up else ()
+        hub.register_client(
+            listener,
+            client_key(request.args.get('client_id')),
+            hidden=request.args.get('hidden') == '1'
+        )
+        response = sse_response(hub_stream(listener, initial_items))
+    except Exception:
+        listener.close()
+        raise
+    response.call_on_close(listener.close)
+    return response
+
+
+def error_stream(message):
+    return sse_response(iter([format_sse(json.dumps({'error': message}), event='error')]))
 
 
 # ============================================================
-# NEWS COMMENTS STREAM - TỐI ƯU
+# MULTIPLEXED STREAM - 1 kết nối / tab cho mọi topic
 # ============================================================
+@bp.route('/stream')
+@login_required
+@admitted_stream
+def multiplexed_stream():
+    """
+    SSE stream gộp nhiều topic: /sse/stream?topics=notifications,dashboard,task:42
+    Event name có prefix topic, vd: "notifications.new_notification", "task:42.new_comments"
+    """
+    topics = [t.strip() for t in request.args.get('topics', '').split(',') if t.strip()]
+    if not topics:
+        return error_stream('No topics')
+
+    listener = None
+    rejected = []
+    for topic in dict.fromkeys(topics):
+        subscribed = subscribe_topic(topic, listener=listener, multiplexed=True)
+        if subscribed is None:
+            rejected.append(topic)
+        else:
+            listener = subscribed
+
+    if listener is None:
+        return error_stream('Permission denied')
+
+    if rejected:
+        current_app.logger.warning(f"SSE stream rejected topics for user {current_user.id}: {rejected}")
+
+    return open_stream(listener, catch_up=True)
+
+
+@bp.route('/control', methods=['POST'])
+@login_required
+def stream_control():
+    """
+    Gợi ý từ client: {client_id, hidden}. Kênh mà mọi người xem đều ẩn tab
+    sẽ giãn nhịp query cho tới khi có tab hiện lại.
+    """
+    data = request.get_json(silent=True) or {}
+    key = client_key(data.get('client_id'))
+    if not key:
+        return jsonify({'success': False, 'error': 'Missing client_id'}), 400
+
+    # Qua event bus: request này có thể rơi vào worker khác với worker giữ stream
+    realtime.publish(db.session, CONTROL_CHANNEL, {
+        'type': 'visibility',
+        'client': key,
+        'hidden': bool(data.get('hidden'))
+    })
+    db.session.commit()
+
+    return jsonify({'success': True})
+
+
+# ============================================================
+# PER-TOPIC STREAMS - giữ lại để tương thích client cũ
+# ============================================================
+@bp.route('/notifications')
+@login_required
+@admitted_stream
+def notifications_stream():
+    """
+    SSE stream cho notifications
+    CHỈ GỬI KHI CÓ THAY ĐỔI
+    """
+    return open_stream(subscribe_topic('notifications'))
+
+
+@bp.route('/dashboard-stats')
+@login_required
+@admitted_stream
+def dashboard_stats_stream():
+    """
+    SSE stream cho dashboard stats
+    CHỈ GỬI KHI CÓ THAY ĐỔI - tính lại khi có sự kiện notification / news / salary
+    """
+    return open_stream(subscribe_topic('dashboard'))
+
+
 @bp.route('/news/<int:news_id>/comments')
 @login_required
+@admitted_stream
 def news_comments_stream(news_id):
     """
     SSE stream cho news comments
     CHỈ GỬI KHI CÓ COMMENT MỚI HOẶC XÓA
     """
-    user_id = current_user.id
-    user_role = current_user.role
+    listener = subscribe_topic(f'news:{news_id}')
+    return open_stream(listener, catch_up=True)
 
-    def generate():
-        from app.utils import utc_to_vn
-
-        last_timestamp = request.args.get('last_timestamp', type=float, default=0)
-        if last_timestamp > 0:
-            last_check = datetime.fromtimestamp(last_timestamp)
-        else:
-            last_check = datetime.utcnow() - timedelta(seconds=1)
 
-        last_comment_ids = set()
-        last_heartbeat = time.time()
-        start_time = time.time()
-
-        try:
-            yield format_sse('', retry=SSE_RETRY_TIMEOUT)
+@bp.route('/tasks/<int:task_id>/comments')
+@login_required
+@admitted_stream
+def task_comments_stream(task_id):
+    """
+    SSE stream cho task comments
+    Tương tự news comments
+    """
+    if not Task.query.get(task_id):
+        return error_stream('Task not found')
 
-            # Initial: lấy danh sách comment IDs hiện tại
-            current_comments = NewsComment.query.filter_by(news_id=news_id).all()
-            last_comment_ids = {c.id for c in current_comments}
+    listener = subscribe_topic(f'task:{task_id}')
+    if listener is None:
+        return error_stream('Permission denied')
 
-            while True:
-                if time.time() - start_time > SSE_MAX_DURATION:
-                    yield format_sse(json.dumps({'type': 'reconnect'}), event='close')
-                    break
+    return open_stream(listener, catch_up=True)
 
-                try:
-                    time.sleep(COMMENTS_POLL_INTERVAL)
-                    now = datetime.utcnow()
-
-                    # 1. Check comments MỚI
-                    new_comments = NewsComment.query.filter(
-                        NewsComment.news_id == news_id,
-                        NewsComment.created_at > last_check
-                    ).order_by(NewsComment.created_at.asc()).all()
-
-                    if new_comments:
-                        comments_data = []
-                        for comment in new_comments:
-                            if comment.id not in last_comment_ids:
-                                vn_time = utc_to_vn(comment.created_at)
-                                comments_data.append({
-                                    'id': comment.id,
-                                    'content': comment.content,
-                                    'created_at': comment.created_at.isoformat(),
-                                    'created_at_timestamp': comment.created_at.timestamp(),
-                                    'created_at_display': vn_time.strftime('%d/%m/%Y %H:%M'),
-                                    'user': {
-                                        'id': comment.user_id,
-                                        'full_name': comment.user.full_name,
-                                        'role': comment.user.role,
-                                        'avatar_letter': comment.user.full_name[0].upper()
-                                    },
-                                    'can_delete': comment.user_id == user_id or user_role == 'director'
-                                })
-                                last_comment_ids.add(comment.id)
-
-                        if comments_data:
-                            yield format_sse(
-                                json.dumps({
-                                    'comments': comments_data,
-                                    'total_count': len(last_comment_ids)
-                                }),
-                                event='new_comments'
-                            )
-                        last_check = now
-
-                    # 2. Check comments bị XÓA (mỗi 10 giây)
-                    if int(time.time()) % 10 < COMMENTS_POLL_INTERVAL:
-                        current_ids = {c.id for c in NewsComment.query.filter_by(news_id=news_id).all()}
-                        deleted_ids = last_comment_ids - current_ids
-
-                        if deleted_ids:
-                            last_comment_ids = current_ids
-                            yield format_sse(
-                                json.dumps({
-                                    'existing_ids': list(current_ids),
-                                    'deleted_ids': list(deleted_ids),
-                                    'total_count': len(current_ids)
-                                }),
-                                event='comments_sync'
-                            )
-
-                    # 3. Heartbeat
-                    if time.time() - last_heartbeat >= SSE_HEARTBEAT_INTERVAL:
-                        last_heartbeat = time.time()
-                        yield format_sse(json.dumps({'type': 'heartbeat'}), event='heartbeat')
-
-                except Exception as e:
-                    current_app.logger.error(f"SSE comments error: {e}")
-                    time.sleep(2)
-
-        except GeneratorExit:
-            pass
 
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive',
-            'Content-Type': 'text/event-stream'
-        }
-    )
+# ============================================================
+# ADMIN - theo dõi tải SSE / pool DB của worker hiện tại
+# ============================================================
+@bp.route('/admin/stats')
+@login_required
+@role_required(['director'])
+def admin_stats():
+    """Số kênh / kết nối SSE và mức chiếm dụng pool DB (theo worker)"""
+    pool = db_metrics.get_metrics()
+    if request.args.get('reset_peak'):
+        pool.reset_peak()
+
+    return jsonify({
+        'session_mode': current_app.config.get('SSE_DB_SESSION_MODE', 'per_batch'),
+        'hub': hub.stats(),
+        'streams': admission.stats(),
+        'bus_subscribers': realtime.get_bus().subscriber_count(),
+        'pool': pool.snapshot(),
+        'push': webpush.get_dispatcher().stats() if webpush.is_enabled() else None,
+        'outbox': dict(notification_outbox.get_worker().stats(), pending=notification_outbox.pending_count())
+        if notification_outbox.is_enabled() else None,
+        'cache': cache.stats()
+    })
 
 
 # ============================================================
@@ -377,11 +856,8 @@ def get_dashboard_stats_fast(user_id: int, user_role: str) -> dict:
     """
     from sqlalchemy import func, exists
 
-    # 1. Notification counts (optimized)
-    unread_notifications = db.session.query(func.count(Notification.id)).filter(
-        Notification.user_id == user_id,
-        Notification.read == False
-    ).scalar() or 0
+    # 1. Notification counts - đọc counter theo khóa chính
+    unread_notifications = notification_service.get_unread_count(user_id)
 
     # 2. Unconfirmed news (optimized)
     unconfirmed_news = db.session.query(func.count(News.id)).filter(
@@ -420,157 +896,3 @@ def get_dashboard_stats_fast(user_id: int, user_role: str) -> dict:
     }
 
 
-@bp.route('/tasks/<int:task_id>/comments')
-@login_required
-def task_comments_stream(task_id):
-    """
-    SSE stream cho task comments
-    Tương tự news comments
-    """
-    user_id = current_user.id
-    user_role = current_user.role
-
-    def generate():
-        from app.utils import utc_to_vn
-        from app.models import TaskComment, Task, TaskAssignment
-        from flask import url_for  # ✅ THÊM IMPORT
-
-        # Check permission
-        task = Task.query.get(task_id)
-        if not task:
-            yield format_sse(json.dumps({'error': 'Task not found'}), event='error')
-            return
-
-        assignment = TaskAssignment.query.filter_by(
-            task_id=task_id,
-            user_id=user_id,
-            accepted=True
-        ).first()
-
-        if not assignment and task.creator_id != user_id and user_role not in ['director', 'manager']:
-            yield format_sse(json.dumps({'error': 'Permission denied'}), event='error')
-            return
-
-        last_timestamp = request.args.get('last_timestamp', type=float, default=0)
-        if last_timestamp > 0:
-            last_check = datetime.fromtimestamp(last_timestamp)
-        else:
-            last_check = datetime.utcnow() - timedelta(seconds=1)
-
-        last_comment_ids = set()
-        last_heartbeat = time.time()
-        start_time = time.time()
-
-        try:
-            yield format_sse('', retry=SSE_RETRY_TIMEOUT)
-
-            # Initial: lấy danh sách comment IDs hiện tại
-            current_comments = TaskComment.query.filter_by(task_id=task_id).all()
-            last_comment_ids = {c.id for c in current_comments}
-
-            while True:
-                if time.time() - start_time > SSE_MAX_DURATION:
-                    yield format_sse(json.dumps({'type': 'reconnect'}), event='close')
-                    break
-
-                try:
-                    time.sleep(COMMENTS_POLL_INTERVAL)
-                    now = datetime.utcnow()
-
-                    # 1. Check comments MỚI
-                    new_comments = TaskComment.query.filter(
-                        TaskComment.task_id == task_id,
-                        TaskComment.created_at > last_check
-                    ).order_by(TaskComment.created_at.asc()).all()
-
-                    # Trong phần xử lý new_comments
-                    if new_comments:
-                        comments_data = []
-                        for comment in new_comments:
-                            if comment.id not in last_comment_ids:
-                                vn_time = utc_to_vn(comment.created_at)
-
-                                comment_dict = {
-                                    'id': comment.id,
-                                    'user_id': comment.user_id,
-                                    'content': comment.content,
-                                    'created_at': comment.created_at.isoformat(),
-                                    'created_at_timestamp': comment.created_at.timestamp(),
-                                    'created_at_display': vn_time.strftime('%d/%m/%Y %H:%M'),
-                                    'user': {
-                                        'id': comment.user_id,
-                                        'full_name': comment.user.full_name,
-                                        'role': comment.user.role,
-                                        'avatar': comment.user.avatar,
-                                        'avatar_letter': comment.user.full_name[0].upper()
-                                    },
-                                    'can_delete': comment.user_id == user_id or user_role == 'director',
-                                    'has_attachment': comment.has_attachment,
-                                    'attachments': []
-                                }
-
-                                if comment.has_attachment:
-                                    for att in comment.attachments.all():
-                                        comment_dict['attachments'].append({
-                                            'id': att.id,
-                                            'filename': att.original_filename,
-                                            'file_type': att.file_type,
-                                            'file_size': att.file_size,
-                                            'download_url': url_for('tasks.download_comment_attachment',
-                                                                    task_id=task_id,
-                                                                    comment_id=comment.id,
-                                                                    attachment_id=att.id,
-                                                                    _external=False)
-                                        })
-
-                                comments_data.append(comment_dict)
-                                last_comment_ids.add(comment.id)
-
-                        if comments_data:
-                            yield format_sse(
-                                json.dumps({
-                                    'comments': comments_data,
-                                    'total_count': len(last_comment_ids)
-                                }),
-                                event='new_comments'
-                            )
-                        last_check = now
-
-                    # 2. Check comments bị XÓA
-                    if int(time.time()) % 10 < COMMENTS_POLL_INTERVAL:
-                        current_ids = {c.id for c in TaskComment.query.filter_by(task_id=task_id).all()}
-                        deleted_ids = last_comment_ids - current_ids
-
-                        if deleted_ids:
-                            last_comment_ids = current_ids
-                            yield format_sse(
-                                json.dumps({
-                                    'existing_ids': list(current_ids),
-                                    'deleted_ids': list(deleted_ids),
-                                    'total_count': len(current_ids)
-                                }),
-                                event='comments_sync'
-                            )
-
-                    # 3. Heartbeat
-                    if time.time() - last_heartbeat >= SSE_HEARTBEAT_INTERVAL:
-                        last_heartbeat = time.time()
-                        yield format_sse(json.dumps({'type': 'heartbeat'}), event='heartbeat')
-
-                except Exception as e:
-                    current_app.logger.error(f"SSE task comments error: {e}")
-                    time.sleep(2)
-
-        except GeneratorExit:
-            pass
-
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive',
-            'Content-Type': 'text/event-stream'
-        }
-    )
\ No newline at end of file
@@ -0,0 +1,450 @@
+"""
+SSE Hub - fan-out theo kênh trong 1 worker
+- Mỗi kênh (vd: task:42, news:7, user:3) chỉ có 1 feeder subscribe event bus và query DB
+- Feeder format SSE frame 1 lần rồi broadcast cho tất cả browser đang xem kênh đó
+=> Số query tỉ lệ với số kênh đang hoạt động, không phải số kết nối
+
+Mỗi frame broadcast có event id tăng dần (theo ms) và được giữ trong ring buffer của kênh:
+client reconnect với Last-Event-ID chỉ nhận lại các frame bị lỡ thay vì snapshot đầy đủ.
+
+Tab ẩn (client báo qua /sse/control): kênh mà mọi người xem đều đang ẩn sẽ gom sự kiện lại
+và chỉ query theo nhịp giãn dần (HIDDEN_BACKOFF_MIN -> HIDDEN_BACKOFF_MAX), tab hiện lại thì cập nhật ngay.
+
+Heartbeat / hết hạn của mọi stream do 1 timer wheel / worker phát theo lô,
+greenlet của stream chỉ thức dậy khi có frame hoặc tín hiệu từ wheel.
+"""
+
+from flask import current_app
+from app import realtime
+from collections import deque
+import queue
+import threading
+import time
+
+LISTENER_QUEUE_SIZE = 200
+CHANNEL_IDLE_TIMEOUT = 30
+REPLAY_BUFFER_SIZE = 100
+HIDDEN_BACKOFF_MIN = 30
+HIDDEN_BACKOFF_MAX = 300
+
+# Kênh event bus cho gợi ý hiển thị của tab (POST /sse/control có thể rơi vào worker khác)
+CONTROL_CHANNEL = 'sse_control'
+
+# Timer wheel: độ phân giải 1 giây, 64 slot (timer xa hơn 64s quay thêm vòng)
+WHEEL_TICK = 1
+WHEEL_SIZE = 64
+
+# Tín hiệu timer đẩy vào queue của listener: (TIMER_KEY, HEARTBEAT | EXPIRED)
+TIMER_KEY = None
+HEARTBEAT = 'heartbeat'
+EXPIRED = 'expired'
+
+
+class ChannelFeeder:
+    """
+    Nguồn dữ liệu của 1 kênh. Lớp con cài đặt:
+    - bus_channels: các kênh event bus cần nghe
+    - load(): nạp trạng thái ban đầu (chạy trong app context)
+    - snapshot(): frames gửi ngay cho subscriber mới (khi không replay được)
+    - on_events(events): trả về danh sách frames cần broadcast
+    """
+
+    bus_channels = ()
+    # Gom sự kiện khi mọi người xem kênh đều ẩn tab
+    defer_when_hidden = True
+
+    def load(self):
+        pass
+
+    def snapshot(self):
+        return []
+
+    def on_events(self, events):
+        return []
+
+
+class Listener:
+    """
+    Hàng đợi frame của 1 kết nối SSE - có thể gắn vào nhiều kênh (stream multiplex).
+    Phần tử trong queue là (channel_key, frame).
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.channels = []
+        self.topics = {}
+        self.replayed = {}
+        self.client_id = None
+        self.hidden = False
+        self.queue = queue.Queue(maxsize=LISTENER_QUEUE_SIZE)
+        self.overflowed = False
+        self.last_sent = time.monotonic()
+
+    def put(self, key, frame):
+        if key is not TIMER_KEY:
+            self.last_sent = time.monotonic()
+        try:
+            self.queue.put_nowait((key, frame))
+        except queue.Full:
+            # Client quá chậm - đánh dấu để stream đóng và client reconnect lại
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def feeder(self, key):
+        for channel in self.channels:
+            if channel.key == key:
+                return channel.feeder
+        return None
+
+    def close(self):
+        # Gọi được nhiều lần: finally của generator + call_on_close của response
+        for channel in self.channels:
+            channel.remove_listener(self)
+        self.hub.unregister_client(self)
+
+
+class _Timer:
+    __slots__ = ('listener', 'heartbeat_ticks', 'expires_tick', 'due_tick', 'cancelled')
+
+    def __init__(self, listener, heartbeat_ticks, expires_tick):
+        self.listener = listener
+        self.heartbeat_ticks = heartbeat_ticks
+        self.expires_tick = expires_tick
+        self.due_tick = None
+        self.cancelled = False
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: 1 thread / worker, mỗi tick chỉ xử lý 1 slot.
+    Heartbeat chỉ gửi khi listener rảnh >= chu kỳ heartbeat (có frame thật thì lùi lại).
+    """
+
+    def __init__(self, tick=WHEEL_TICK, size=WHEEL_SIZE):
+        self.tick = tick
+        self.size = size
+        self.current_tick = 0
+        self._slots = [set() for _ in range(size)]
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, listener, heartbeat_interval, max_duration):
+        """Đăng ký heartbeat + hết hạn cho 1 stream, trả về handle để cancel"""
+        self._ensure_thread()
+        with self._lock:
+            timer = _Timer(
+                listener,
+                max(1, int(heartbeat_interval / self.tick)),
+                self.current_tick + max(1, int(max_duration / self.tick))
+            )
+            self._place(timer, self.current_tick + timer.heartbeat_ticks)
+        return timer
+
+    def cancel(self, timer):
+        with self._lock:
+            timer.cancelled = True
+            self._slots[timer.due_tick % self.size].discard(timer)
+
+    def pending(self):
+        with self._lock:
+            return sum(len(slot) for slot in self._slots)
+
+    def _place(self, timer, due_tick):
+        timer.due_tick = min(due_tick, timer.expires_tick)
+        self._slots[timer.due_tick % self.size].add(timer)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # Thread không có app context: giữ app của stream đầu tiên để ghi log
+            self._thread = threading.Thread(
+                target=self._run, args=(current_app._get_current_object(),), name='sse-timer-wheel', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, app):
+        next_at = time.monotonic()
+        while True:
+            next_at += self.tick
+            time.sleep(max(0, next_at - time.monotonic()))
+            try:
+                self._advance()
+            except Exception:
+                app.logger.exception("SSE timer wheel error")
+
+    def _advance(self):
+        signals = []
+        now = time.monotonic()
+
+        with self._lock:
+            self.current_tick += 1
+            tick = self.current_tick
+            slot = self._slots[tick % self.size]
+
+            for timer in [t for t in slot if t.due_tick <= tick]:
+                slot.discard(timer)
+                if timer.cancelled:
+                    continue
+
+                if tick >= timer.expires_tick:
+                    signals.append((timer.listener, EXPIRED))
+                    continue
+
+                idle_ticks = int((now - timer.listener.last_sent) / self.tick)
+                if idle_ticks >= timer.heartbeat_ticks:
+                    signals.append((timer.listener, HEARTBEAT))
+                    self._place(timer, tick + timer.heartbeat_ticks)
+                else:
+                    # Vừa có frame thật - hẹn lại theo lần gửi cuối
+                    self._place(timer, tick + timer.heartbeat_ticks - idle_ticks)
+
+        # Đẩy tín hiệu ngoài lock (cả lô trong 1 lần thức)
+        for listener, signal in signals:
+            listener.put(TIMER_KEY, signal)
+
+
+class HubChannel:
+    def __init__(self, hub, key, feeder):
+        self.hub = hub
+        self.key = key
+        self.feeder = feeder
+        self.listeners = set()
+        self.history = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self.replay_from = None
+        self.closed = False
+        self.deferring = False
+        self._subscription = None
+        self._thread = None
+
+    def start(self, app):
+        """Subscribe bus TRƯỚC khi load để không lỡ sự kiện, sau đó chạy feeder nền"""
+        self.app = app
+        self._subscription = realtime.subscribe(*self.feeder.bus_channels)
+        self.feeder.load()
+
+        with self.hub._lock:
+            # Chỉ replay được các frame sinh ra sau thời điểm này
+            self.replay_from = self.hub._next_event_id()
+            for frame in self.feeder.snapshot():
+                if frame.id is None:
+                    frame.id = self.replay_from
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'sse-hub-{self.key}',
+            daemon=True
+        )
+        self._thread.start()
+
+    def can_replay(self, last_event_id):
+        """Ring buffer còn đủ mọi frame có id > last_event_id"""
+        return last_event_id is not None and last_event_id >= self.replay_from
+
+    def add_listener(self, listener, last_event_id=None):
+        """Gọi khi đang giữ hub._lock - không xen kẽ với broadcast"""
+        if self.can_replay(last_event_id):
+            frames = [frame for frame in self.history if frame.id > last_event_id]
+            listener.replayed[self.key] = True
+        else:
+            frames = self.feeder.snapshot()
+            listener.replayed[self.key] = False
+
+        for frame in frames:
+            listener.put(self.key, frame)
+        self.listeners.add(listener)
+        listener.channels.append(self)
+        if not listener.hidden:
+            self.wake()
+        return listener
+
+    def remove_listener(self, listener):
+        with self.hub._lock:
+            self.listeners.discard(listener)
+
+    def broadcast(self, frames):
+        # Gán id + đẩy vào queue trong cùng lock: thứ tự id trong mọi listener
+        # (kể cả stream multiplex nhiều kênh) luôn tăng dần
+        with self.hub._lock:
+            for frame in frames:
+                frame.id = self.hub._next_event_id()
+                if len(self.history) == self.history.maxlen:
+                    self.replay_from = self.history[0].id
+                self.history.append(frame)
+                for listener in self.listeners:
+                    listener.put(self.key, frame)
+
+    def wake(self):
+        """Có người xem hiện lại tab - xử lý ngay các sự kiện đang gom"""
+        if self.deferring and self._subscription is not None:
+            self._subscription.put('*', {'type': 'wake'})
+
+    def _run(self):
+        pending = []
+        flush_at = None
+        backoff = HIDDEN_BACKOFF_MIN
+
+        try:
+            while True:
+                timeout = CHANNEL_IDLE_TIMEOUT
+                if flush_at is not None:
+                    timeout = max(0, min(timeout, flush_at - time.time()))
+                event = self._subscription.get(timeout=timeout)
+
+                with self.hub._lock:
+                    if not self.listeners:
+                        # Không còn ai xem -> dừng kênh
+                        self.closed = True
+                        if self.hub._channels.get(self.key) is self:
+                            del self.hub._channels[self.key]
+                        return
+                    dormant = self.feeder.defer_when_hidden and all(l.hidden for l in self.listeners)
+
+                if event is not None:
+                    pending.append(event)
+                    pending.extend(self._subscription.drain())
+                if not pending:
+                    continue
+
+                if dormant:
+                    # Tab ẩn: chỉ query theo nhịp giãn dần, không theo từng sự kiện
+                    if flush_at is None:
+                        flush_at = time.time() + backoff
+                        self.deferring = True
+                    if time.time() < flush_at:
+                        continue
+                    backoff = min(backoff * 2, HIDDEN_BACKOFF_MAX)
+                else:
+                    backoff = HIDDEN_BACKOFF_MIN
+
+                events, pending = pending, []
+                flush_at = None
+                self.deferring = False
+
+                with self.app.app_context():
+                    try:
+                        frames = self.feeder.on_events(events)
+                    except Exception as e:
+                        current_app.logger.error(f"SSE hub {self.key} error: {e}")
+                        frames = []
+                if frames:
+                    self.broadcast(frames)
+        finally:
+            self._subscription.close()
+
+
+class SSEHub:
+    """Registry kênh của worker hiện tại"""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._last_event_id = 0
+        self._clients = {}
+        self._control = None
+        self.timers = TimerWheel()
+
+    def _next_event_id(self):
+        """Event id tăng dần theo ms - gọi khi đang giữ self._lock"""
+        self._last_event_id = max(int(time.time() * 1000), self._last_event_id + 1)
+        return self._last_event_id
+
+    def subscribe(self, key, feeder_factory, listener=None, topic=None, last_event_id=None):
+        """
+        Đăng ký 1 kết nối vào kênh `key`, tạo kênh (và feeder) nếu chưa có.
+        Truyền `listener` có sẵn để gộp nhiều kênh vào 1 kết nối; `topic` là
+        tên client dùng cho kênh này (prefix event name khi multiplex).
+        `last_event_id`: id cuối client đã nhận - replay phần bị lỡ nếu buffer còn đủ.
+        Phải gọi trong app/request context.
+        """
+        if listener is None:
+            listener = Listener(self)
+        listener.topics[key] = topic
+
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is not None and not channel.closed:
+                return channel.add_listener(listener, last_event_id)
+
+        # Tạo kênh mới ngoài lock (load có query DB)
+        new_channel = HubChannel(self, key, feeder_factory())
+        new_channel.start(current_app._get_current_object())
+
+        with self._lock:
+            channel = self._channels.get(key)
+            # Nếu request khác đã tạo kênh trước, kênh thừa sẽ tự dừng vì không có listener
+            if channel is None or channel.closed:
+                self._channels[key] = new_channel
+                channel = new_channel
+            return channel.add_listener(listener, last_event_id)
+
+    def register_client(self, listener, client_id, hidden=False):
+        """Gắn client id (1 / tab, do sse-manager.js sinh) để nhận gợi ý ẩn/hiện tab"""
+        if not client_id:
+            return
+        listener.client_id = client_id
+        listener.hidden = hidden
+        with self._lock:
+            self._clients[client_id] = listener
+        self._ensure_control()
+
+    def unregister_client(self, listener):
+        with self._lock:
+            if listener.client_id and self._clients.get(listener.client_id) is listener:
+                del self._clients[listener.client_id]
+
+    def set_visibility(self, client_id, hidden):
+        with self._lock:
+            listener = self._clients.get(client_id)
+            if listener is None:
+                return
+            listener.hidden = hidden
+            channels = list(listener.channels)
+        if not hidden:
+            for channel in channels:
+                channel.wake()
+
+    def _ensure_control(self):
+        """1 subscription CONTROL_CHANNEL / worker, tạo khi có client đầu tiên"""
+        if self._control is not None and self._control.is_alive():
+            return
+        with self._lock:
+            if self._control is not None and self._control.is_alive():
+                return
+            subscription = realtime.subscribe(CONTROL_CHANNEL)
+            self._control = threading.Thread(
+                target=self._run_control,
+                args=(subscription,),
+                name='sse-hub-control',
+                daemon=True
+            )
+            self._control.start()
+
+    def _run_control(self, subscription):
+        try:
+            while True:
+                event = subscription.get()
+                if event.get('type') == 'visibility':
+                    self.set_visibility(event.get('client'), bool(event.get('hidden')))
+        finally:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'listeners': sum(len(c.listeners) for c in self._channels.values()),
+                'hidden_clients': sum(1 for l in self._clients.values() if l.hidden),
+                'deferring_channels': sum(1 for c in self._channels.values() if c.deferring),
+                'timers': self.timers.pending()
+            }
+
+
+hub = SSEHub()
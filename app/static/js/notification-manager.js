@@ -18,6 +18,9 @@ class NotificationManager {
         this.useSSE = true;
         this.sseConnected = false;
 
+        // Cursor của /notifications/sync (id thông báo chưa đọc lớn nhất đã nhận)
+        this.syncCursor = 0;
+
         // Auto-reconnect tracking
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
@@ -26,6 +29,10 @@ class NotificationManager {
         this.toggleButton = null;
         this.settingsModal = null;
 
+        // Web Push (app/webpush.py) - báo cả khi đã đóng tab
+        this.pushSupported = 'serviceWorker' in navigator && 'PushManager' in window && 'Notification' in window;
+        this.pushSubscribed = false;
+
         this.init();
     }
 
@@ -87,6 +94,7 @@ class NotificationManager {
         this.sound.init();
         this.createToggleButton();
         this.createSettingsModal();
+        this.initPush();
         this.startRealtimeUpdates();
 
         // Cleanup on page unload
@@ -163,6 +171,12 @@ class NotificationManager {
                                 <i class="bi bi-file-text"></i> Đọc cả nội dung chi tiết
                             </label>
                         </div>
+                        <div class="form-check form-switch mb-3 d-none" id="pushToggleWrapper">
+                            <input class="form-check-input" type="checkbox" id="pushToggle">
+                            <label class="form-check-label" for="pushToggle">
+                                <i class="bi bi-phone-vibrate"></i> Thông báo đẩy (cả khi đóng tab)
+                            </label>
+                        </div>
                         <hr>
                         <div class="mb-3">
                             <label for="ttsSpeed" class="form-label">
@@ -226,6 +240,13 @@ class NotificationManager {
 
         document.getElementById('testNotification').addEventListener('click', () => this.testNotification());
 
+        document.getElementById('pushToggle').addEventListener('change', async (e) => {
+            e.target.disabled = true;
+            const ok = e.target.checked ? await this.enablePush() : await this.disablePush();
+            if (!ok) e.target.checked = this.pushSubscribed;
+            e.target.disabled = false;
+        });
+
         document.getElementById('clearHistory').addEventListener('click', () => {
             if (confirm('Xóa lịch sử? Thông báo cũ sẽ phát lại.')) {
                 this.seenNotificationIds.clear();
@@ -295,6 +316,83 @@ class NotificationManager {
         }
     }
 
+    // ============================================================
+    // WEB PUSH
+    // ============================================================
+    async initPush() {
+        if (!this.pushSupported) return;
+        try {
+            const response = await fetch('/notifications/push/config');
+            if (!response.ok) return;
+            this.pushConfig = await response.json();
+            if (!this.pushConfig.enabled || !this.pushConfig.public_key) return;
+
+            const registration = await navigator.serviceWorker.ready;
+            const subscription = await registration.pushManager.getSubscription();
+            this.pushSubscribed = !!subscription && Notification.permission === 'granted';
+            // Gửi lại subscription mỗi lần tải trang (endpoint có thể đã đổi / đổi user đăng nhập)
+            if (this.pushSubscribed) await this.postPush('/notifications/push/subscribe', subscription.toJSON());
+
+            document.getElementById('pushToggleWrapper').classList.remove('d-none');
+            document.getElementById('pushToggle').checked = this.pushSubscribed;
+        } catch (e) {
+            console.error('Push init error:', e);
+        }
+    }
+
+    async enablePush() {
+        try {
+            if (await Notification.requestPermission() !== 'granted') {
+                this.showToast('Trình duyệt đã chặn thông báo', 'warning');
+                return false;
+            }
+            const registration = await navigator.serviceWorker.ready;
+            const subscription = await registration.pushManager.subscribe({
+                userVisibleOnly: true,
+                applicationServerKey: this.urlBase64ToUint8Array(this.pushConfig.public_key)
+            });
+            await this.postPush('/notifications/push/subscribe', subscription.toJSON());
+            this.pushSubscribed = true;
+            this.showToast('Đã bật thông báo đẩy', 'success');
+            return true;
+        } catch (e) {
+            console.error('Push subscribe error:', e);
+            return false;
+        }
+    }
+
+    async disablePush() {
+        try {
+            const registration = await navigator.serviceWorker.ready;
+            const subscription = await registration.pushManager.getSubscription();
+            if (subscription) {
+                await this.postPush('/notifications/push/unsubscribe', { endpoint: subscription.endpoint });
+                await subscription.unsubscribe();
+            }
+            this.pushSubscribed = false;
+            return true;
+        } catch (e) {
+            console.error('Push unsubscribe error:', e);
+            return false;
+        }
+    }
+
+    postPush(url, body) {
+        const csrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || '';
+        return fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+            body: JSON.stringify(body)
+        });
+    }
+
+    urlBase64ToUint8Array(base64String) {
+        const padding = '='.repeat((4 - base64String.length % 4) % 4);
+        const base64 = (base64String + padding).replace(/-/g, '+').replace(/_/g, '/');
+        const raw = atob(base64);
+        return Uint8Array.from([...raw].map(char => char.charCodeAt(0)));
+    }
+
     // ============================================================
     // SSE CONNECTION - AUTO RECONNECT
     // ============================================================
@@ -305,9 +403,9 @@ class NotificationManager {
             return;
         }
 
-        window.sseManager.connect(
+        window.sseManager.subscribe(
+            'notifications',
             'notifications',
-            '/sse/notifications',
             {
                 onOpen: () => {
                     console.log('✅ SSE connected');
@@ -335,7 +433,7 @@ class NotificationManager {
                 }
             },
             {
-                url: '/notifications/unread-ids',
+                url: () => `/notifications/sync?since=${this.syncCursor}`,
                 interval: 30000, // 30 giây fallback
                 onData: (data) => this.handlePollingData(data)
             }
@@ -354,8 +452,10 @@ class NotificationManager {
 
     async checkNotifications() {
         try {
-            const response = await fetch('/notifications/unread-ids');
-            if (response.ok) this.handlePollingData(await response.json());
+            const headers = this.syncEtag ? { 'If-None-Match': this.syncEtag } : {};
+            const response = await fetch(`/notifications/sync?since=${this.syncCursor}`, { headers, cache: 'no-store' });
+            this.syncEtag = response.headers.get('ETag') || this.syncEtag;
+            if (response.status === 200) this.handlePollingData(await response.json());
         } catch (e) {
             console.error('Polling error:', e);
         }
@@ -425,6 +525,7 @@ class NotificationManager {
     }
 
     handlePollingData(data) {
+        if (data.cursor !== undefined) this.syncCursor = data.cursor;
         const currentIds = new Set(data.ids || []);
         const newIds = [...currentIds].filter(id =>
             !this.seenNotificationIds.has(id) && !this.processedNotificationIds.has(id)
@@ -436,7 +537,7 @@ class NotificationManager {
                 this.processedNotificationIds.add(id);
             });
             this.saveSeenIds();
-            this.triggerNotificationAlert(newIds);
+            this.triggerNotificationAlert(newIds, data.items);
         }
 
         // Cleanup
@@ -446,26 +547,30 @@ class NotificationManager {
         this.saveSeenIds();
     }
 
-    async triggerNotificationAlert(newIds) {
+    async triggerNotificationAlert(newIds, items) {
         console.log(`📬 ${newIds.length} new notifications`);
 
         if (this.settings.soundEnabled) this.sound.playTing();
 
         if (this.settings.ttsEnabled) {
-            setTimeout(() => this.speakLatestNotifications(), 300);
+            const newItems = items ? items.filter(item => newIds.includes(item.id)) : null;
+            setTimeout(() => this.speakLatestNotifications(newItems), 300);
         }
     }
 
-    async speakLatestNotifications() {
+    async speakLatestNotifications(items) {
         try {
-            const response = await fetch('/notifications/latest-all');
-            if (!response.ok) throw new Error('API error');
-
-            const data = await response.json();
-            const notifications = data.notifications || [];
+            // /sync đã kèm nội dung thông báo mới -> không cần gọi thêm latest-all
+            let notifications = items;
+            if (!notifications) {
+                const response = await fetch('/notifications/latest-all');
+                if (!response.ok) throw new Error('API error');
+                notifications = (await response.json()).notifications || [];
+            }
 
             for (const notif of notifications) {
-                if (this.processedNotificationIds.has(notif.id)) continue;
+                // Thông báo từ /sync đã được lọc theo id mới ở handlePollingData
+                if (!items && this.processedNotificationIds.has(notif.id)) continue;
                 this.processedNotificationIds.add(notif.id);
 
                 let text = this.settings.readFullContent
@@ -9,6 +9,14 @@ class SSEManager {
         this.reconnectAttempts = new Map();
         this.reconnectTimers = new Map();
         this.pollingFallbacks = new Map();
+        this.lastEventIds = new Map();      // Last-Event-ID để server replay phần bị lỡ khi reconnect
+
+        // Multiplexed stream: mọi topic của tab dùng chung 1 EventSource
+        this.streamName = 'stream';
+        this.subscriptions = new Map();
+        this.streamTimer = null;
+        this.streamDebounce = 50;
+        this.streamTopics = '';
 
         // Configuration
         this.maxReconnectAttempts = 3;
@@ -16,6 +24,13 @@ class SSEManager {
         this.maxReconnectDelay = 60000;     // ✅ 60 giây
         this.maxConnections = 3;            //  Giới hạn 3 SSE/user
 
+        // Polling fallback thích ứng: giãn gấp đôi khi dữ liệu không đổi, về lại interval gốc khi có thay đổi
+        this.maxPollInterval = 300000;      // 5 phút
+        this.hiddenPollInterval = 120000;   // Tab ẩn: tối thiểu 2 phút
+
+        // Id của tab - server dùng để nhận gợi ý ẩn/hiện tab (/sse/control)
+        this.clientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+
         this.sseSupported = typeof EventSource !== 'undefined';
 
         console.log('🚀 SSE Manager v2 initialized', { sseSupported: this.sseSupported });
@@ -48,8 +63,14 @@ class SSEManager {
 
         console.log(`📡 Connecting SSE: ${name}`);
 
+        // Reconnect: gửi kèm id cuối đã nhận -> server chỉ gửi lại các event bị lỡ
+        const query = new URLSearchParams({ client_id: this.clientId, hidden: document.hidden ? '1' : '0' });
+        const lastEventId = this.lastEventIds.get(name);
+        if (lastEventId) query.set('last_event_id', lastEventId);
+        const streamUrl = `${url}${url.includes('?') ? '&' : '?'}${query.toString()}`;
+
         try {
-            const eventSource = new EventSource(url);
+            const eventSource = new EventSource(streamUrl);
             let isConnected = false;
 
             eventSource.onopen = () => {
@@ -76,6 +97,7 @@ class SSEManager {
             if (callbacks.events) {
                 for (const [eventName, handler] of Object.entries(callbacks.events)) {
                     eventSource.addEventListener(eventName, (e) => {
+                        if (e.lastEventId) this.lastEventIds.set(name, e.lastEventId);
                         try {
                             const data = JSON.parse(e.data);
 
@@ -119,6 +141,104 @@ class SSEManager {
         }
     }
 
+    /**
+     * Subscribe a topic on the shared multiplexed stream
+     * topic: 'notifications' | 'dashboard' | 'task:<id>' | 'news:<id>'
+     * params: query string gửi kèm (vd: last_timestamp)
+     */
+    subscribe(name, topic, callbacks, fallbackConfig = null, params = {}) {
+        if (!this.sseSupported) {
+            console.warn(` SSE not supported, using polling for ${name}`);
+            this.startPollingFallback(name, fallbackConfig);
+            return;
+        }
+
+        this.subscriptions.set(name, { topic, callbacks, fallbackConfig, params });
+        this.scheduleStreamConnect();
+    }
+
+    /**
+     * Remove a topic from the multiplexed stream
+     */
+    unsubscribe(name) {
+        if (!this.subscriptions.has(name)) return;
+
+        this.stopPollingFallback(name);
+        this.subscriptions.delete(name);
+
+        if (this.subscriptions.size === 0) {
+            clearTimeout(this.streamTimer);
+            this.streamTimer = null;
+            this.disconnect(this.streamName);
+        } else {
+            this.scheduleStreamConnect();
+        }
+    }
+
+    /**
+     * Gộp các subscribe liên tiếp (lúc load trang) thành 1 lần kết nối
+     */
+    scheduleStreamConnect() {
+        clearTimeout(this.streamTimer);
+        this.streamTimer = setTimeout(() => {
+            this.streamTimer = null;
+            this.connectStream();
+        }, this.streamDebounce);
+    }
+
+    /**
+     * (Re)open the multiplexed stream with the current topics
+     * Event từ server có prefix topic: "<topic>.<event>"; heartbeat/close/error dùng chung
+     */
+    connectStream() {
+        if (this.subscriptions.size === 0) return;
+
+        const topics = [];
+        const params = new URLSearchParams();
+        const events = {};
+        const subs = () => Array.from(this.subscriptions.values());
+
+        for (const sub of this.subscriptions.values()) {
+            topics.push(sub.topic);
+            for (const [key, value] of Object.entries(sub.params)) {
+                params.set(key, value);
+            }
+            for (const [eventName, handler] of Object.entries(sub.callbacks.events || {})) {
+                events[`${sub.topic}.${eventName}`] = handler;
+            }
+        }
+
+        for (const eventName of ['heartbeat', 'close', 'error']) {
+            events[eventName] = (data, e) => {
+                for (const sub of subs()) {
+                    const handler = sub.callbacks.events && sub.callbacks.events[eventName];
+                    if (handler) handler(data, e);
+                }
+            };
+        }
+
+        // Đổi danh sách topic -> topic mới chưa có snapshot, không replay theo id cũ
+        const topicList = topics.join(',');
+        if (topicList !== this.streamTopics) {
+            this.lastEventIds.delete(this.streamName);
+            this.streamTopics = topicList;
+        }
+        params.set('topics', topicList);
+
+        this.connect(
+            this.streamName,
+            `/sse/stream?${params.toString()}`,
+            {
+                onOpen: () => subs().forEach(sub => sub.callbacks.onOpen && sub.callbacks.onOpen()),
+                onError: (error, attempts) => subs().forEach(
+                    sub => sub.callbacks.onError && sub.callbacks.onError(error, attempts)
+                ),
+                events
+            },
+            { multiplexed: true }
+        );
+    }
+
     /**
      * Handle disconnection with exponential backoff
      */
@@ -173,6 +293,11 @@ class SSEManager {
      * Disconnect from SSE
      */
     disconnect(name, clearAttempts = true) {
+        if (this.subscriptions.has(name)) {
+            this.unsubscribe(name);
+            return;
+        }
+
         this.clearReconnectTimer(name);
 
         const conn = this.connections.get(name);
@@ -183,7 +308,10 @@ class SSEManager {
         }
 
         this.stopPollingFallback(name);
-        if (clearAttempts) this.reconnectAttempts.delete(name);
+        if (clearAttempts) {
+            this.reconnectAttempts.delete(name);
+            this.lastEventIds.delete(name);
+        }
     }
 
     /**
@@ -194,6 +322,10 @@ class SSEManager {
         for (const name of this.connections.keys()) {
             this.disconnect(name);
         }
+        this.stopPollingFallback(this.streamName);
+        this.subscriptions.clear();
+        clearTimeout(this.streamTimer);
+        this.streamTimer = null;
     }
 
     /**
@@ -202,32 +334,95 @@ class SSEManager {
     startPollingFallback(name, config) {
         if (!config) return;
 
+        if (config.multiplexed) {
+            // Stream gộp không dùng được -> poll riêng từng topic
+            for (const [subName, sub] of this.subscriptions) {
+                this.startPollingFallback(subName, sub.fallbackConfig);
+            }
+            return;
+        }
+
         this.stopPollingFallback(name);
         console.log(`🔄 Starting polling for ${name} (${config.interval}ms)`);
 
+        const state = { timer: null, interval: config.interval, delay: config.interval, lastBody: null, etag: null };
+        const maxInterval = config.maxInterval || this.maxPollInterval;
+
         const poll = async () => {
             try {
-                const response = await fetch(config.url);
-                if (response.ok && config.onData) {
-                    config.onData(await response.json());
+                // url có thể là hàm (cursor thay đổi theo dữ liệu đã nhận)
+                const url = typeof config.url === 'function' ? config.url() : config.url;
+                const headers = state.etag ? { 'If-None-Match': state.etag } : {};
+                const response = await fetch(url, { headers, cache: 'no-store' });
+                state.etag = response.headers.get('ETag') || state.etag;
+
+                if (response.status === 304) {
+                    // Server xác nhận không đổi -> giãn nhịp poll
+                    state.delay = Math.min(state.delay * 2, maxInterval);
+                } else if (response.ok) {
+                    const body = await response.text();
+                    if (body === state.lastBody) {
+                        // Không đổi -> giãn nhịp poll
+                        state.delay = Math.min(state.delay * 2, maxInterval);
+                    } else {
+                        state.delay = state.interval;
+                        state.lastBody = body;
+                        if (config.onData) config.onData(JSON.parse(body));
+                    }
                 }
             } catch (e) {
                 console.error(`Polling error for ${name}:`, e);
             }
+
+            if (this.pollingFallbacks.get(name) !== state) return; // Đã dừng
+            const delay = document.hidden ? Math.max(state.delay, this.hiddenPollInterval) : state.delay;
+            state.timer = setTimeout(poll, delay);
         };
 
+        state.poll = poll;
+        this.pollingFallbacks.set(name, state);
         poll(); // Initial
-        const intervalId = setInterval(poll, config.interval);
-        this.pollingFallbacks.set(name, intervalId);
+    }
+
+    /**
+     * Tab hiện lại: poll ngay và về interval gốc thay vì chờ hết nhịp đã giãn
+     */
+    resumePolling() {
+        for (const state of this.pollingFallbacks.values()) {
+            clearTimeout(state.timer);
+            state.delay = state.interval;
+            state.poll();
+        }
+    }
+
+    /**
+     * Báo server tab đang ẩn/hiện - kênh chỉ có tab ẩn sẽ giãn nhịp cập nhật
+     */
+    sendVisibilityHint() {
+        if (this.connections.size === 0) return;
+
+        const csrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || '';
+        fetch('/sse/control', {
+            method: 'POST',
+            keepalive: true,
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+            body: JSON.stringify({ client_id: this.clientId, hidden: document.hidden })
+        }).catch(e => console.error('SSE control error:', e));
     }
 
     /**
      * Stop polling fallback
      */
     stopPollingFallback(name) {
-        const id = this.pollingFallbacks.get(name);
-        if (id) {
-            clearInterval(id);
+        if (name === this.streamName) {
+            for (const subName of this.subscriptions.keys()) {
+                this.stopPollingFallback(subName);
+            }
+        }
+
+        const state = this.pollingFallbacks.get(name);
+        if (state) {
+            clearTimeout(state.timer);
             this.pollingFallbacks.delete(name);
         }
     }
@@ -236,6 +431,7 @@ class SSEManager {
      * Check connection status
      */
     isConnected(name) {
+        if (this.subscriptions.has(name)) name = this.streamName;
         const conn = this.connections.get(name);
         return conn && conn.eventSource.readyState === EventSource.OPEN;
     }
@@ -244,6 +440,7 @@ class SSEManager {
      * Get status info
      */
     getStatus(name) {
+        if (this.subscriptions.has(name) && !this.pollingFallbacks.has(name)) name = this.streamName;
         const conn = this.connections.get(name);
         if (!conn) {
             return {
@@ -271,10 +468,13 @@ window.addEventListener('beforeunload', () => {
 
 // Handle visibility - reconnect when tab becomes visible
 document.addEventListener('visibilitychange', () => {
+    window.sseManager.sendVisibilityHint();
+
     if (document.hidden) {
         console.log('📴 Tab hidden');
     } else {
         console.log('📳 Tab visible');
+        window.sseManager.resumePolling();
         // Check and reconnect any closed connections
         for (const [name, conn] of window.sseManager.connections) {
             if (conn.eventSource.readyState === EventSource.CLOSED) {
@@ -246,9 +246,9 @@ function startRealtimeComments() {
         return;
     }
 
-    window.sseManager.connect(
+    window.sseManager.subscribe(
         'task-comments',
-        `/sse/tasks/${window.CONFIG.TASK_ID}/comments?last_timestamp=${lastTimestamp}`,
+        `task:${window.CONFIG.TASK_ID}`,
         {
             onOpen: () => {
                 console.log('✅ SSE Task Comments connected');
@@ -279,7 +279,8 @@ function startRealtimeComments() {
                     handleNewComments(data);
                 }
             }
-        }
+        },
+        { last_timestamp: lastTimestamp }
     );
 }
 
@@ -346,10 +347,12 @@ function handleNewComments(data) {
 }
 
 function handleCommentsSync(data) {
-    const existingIds = new Set(data.existing_ids);
+    // SSE chỉ gửi deleted_ids (tombstone), polling gửi toàn bộ existing_ids
+    const deletedIds = data.deleted_ids ? new Set(data.deleted_ids) : null;
+    const existingIds = new Set(data.existing_ids || []);
 
     knownCommentIds.forEach(id => {
-        if (!existingIds.has(id)) {
+        if (deletedIds ? deletedIds.has(id) : !existingIds.has(id)) {
             console.log('[HANDLER] Comment deleted:', id);
             const element = document.querySelector(`.comment-item[data-id="${id}"]`);
             if (element) {
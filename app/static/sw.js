@@ -9,4 +9,44 @@ self.addEventListener('install', event => {
 self.addEventListener('activate', event => {
   console.log('Service Worker activated');
   event.waitUntil(clients.claim());
-});
\ No newline at end of file
+});
+
+// ========== WEB PUSH ==========
+// Payload từ app/webpush.py: { title, body, link, tag }
+self.addEventListener('push', event => {
+  let data = {};
+  try {
+    data = event.data ? event.data.json() : {};
+  } catch (e) {
+    data = { title: event.data ? event.data.text() : '' };
+  }
+
+  event.waitUntil(
+    self.registration.showNotification(data.title || 'Thông báo mới', {
+      body: data.body || '',
+      tag: data.tag,
+      renotify: !!data.tag,
+      icon: '/static/favicon/android-chrome-192x192.png',
+      badge: '/static/favicon/android-chrome-192x192.png',
+      data: { link: data.link || '/notifications/' }
+    })
+  );
+});
+
+self.addEventListener('notificationclick', event => {
+  event.notification.close();
+  const link = (event.notification.data && event.notification.data.link) || '/notifications/';
+  const target = new URL(link, self.location.origin).href;
+
+  // Đã có tab của app -> focus và chuyển trang, chưa có -> mở tab mới
+  event.waitUntil(
+    clients.matchAll({ type: 'window', includeUncontrolled: true }).then(windows => {
+      for (const client of windows) {
+        if (client.url.startsWith(self.location.origin) && 'focus' in client) {
+          return client.focus().then(focused => focused.navigate ? focused.navigate(target) : focused);
+        }
+      }
+      return clients.openWindow(target);
+    })
+  );
+});
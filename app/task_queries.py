@@ -0,0 +1,151 @@
+"""
+Task Queries - điều kiện "ai thấy task nào" dùng chung cho các view
+- Biểu diễn bằng EXISTS tương quan trên task_assignments: 1 query, DB tự chọn semi-join
+  qua idx_assignment_user_accepted_task / idx_assignment_task_user
+- Thay cho lấy danh sách task_id về Python rồi Task.id.in_([...]) (2 round-trip,
+  IN list hàng nghìn bind param với nhân viên lâu năm)
+- kanban_page: phân trang keyset cho từng cột Kanban (cursor thay cho OFFSET)
+"""
+
+from sqlalchemy import exists, or_, and_, case
+from datetime import datetime
+from app.models import Task, TaskAssignment
+
+# Role thấy mọi task
+ALL_TASKS_ROLES = ('director', 'manager')
+
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def assigned_to(user_id):
+    """Điều kiện: task có assignment đã nhận của user_id"""
+    return exists().where(
+        TaskAssignment.task_id == Task.id,
+        TaskAssignment.user_id == user_id,
+        TaskAssignment.accepted == True
+    )
+
+
+def visibility_condition(user):
+    """Điều kiện task user được xem, None nếu xem được tất cả"""
+    if user.role in ALL_TASKS_ROLES:
+        return None
+    return or_(assigned_to(user.id), Task.creator_id == user.id)
+
+
+def visible_tasks_query(user, assigned_user=None, query=None):
+    """
+    Task.query (hoặc `query` truyền vào) giới hạn theo quyền xem của user,
+    thêm lọc theo người được giao nếu có assigned_user.
+    """
+    if query is None:
+        query = Task.query
+
+    condition = visibility_condition(user)
+    if condition is not None:
+        query = query.filter(condition)
+    if assigned_user:
+        query = query.filter(assigned_to(int(assigned_user)))
+    return query
+
+
+# ============================================================
+# KANBAN - keyset pagination theo cột
+# ============================================================
+def kanban_priority(now):
+    """Thứ tự ưu tiên cột chưa xong: quá hạn -> khẩn cấp -> quan trọng -> lặp lại -> còn lại"""
+    return case(
+        (Task.due_date < now, 1),
+        (Task.is_urgent == True, 2),
+        (Task.is_important == True, 3),
+        (Task.is_recurring == True, 4),
+        else_=5
+    )
+
+
+def _task_priority(task, now):
+    if task.due_date and task.due_date < now:
+        return 1
+    if task.is_urgent:
+        return 2
+    if task.is_important:
+        return 3
+    if task.is_recurring:
+        return 4
+    return 5
+
+
+def encode_kanban_cursor(task, now):
+    """
+    Cột chưa xong: cursor mang theo `now` của trang đầu - kanban_priority phụ thuộc thời điểm
+    (task quá hạn giữa 2 lần cuộn đổi nhóm), mọi trang sau sắp xếp theo cùng 1 mốc
+    """
+    if task.status == 'DONE':
+        return f'{task.updated_at.strftime(CURSOR_TIME_FORMAT)}-{task.id}'
+    return '-'.join([
+        now.strftime(CURSOR_TIME_FORMAT),
+        str(_task_priority(task, now)),
+        task.created_at.strftime(CURSOR_TIME_FORMAT),
+        str(task.id)
+    ])
+
+
+def decode_kanban_cursor(cursor, status):
+    """
+    Tuple khóa sắp xếp của thẻ cuối trang trước, None nếu cursor sai định dạng (coi như trang đầu).
+    Cột chưa xong: (now của trang đầu, priority, created_at, id).
+    """
+    try:
+        parts = cursor.split('-')
+        if status == 'DONE':
+            stamp, task_id = parts
+            return datetime.strptime(stamp, CURSOR_TIME_FORMAT), int(task_id)
+        anchor, priority, stamp, task_id = parts
+        return (
+            datetime.strptime(anchor, CURSOR_TIME_FORMAT),
+            int(priority),
+            datetime.strptime(stamp, CURSOR_TIME_FORMAT),
+            int(task_id)
+        )
+    except (AttributeError, ValueError):
+        return None
+
+
+def kanban_page(query, status, now, cursor=None, limit=20):
+    """
+    1 trang thẻ của cột `status` (query đã lọc quyền xem / bộ lọc). Trả về (tasks, next_cursor).
+    DONE: mới cập nhật trước; cột khác: theo kanban_priority rồi mới tạo trước. id làm khóa phụ.
+    Có cursor: kanban_priority tính theo `now` trong cursor, không theo `now` của request này.
+    """
+    query = query.filter(Task.status == status)
+    key = decode_kanban_cursor(cursor, status) if cursor else None
+
+    if status == 'DONE':
+        if key:
+            updated_at, task_id = key
+            query = query.filter(or_(
+                Task.updated_at < updated_at,
+                and_(Task.updated_at == updated_at, Task.id < task_id)
+            ))
+        query = query.order_by(Task.updated_at.desc(), Task.id.desc())
+    else:
+        # Trang sau: sắp xếp theo mốc thời gian của trang đầu
+        now = key[0] if key else now
+        priority = kanban_priority(now)
+        if key:
+            _, last_priority, created_at, task_id = key
+            query = query.filter(or_(
+                priority > last_priority,
+                and_(priority == last_priority, or_(
+                    Task.created_at < created_at,
+                    and_(Task.created_at == created_at, Task.id < task_id)
+                ))
+            ))
+        query = query.order_by(priority.asc(), Task.created_at.desc(), Task.id.desc())
+
+    # Lấy dư 1 dòng để biết còn trang sau
+    tasks = query.limit(limit + 1).all()
+    if len(tasks) <= limit:
+        return tasks, None
+    tasks = tasks[:limit]
+    return tasks, encode_kanban_cursor(tasks[-1], now)
@@ -0,0 +1,394 @@
+"""
+Task Stats - bảng tổng hợp task_stats cho dashboard / hub
+- Mỗi dòng: số task theo (user_id, status, is_urgent, is_important, is_recurring, rated, day)
+  day = ngày tạo theo giờ VN (khớp bộ lọc ngày của dashboard), user_id = 0: toàn công ty
+- Task / TaskAssignment thêm / sửa / xóa qua ORM: mapper events cộng / trừ 1 vào đúng các dòng
+  (ngày, user, nhóm status / tag) bị ảnh hưởng, sau flush áp dụng bằng 1 câu upsert
+  (uq_task_stats_bucket) trong cùng transaction - không tính lại cả ngày, không khóa theo ngày
+- Bulk delete / update task không qua mapper events: remove_tasks(task_ids) TRƯỚC lệnh đó
+  (và add_tasks(task_ids) SAU bulk update)
+- summary / status_counts: đọc vài chục dòng tổng hợp thay vì quét bảng tasks
+- rebuild: tính lại toàn bộ theo từng ngày (flask rebuild-task-stats)
+- Số liệu phụ thuộc thời điểm hiện tại (quá hạn, sắp đến hạn) vẫn query trực tiếp bảng tasks
+"""
+
+from sqlalchemy import event, func, select, delete, insert, literal, inspect, and_, true, false
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+from datetime import datetime, timedelta
+from app import db
+from app.models import Task, TaskAssignment, TaskStat
+from app.utils import utc_to_vn, vn_to_utc
+
+STATUSES = ('PENDING', 'IN_PROGRESS', 'DONE')
+TAGS = ('urgent', 'important', 'recurring')
+
+# Cột của Task làm thay đổi dòng tổng hợp khi được cập nhật
+TRACKED_TASK_FIELDS = ('status', 'is_urgent', 'is_important', 'is_recurring', 'performance_rating', 'created_at')
+TRACKED_ASSIGNMENT_FIELDS = ('task_id', 'user_id', 'accepted')
+
+# Khóa 1 dòng tổng hợp - trùng uq_task_stats_bucket (đích ON CONFLICT của apply_deltas)
+BUCKET_COLUMNS = ('user_id', 'day', 'status', 'is_urgent', 'is_important', 'is_recurring', 'rated')
+
+# Cột của Task đọc để xác định nhóm - thứ tự tham số của _bucket
+_TASK_COLUMNS = (
+    Task.status, Task.is_urgent, Task.is_important, Task.is_recurring, Task.performance_rating, Task.created_at
+)
+
+_DELTAS_KEY = 'task_stats_deltas'
+_PAIRS_KEY = 'task_stats_pairs'
+_events_registered = False
+
+
+def day_of(created_at):
+    """Ngày (giờ VN) của 1 thời điểm UTC"""
+    return utc_to_vn(created_at).date() if created_at else None
+
+
+def parse_day(value):
+    """'YYYY-MM-DD' -> date, None nếu rỗng / sai định dạng"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================================
+# ĐỌC
+# ============================================================
+def _grouped(user_id, date_from=None, date_to=None):
+    query = db.session.query(
+        TaskStat.status,
+        TaskStat.is_urgent,
+        TaskStat.is_important,
+        TaskStat.is_recurring,
+        TaskStat.rated,
+        func.sum(TaskStat.task_count)
+    ).filter(TaskStat.user_id == user_id)
+
+    if date_from:
+        query = query.filter(TaskStat.day >= date_from)
+    if date_to:
+        query = query.filter(TaskStat.day <= date_to)
+
+    return query.group_by(
+        TaskStat.status, TaskStat.is_urgent, TaskStat.is_important, TaskStat.is_recurring, TaskStat.rated
+    ).all()
+
+
+def summary(user_id=TaskStat.ALL_USERS, date_from=None, date_to=None):
+    """
+    Số liệu dashboard: total_tasks, pending / in_progress / done, {status}_{tag}, total_{tag}.
+    user_id = ALL_USERS: toàn công ty, ngược lại: task được giao (đã nhận) cho user đó.
+    """
+    result = {'total_tasks': 0}
+    for status in STATUSES:
+        result[status.lower()] = 0
+        for tag in TAGS:
+            result[f'{status.lower()}_{tag}'] = 0
+    for tag in TAGS:
+        result[f'total_{tag}'] = 0
+
+    for status, is_urgent, is_important, is_recurring, rated, count in _grouped(user_id, date_from, date_to):
+        count = int(count or 0)
+        prefix = status.lower()
+        result['total_tasks'] += count
+        if prefix in result:
+            result[prefix] += count
+        for tag, flag in zip(TAGS, (is_urgent, is_important, is_recurring)):
+            if not flag:
+                continue
+            result[f'total_{tag}'] += count
+            if f'{prefix}_{tag}' in result:
+                result[f'{prefix}_{tag}'] += count
+
+    return result
+
+
+def status_counts(user_id=TaskStat.ALL_USERS):
+    """{status: số task} + 'unrated_done' (DONE chưa đánh giá) của user / toàn công ty"""
+    counts = dict.fromkeys(STATUSES, 0)
+    counts['unrated_done'] = 0
+    for status, _, _, _, rated, count in _grouped(user_id):
+        count = int(count or 0)
+        counts[status] = counts.get(status, 0) + count
+        if status == 'DONE' and not rated:
+            counts['unrated_done'] += count
+    return counts
+
+
+# ============================================================
+# GHI - cộng / trừ theo nhóm
+# ============================================================
+def _bucket(status, is_urgent, is_important, is_recurring, performance_rating, created_at):
+    """Nhóm (day, status, is_urgent, is_important, is_recurring, rated) của 1 task, None nếu chưa có ngày tạo"""
+    day = day_of(created_at)
+    if day is None:
+        return None
+    return day, status, bool(is_urgent), bool(is_important), bool(is_recurring), performance_rating is not None
+
+
+def _add_delta(session, user_ids, bucket, delta):
+    """Ghi nhận thay đổi số task của nhóm `bucket` cho từng user (áp dụng sau flush / trước commit)"""
+    if bucket is None:
+        return
+    deltas = session.info.setdefault(_DELTAS_KEY, {})
+    for user_id in user_ids:
+        key = (user_id, *bucket)
+        deltas[key] = deltas.get(key, 0) + delta
+
+
+def _accepted_users(connection, task_id):
+    """User có assignment đã nhận của task (mỗi user 1 lần)"""
+    return {user_id for user_id, in connection.execute(
+        select(TaskAssignment.user_id).where(
+            TaskAssignment.task_id == task_id,
+            TaskAssignment.accepted == true()
+        ).distinct()
+    )}
+
+
+def _pair_bucket(connection, task_id, user_id):
+    """Nhóm mà task đang được tính cho user (None nếu user không có assignment đã nhận của task)"""
+    if task_id is None or user_id is None:
+        return None
+    row = connection.execute(
+        select(*_TASK_COLUMNS).where(
+            Task.id == task_id,
+            select(TaskAssignment.id).where(
+                TaskAssignment.task_id == task_id,
+                TaskAssignment.user_id == user_id,
+                TaskAssignment.accepted == true()
+            ).exists()
+        )
+    ).first()
+    return _bucket(*row) if row else None
+
+
+def _contributions(connection, task_ids, delta):
+    """{(user_id, *bucket): delta} cho toàn bộ dòng tổng hợp mà các task đang đóng góp"""
+    deltas = {}
+    buckets = {}
+    for task_id, *columns in connection.execute(select(Task.id, *_TASK_COLUMNS).where(Task.id.in_(task_ids))):
+        buckets[task_id] = _bucket(*columns)
+
+    users = connection.execute(
+        select(TaskAssignment.task_id, TaskAssignment.user_id).where(
+            TaskAssignment.task_id.in_(task_ids),
+            TaskAssignment.accepted == true()
+        ).distinct()
+    )
+    pairs = [(task_id, TaskStat.ALL_USERS) for task_id in buckets] + list(users)
+
+    for task_id, user_id in pairs:
+        bucket = buckets.get(task_id)
+        if bucket is not None:
+            key = (user_id, *bucket)
+            deltas[key] = deltas.get(key, 0) + delta
+    return deltas
+
+
+def _merge(session, deltas):
+    pending = session.info.setdefault(_DELTAS_KEY, {})
+    for key, delta in deltas.items():
+        pending[key] = pending.get(key, 0) + delta
+
+
+def remove_tasks(task_ids):
+    """Gọi TRƯỚC bulk delete (hoặc bulk update) tasks / task_assignments của các task này"""
+    if task_ids:
+        _merge(db.session, _contributions(db.session.connection(), list(task_ids), -1))
+
+
+def add_tasks(task_ids):
+    """Gọi SAU bulk insert / update tasks / task_assignments của các task này"""
+    if task_ids:
+        _merge(db.session, _contributions(db.session.connection(), list(task_ids), 1))
+
+
+def apply_deltas(connection, deltas):
+    """1 câu INSERT ... ON CONFLICT DO UPDATE task_count = task_count + delta"""
+    rows = [
+        dict(zip(BUCKET_COLUMNS, key), task_count=delta)
+        # Thứ tự khóa cố định -> 2 transaction cùng cập nhật nhiều dòng không khóa chéo nhau
+        for key, delta in sorted(deltas.items()) if delta
+    ]
+    if not rows:
+        return
+
+    table = TaskStat.__table__
+    dialect_insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    statement = dialect_insert(table).values(rows)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(BUCKET_COLUMNS),
+        set_={'task_count': table.c.task_count + statement.excluded.task_count}
+    ))
+
+
+# ============================================================
+# REBUILD - tính lại theo ngày
+# ============================================================
+def refresh_days(connection, days):
+    """Xóa và tính lại dòng tổng hợp của các ngày (trong transaction của connection)"""
+    table = TaskStat.__table__
+
+    for day in sorted(days):
+        start = vn_to_utc(datetime.combine(day, datetime.min.time()))
+        in_day = and_(Task.created_at >= start, Task.created_at < start + timedelta(days=1))
+        dimensions = (
+            Task.status,
+            func.coalesce(Task.is_urgent, false()),
+            func.coalesce(Task.is_important, false()),
+            func.coalesce(Task.is_recurring, false()),
+            Task.performance_rating.isnot(None)
+        )
+        columns = ['user_id', 'status', 'is_urgent', 'is_important', 'is_recurring', 'rated', 'day', 'task_count']
+
+        connection.execute(delete(table).where(table.c.day == day))
+
+        # Toàn công ty: mỗi task 1 lần
+        connection.execute(insert(table).from_select(columns, select(
+            literal(TaskStat.ALL_USERS), *dimensions, literal(day), func.count(Task.id)
+        ).where(in_day).group_by(*dimensions)))
+
+        # Theo người được giao (assignment đã nhận)
+        connection.execute(insert(table).from_select(columns, select(
+            TaskAssignment.user_id, *dimensions, literal(day), func.count(func.distinct(Task.id))
+        ).join(TaskAssignment, and_(
+            TaskAssignment.task_id == Task.id,
+            TaskAssignment.accepted == true()
+        )).where(in_day).group_by(TaskAssignment.user_id, *dimensions)))
+
+
+def rebuild():
+    """Tính lại toàn bộ bảng task_stats. Trả về số ngày đã tính."""
+    days = {day_of(created_at) for created_at, in db.session.query(Task.created_at).filter(
+        Task.created_at.isnot(None)
+    )}
+    connection = db.session.connection()
+    connection.execute(delete(TaskStat.__table__))
+    refresh_days(connection, days)
+    db.session.commit()
+    return len(days)
+
+
+# ============================================================
+# MAPPER / SESSION EVENTS
+# ============================================================
+def _changed(target, fields):
+    state = inspect(target)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _old_value(target, field):
+    history = inspect(target).attrs[field].history
+    return history.deleted[0] if history.deleted else getattr(target, field)
+
+
+def _task_bucket(target, old=False):
+    value = (lambda field: _old_value(target, field)) if old else (lambda field: getattr(target, field))
+    return _bucket(*(value(column.key) for column in _TASK_COLUMNS))
+
+
+def _task_inserted(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        users = {TaskStat.ALL_USERS} | _accepted_users(connection, target.id)
+        _add_delta(session, users, _task_bucket(target), 1)
+
+
+def _task_updated(mapper, connection, target):
+    session = object_session(target)
+    if session is None or not _changed(target, TRACKED_TASK_FIELDS):
+        return
+    old, new = _task_bucket(target, old=True), _task_bucket(target)
+    if old == new:
+        return
+    # Assignment trong cùng flush ghi sau task -> đây là người được giao trước thay đổi,
+    # thay đổi assignment tính ở _after_flush theo nhóm mới của task
+    users = {TaskStat.ALL_USERS} | _accepted_users(connection, target.id)
+    _add_delta(session, users, old, -1)
+    _add_delta(session, users, new, 1)
+
+
+def _task_deleted(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        # Assignment cascade đã xóa trước task (và được tính ở _after_flush) -> còn lại thường chỉ ALL_USERS
+        users = {TaskStat.ALL_USERS} | _accepted_users(connection, target.id)
+        _add_delta(session, users, _task_bucket(target, old=True), -1)
+
+
+def _remember_pairs(connection, target, pairs):
+    """Nhóm hiện tại của các cặp (task, user) TRƯỚC khi câu SQL của assignment chạy (lần đầu trong flush)"""
+    session = object_session(target)
+    if session is None:
+        return
+    remembered = session.info.setdefault(_PAIRS_KEY, {})
+    for pair in pairs:
+        if pair not in remembered:
+            remembered[pair] = _pair_bucket(connection, *pair)
+
+
+def _assignment_inserting(mapper, connection, target):
+    _remember_pairs(connection, target, {(target.task_id, target.user_id)})
+
+
+def _assignment_updating(mapper, connection, target):
+    if _changed(target, TRACKED_ASSIGNMENT_FIELDS):
+        _remember_pairs(connection, target, {
+            (target.task_id, target.user_id),
+            (_old_value(target, 'task_id'), _old_value(target, 'user_id'))
+        })
+
+
+def _assignment_deleting(mapper, connection, target):
+    _remember_pairs(connection, target, {(_old_value(target, 'task_id'), _old_value(target, 'user_id'))})
+
+
+def _apply_pending(session):
+    # Cặp (task, user) có assignment thay đổi: so nhóm trước / sau flush - đúng cả khi
+    # 1 flush thêm / xóa nhiều assignment của cùng cặp
+    pairs = session.info.pop(_PAIRS_KEY, None)
+    if pairs:
+        connection = session.connection()
+        for (task_id, user_id), before in pairs.items():
+            after = _pair_bucket(connection, task_id, user_id)
+            if before != after:
+                _add_delta(session, {user_id}, before, -1)
+                _add_delta(session, {user_id}, after, 1)
+
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def _after_flush(session, flush_context):
+    _apply_pending(session)
+
+
+def _before_commit(session):
+    # remove_tasks / add_tasks (bulk) mà không có flush nào sau đó
+    _apply_pending(session)
+
+
+def _after_rollback(session):
+    session.info.pop(_DELTAS_KEY, None)
+    session.info.pop(_PAIRS_KEY, None)
+
+
+def init_app(app):
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    event.listen(Task, 'after_insert', _task_inserted)
+    event.listen(Task, 'after_update', _task_updated)
+    event.listen(Task, 'after_delete', _task_deleted)
+    event.listen(TaskAssignment, 'before_insert', _assignment_inserting)
+    event.listen(TaskAssignment, 'before_update', _assignment_updating)
+    event.listen(TaskAssignment, 'before_delete', _assignment_deleting)
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous: _after_rollback(session))
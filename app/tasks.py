@@ -1,13 +1,14 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, send_from_directory, abort
 from flask_login import login_required, current_user
-from app import db
-from app.models import Task, TaskAssignment, User, Notification, TaskComment
+from app import db, notification_service, task_stats
+from app.models import Task, TaskAssignment, User, Notification, TaskComment, TaskStat
 from app.decorators import role_required
 from datetime import datetime, timedelta
 from sqlalchemy import or_, and_, case, func
 from app.utils import vn_to_utc, utc_to_vn, vn_now
 from werkzeug.exceptions import abort
 from app.ai_service import summarize_description
+from app.task_queries import assigned_to, visible_tasks_query, kanban_page
 
 bp = Blueprint('tasks', __name__)
 
@@ -80,213 +81,36 @@ def mark_task_comments_as_read(task_id, user_id):
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    now = datetime.utcnow()
-
     # Lấy filter parameters
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     assigned_user = request.args.get('assigned_user', '')
 
+    # ===== ✅ TỐI ƯU: ĐỌC BẢNG TỔNG HỢP task_stats THAY VÌ QUÉT BẢNG tasks =====
+    # Lọc ngày theo ngày tạo (giờ VN), khớp khóa day của task_stats
+    day_from = task_stats.parse_day(date_from)
+    day_to = task_stats.parse_day(date_to)
+
     # Statistics for director and manager
     if current_user.role in ['director', 'manager']:
-        # ===== ✅ TỐI ƯU: SỬ DỤNG 1 QUERY DUY NHẤT CHO TẤT CẢ STATS =====
-        from sqlalchemy import func, case
-
-        # Base query with filters
-        base_conditions = []
-
-        if date_from:
-            try:
-                date_from_dt = datetime.strptime(date_from, '%Y-%m-%d')
-                date_from_utc = vn_to_utc(date_from_dt)
-                base_conditions.append(Task.created_at >= date_from_utc)
-            except:
-                pass
-
-        if date_to:
-            try:
-                date_to_dt = datetime.strptime(date_to, '%Y-%m-%d')
-                date_to_dt = date_to_dt.replace(hour=23, minute=59, second=59)
-                date_to_utc = vn_to_utc(date_to_dt)
-                base_conditions.append(Task.created_at <= date_to_utc)
-            except:
-                pass
-
-        # Apply assigned user filter
-        if assigned_user:
-            task_ids = [a.task_id for a in TaskAssignment.query.filter_by(
-                user_id=int(assigned_user),
-                accepted=True
-            ).all()]
-            base_conditions.append(Task.id.in_(task_ids))
-
-        # ✅ 1 QUERY DUY NHẤT để lấy tất cả statistics
-        stats = db.session.query(
-            func.count(Task.id).label('total_tasks'),
-            func.sum(case((Task.status == 'PENDING', 1), else_=0)).label('pending'),
-            func.sum(case((Task.status == 'IN_PROGRESS', 1), else_=0)).label('in_progress'),
-            func.sum(case((Task.status == 'DONE', 1), else_=0)).label('done'),
-            # Badge counts - PENDING (✅ SỬA CÚ PHÁP: dùng AND)
-            func.sum(case(((Task.status == 'PENDING') & (Task.is_urgent == True), 1), else_=0)).label('pending_urgent'),
-            func.sum(case(((Task.status == 'PENDING') & (Task.is_important == True), 1), else_=0)).label(
-                'pending_important'),
-            func.sum(case(((Task.status == 'PENDING') & (Task.is_recurring == True), 1), else_=0)).label(
-                'pending_recurring'),
-            # Badge counts - IN_PROGRESS
-            func.sum(case(((Task.status == 'IN_PROGRESS') & (Task.is_urgent == True), 1), else_=0)).label(
-                'in_progress_urgent'),
-            func.sum(case(((Task.status == 'IN_PROGRESS') & (Task.is_important == True), 1), else_=0)).label(
-                'in_progress_important'),
-            func.sum(case(((Task.status == 'IN_PROGRESS') & (Task.is_recurring == True), 1), else_=0)).label(
-                'in_progress_recurring'),
-            # Badge counts - DONE
-            func.sum(case(((Task.status == 'DONE') & (Task.is_urgent == True), 1), else_=0)).label('done_urgent'),
-            func.sum(case(((Task.status == 'DONE') & (Task.is_important == True), 1), else_=0)).label('done_important'),
-            func.sum(case(((Task.status == 'DONE') & (Task.is_recurring == True), 1), else_=0)).label('done_recurring'),
-            # Badge counts - TOTAL
-            func.sum(case((Task.is_urgent == True, 1), else_=0)).label('total_urgent'),
-            func.sum(case((Task.is_important == True, 1), else_=0)).label('total_important'),
-            func.sum(case((Task.is_recurring == True, 1), else_=0)).label('total_recurring'),
-        )
-
-        # Apply filters
-        if base_conditions:
-            stats = stats.filter(*base_conditions)
-
-        stats = stats.first()
-
-        # Extract values
-        total_tasks = stats.total_tasks or 0
-        pending = stats.pending or 0
-        in_progress = stats.in_progress or 0
-        done = stats.done or 0
-        pending_urgent = stats.pending_urgent or 0
-        pending_important = stats.pending_important or 0
-        pending_recurring = stats.pending_recurring or 0
-        in_progress_urgent = stats.in_progress_urgent or 0
-        in_progress_important = stats.in_progress_important or 0
-        in_progress_recurring = stats.in_progress_recurring or 0
-        done_urgent = stats.done_urgent or 0
-        done_important = stats.done_important or 0
-        done_recurring = stats.done_recurring or 0
-        total_urgent = stats.total_urgent or 0
-        total_important = stats.total_important or 0
-        total_recurring = stats.total_recurring or 0
+        stats_user_id = int(assigned_user) if assigned_user else TaskStat.ALL_USERS
+        stats = task_stats.summary(stats_user_id, day_from, day_to)
 
         # Get all users for filter dropdown
         all_users = User.query.filter_by(is_active=True).order_by(User.full_name).all()
 
         return render_template('dashboard.html',
-                               total_tasks=total_tasks,
-                               pending=pending,
-                               in_progress=in_progress,
-                               done=done,
-                               total_urgent=total_urgent,
-                               total_important=total_important,
-                               total_recurring=total_recurring,
-                               pending_urgent=pending_urgent,
-                               pending_important=pending_important,
-                               pending_recurring=pending_recurring,
-                               in_progress_urgent=in_progress_urgent,
-                               in_progress_important=in_progress_important,
-                               in_progress_recurring=in_progress_recurring,
-                               done_urgent=done_urgent,
-                               done_important=done_important,
-                               done_recurring=done_recurring,
+                               **stats,
                                all_users=all_users,
                                date_from=date_from,
                                date_to=date_to,
                                assigned_user=assigned_user)
     else:
         # ===== ACCOUNTANT/HR: Tasks của họ =====
-        my_assignments = TaskAssignment.query.filter_by(
-            user_id=current_user.id,
-            accepted=True
-        ).all()
-        my_task_ids = [a.task_id for a in my_assignments]
-
-        # ✅ TỐI ƯU: 1 QUERY cho tất cả stats
-        from sqlalchemy import func, case
-
-        base_conditions = [Task.id.in_(my_task_ids)]
-
-        # Apply date filters
-        if date_from:
-            try:
-                date_from_dt = datetime.strptime(date_from, '%Y-%m-%d')
-                date_from_utc = vn_to_utc(date_from_dt)
-                base_conditions.append(Task.created_at >= date_from_utc)
-            except:
-                pass
-
-        if date_to:
-            try:
-                date_to_dt = datetime.strptime(date_to, '%Y-%m-%d')
-                date_to_dt = date_to_dt.replace(hour=23, minute=59, second=59)
-                date_to_utc = vn_to_utc(date_to_dt)
-                base_conditions.append(Task.created_at <= date_to_utc)
-            except:
-                pass
-
-        # ✅ 1 QUERY DUY NHẤT (✅ SỬA CÚ PHÁP: dùng &)
-        stats = db.session.query(
-            func.count(Task.id).label('total_tasks'),
-            func.sum(case((Task.status == 'PENDING', 1), else_=0)).label('pending'),
-            func.sum(case((Task.status == 'IN_PROGRESS', 1), else_=0)).label('in_progress'),
-            func.sum(case((Task.status == 'DONE', 1), else_=0)).label('done'),
-            func.sum(case(((Task.status == 'PENDING') & (Task.is_urgent == True), 1), else_=0)).label('pending_urgent'),
-            func.sum(case(((Task.status == 'PENDING') & (Task.is_important == True), 1), else_=0)).label(
-                'pending_important'),
-            func.sum(case(((Task.status == 'PENDING') & (Task.is_recurring == True), 1), else_=0)).label(
-                'pending_recurring'),
-            func.sum(case(((Task.status == 'IN_PROGRESS') & (Task.is_urgent == True), 1), else_=0)).label(
-                'in_progress_urgent'),
-            func.sum(case(((Task.status == 'IN_PROGRESS') & (Task.is_important == True), 1), else_=0)).label(
-                'in_progress_important'),
-            func.sum(case(((Task.status == 'IN_PROGRESS') & (Task.is_recurring == True), 1), else_=0)).label(
-                'in_progress_recurring'),
-            func.sum(case(((Task.status == 'DONE') & (Task.is_urgent == True), 1), else_=0)).label('done_urgent'),
-            func.sum(case(((Task.status == 'DONE') & (Task.is_important == True), 1), else_=0)).label('done_important'),
-            func.sum(case(((Task.status == 'DONE') & (Task.is_recurring == True), 1), else_=0)).label('done_recurring'),
-            func.sum(case((Task.is_urgent == True, 1), else_=0)).label('total_urgent'),
-            func.sum(case((Task.is_important == True, 1), else_=0)).label('total_important'),
-            func.sum(case((Task.is_recurring == True, 1), else_=0)).label('total_recurring'),
-        ).filter(*base_conditions).first()
-
-        total_tasks = stats.total_tasks or 0
-        pending = stats.pending or 0
-        in_progress = stats.in_progress or 0
-        done = stats.done or 0
-        pending_urgent = stats.pending_urgent or 0
-        pending_important = stats.pending_important or 0
-        pending_recurring = stats.pending_recurring or 0
-        in_progress_urgent = stats.in_progress_urgent or 0
-        in_progress_important = stats.in_progress_important or 0
-        in_progress_recurring = stats.in_progress_recurring or 0
-        done_urgent = stats.done_urgent or 0
-        done_important = stats.done_important or 0
-        done_recurring = stats.done_recurring or 0
-        total_urgent = stats.total_urgent or 0
-        total_important = stats.total_important or 0
-        total_recurring = stats.total_recurring or 0
+        stats = task_stats.summary(current_user.id, day_from, day_to)
 
         return render_template('dashboard.html',
-                               total_tasks=total_tasks,
-                               pending=pending,
-                               in_progress=in_progress,
-                               done=done,
-                               total_urgent=total_urgent,
-                               total_important=total_important,
-                               total_recurring=total_recurring,
-                               pending_urgent=pending_urgent,
-                               pending_important=pending_important,
-                               pending_recurring=pending_recurring,
-                               in_progress_urgent=in_progress_urgent,
-                               in_progress_important=in_progress_important,
-                               in_progress_recurring=in_progress_recurring,
-                               done_urgent=done_urgent,
-                               done_important=done_important,
-                               done_recurring=done_recurring,
+                               **stats,
                                date_from=date_from,
                                date_to=date_to)
 
@@ -344,11 +168,7 @@ def list_tasks(status=None):
 
         # Filter by assigned user
         if assigned_user:
-            task_ids = [a.task_id for a in TaskAssignment.query.filter_by(
-                user_id=int(assigned_user),
-                accepted=True
-            ).all()]
-            query = query.filter(Task.id.in_(task_ids))
+            query = query.filter(assigned_to(int(assigned_user)))
 
         # Filter theo tags
         if tag_filter == 'urgent':
@@ -388,22 +208,11 @@ def list_tasks(status=None):
 
         all_users = User.query.filter_by(is_active=True).order_by(User.full_name).all()
     else:
-        # Only see assigned tasks
-        accepted_assignments = TaskAssignment.query.filter_by(
-            user_id=current_user.id,
-            accepted=True
-        ).all()
-        assigned_task_ids = [a.task_id for a in accepted_assignments]
-
+        # Only see assigned tasks (hoặc task mình tạo)
         # ===== ✅ EAGER LOAD CHỈ CREATOR =====
-        query = Task.query.options(
+        query = visible_tasks_query(current_user, query=Task.query.options(
             joinedload(Task.creator)
-        ).filter(
-            or_(
-                Task.id.in_(assigned_task_ids),
-                Task.creator_id == current_user.id
-            )
-        )
+        ))
 
         if status:
             query = query.filter_by(status=status)
@@ -675,15 +484,13 @@ def create_task():
                         User.is_active == True
                     ).all()
 
-                for approver in approvers:
-                    notif = Notification(
-                        user_id=approver.id,
-                        type='task_approval_request',
-                        title='🔔 Yêu cầu phê duyệt công việc',
-                        body=f'{current_user.full_name} đã tạo công việc "{title}" và cần phê duyệt.',
-                        link=f'/tasks/{task.id}'
-                    )
-                    db.session.add(notif)
+                notification_service.notify_many(
+                    [approver.id for approver in approvers],
+                    type='task_approval_request',
+                    title='🔔 Yêu cầu phê duyệt công việc',
+                    body=f'{current_user.full_name} đã tạo công việc "{title}" và cần phê duyệt.',
+                    link=f'/tasks/{task.id}'
+                )
 
                 flash('Công việc đã được tạo và đang chờ phê duyệt.', 'info')
                 has_flashed = True
@@ -728,14 +535,13 @@ def create_task():
                     )
                     db.session.add(assignment)
 
-                    notif = Notification(
-                        user_id=user.id,
-                        type='task_assigned',
-                        title='Nhiệm vụ mới cho nhóm',
-                        body=f'{current_user.full_name} đã giao nhiệm vụ {title} cho nhóm. Vui lòng liên hệ các thành viên trong nhóm để thảo luận và làm việc.',
-                        link=f'/tasks/{task.id}'
-                    )
-                    db.session.add(notif)
+                notification_service.notify_many(
+                    [user.id for user in users_in_group],
+                    type='task_assigned',
+                    title='Nhiệm vụ mới cho nhóm',
+                    body=f'{current_user.full_name} đã giao nhiệm vụ {title} cho nhóm. Vui lòng liên hệ các thành viên trong nhóm để thảo luận và làm việc.',
+                    link=f'/tasks/{task.id}'
+                )
             else:
                 flash('Bạn không có quyền giao nhiệm vụ cho nhóm.', 'danger')
                 db.session.rollback()
@@ -843,15 +649,14 @@ def create_task():
                         )
                         db.session.add(assignment)
 
-                        # Gửi notification cho từng người
-                        notif = Notification(
-                            user_id=user_id,
-                            type='task_assigned',
-                            title='Nhiệm vụ mới được giao',
-                            body=f'{current_user.full_name} đã giao nhiệm vụ "{title}" cho bạn.',
-                            link=f'/tasks/{task.id}'
-                        )
-                        db.session.add(notif)
+                    # Gửi notification cho tất cả người được giao (1 câu INSERT)
+                    notification_service.notify_many(
+                        [int(user_id_str) for user_id_str in assign_to_multiple],
+                        type='task_assigned',
+                        title='Nhiệm vụ mới được giao',
+                        body=f'{current_user.full_name} đã giao nhiệm vụ "{title}" cho bạn.',
+                        link=f'/tasks/{task.id}'
+                    )
 
                     flash(f'Đã giao nhiệm vụ cho {len(assign_to_multiple)} người.', 'success')
                     has_flashed = True
@@ -1123,15 +928,16 @@ def update_status(task_id):
             )
             db.session.add(creator_notif)
 
-            # Thông báo nhắc đánh giá
-            rating_reminder = Notification(
-                user_id=creator.id,
-                type='task_needs_rating',
-                title='🌟 Cần đánh giá hiệu suất',
-                body=f'Nhiệm vụ "{task.title}" đã hoàn thành bởi Trưởng phòng {current_user.full_name}. Vui lòng đánh giá hiệu suất!',
-                link=f'/tasks/{task.id}'
-            )
-            db.session.add(rating_reminder)
+            # Thông báo nhắc đánh giá (chế độ tổng hợp -> nằm trong digest định kỳ)
+            if not creator.wants_digest():
+                rating_reminder = Notification(
+                    user_id=creator.id,
+                    type='task_needs_rating',
+                    title='🌟 Cần đánh giá hiệu suất',
+                    body=f'Nhiệm vụ "{task.title}" đã hoàn thành bởi Trưởng phòng {current_user.full_name}. Vui lòng đánh giá hiệu suất!',
+                    link=f'/tasks/{task.id}'
+                )
+                db.session.add(rating_reminder)
 
         # TRƯỜNG HỢP 3: Các trường hợp khác (HR, Accountant, etc.)
         else:
@@ -1156,33 +962,26 @@ def update_status(task_id):
                 )
                 db.session.add(creator_notif)
 
-                # Nhắc đánh giá
-                rating_reminder = Notification(
-                    user_id=creator.id,
-                    type='task_needs_rating',
-                    title='🌟 Cần đánh giá hiệu suất',
-                    body=f'Nhiệm vụ "{task.title}" đã hoàn thành bởi {current_user.full_name}. Vui lòng đánh giá hiệu suất!',
-                    link=f'/tasks/{task.id}'
-                )
-                db.session.add(rating_reminder)
-
-            # Gửi cho director/manager khác (nếu có)
-            managers = User.query.filter(
-                User.role.in_(['director', 'manager']),
-                User.is_active == True,
-                User.id != current_user.id,
-                User.id != creator.id
-            ).all()
+                # Nhắc đánh giá (chế độ tổng hợp -> nằm trong digest định kỳ)
+                if not creator.wants_digest():
+                    rating_reminder = Notification(
+                        user_id=creator.id,
+                        type='task_needs_rating',
+                        title='🌟 Cần đánh giá hiệu suất',
+                        body=f'Nhiệm vụ "{task.title}" đã hoàn thành bởi {current_user.full_name}. Vui lòng đánh giá hiệu suất!',
+                        link=f'/tasks/{task.id}'
+                    )
+                    db.session.add(rating_reminder)
 
-            for manager in managers:
-                manager_notif = Notification(
-                    user_id=manager.id,
-                    type='task_completed',
-                    title=notif_title,
-                    body=notif_body,
-                    link=f'/tasks/{task.id}'
-                )
-                db.session.add(manager_notif)
+            # Gửi cho director/manager khác (nếu có) - người bật chế độ tổng hợp nhận qua digest
+            notification_service.notify_audience(
+                'managers',
+                exclude=[current_user.id, creator.id],
+                type='task_completed',
+                title=notif_title,
+                body=notif_body,
+                link=f'/tasks/{task.id}'
+            )
 
     elif old_status == 'DONE' and new_status != 'DONE':
         task.completed_overdue = False
@@ -1245,16 +1044,16 @@ def bulk_delete_tasks():
             TaskComment.task_id.in_(task_ids)
         ).delete(synchronize_session=False)
 
+        # Bulk delete không qua mapper events -> trừ các task khỏi task_stats (trước khi xóa assignment)
+        task_stats.remove_tasks(task_ids)
+
         # 3. Xóa TaskAssignment
         TaskAssignment.query.filter(
             TaskAssignment.task_id.in_(task_ids)
         ).delete(synchronize_session=False)
 
-        # 4. Xóa Notifications liên quan
-        for task_id in task_ids:
-            Notification.query.filter(
-                Notification.link == f'/tasks/{task_id}'
-            ).delete(synchronize_session=False)
+        # 4. Xóa Notifications liên quan (1 câu DELETE cho mọi task)
+        notification_service.delete_for_targets('task', task_ids)
 
         # 5. Cuối cùng xóa Tasks
         deleted_count = Task.query.filter(
@@ -1280,11 +1079,10 @@ def delete_task(task_id):
         return redirect(url_for('tasks.task_detail', task_id=task_id))
 
     try:
-        # Xóa tất cả assignments liên quan trước
-        TaskAssignment.query.filter_by(task_id=task_id).delete()
-
+        # Assignments xóa theo cascade của Task.assignments (qua ORM, không bulk delete):
+        # mapper events của task_stats trừ task khỏi số liệu của từng người được giao
         # Xóa notifications liên quan đến task này
-        Notification.query.filter(Notification.link == f'/tasks/{task_id}').delete()
+        notification_service.delete_for_targets('task', [task_id])
 
         # Sau đó xóa task
         db.session.delete(task)
@@ -1499,131 +1297,112 @@ def pending_approvals():
 #  KANBAN BOARD ROUTES
 # ============================================
 
-@bp.route('/kanban')
-@login_required
-def kanban():
-    """Kanban Board - Hiển thị tasks theo dạng cột"""
-    # Get filters
-    assigned_user = request.args.get('assigned_user', '')
-    tag_filter = request.args.get('tag', '')
-    search = request.args.get('search', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
+KANBAN_STATUSES = ('PENDING', 'IN_PROGRESS', 'DONE')
 
-    now = datetime.utcnow()
 
-    # ===== ✅ IMPORT EAGER LOADING =====
+def _kanban_filters():
+    """Bộ lọc Kanban từ query string - dùng chung cho trang và /kanban/cards"""
+    return {
+        'assigned_user': request.args.get('assigned_user', ''),
+        'tag': request.args.get('tag', ''),
+        'search': request.args.get('search', ''),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+        'done_days': request.args.get(
+            'done_days', current_app.config.get('KANBAN_DONE_DAYS', 30), type=int
+        )
+    }
+
+
+def _kanban_query(filters):
+    """Query task đã lọc theo quyền xem + bộ lọc (chưa lọc status / sắp xếp)"""
     from sqlalchemy.orm import joinedload
-    from sqlalchemy import case, func
 
-    # Base query theo role
-    if current_user.role in ['director', 'manager']:
-        # ===== ✅ EAGER LOAD CREATOR =====
-        query = Task.query.options(
-            joinedload(Task.creator)
-        )
-    else:
-        # HR/Accountant: only their tasks
-        accepted_assignments = TaskAssignment.query.filter_by(
-            user_id=current_user.id,
-            accepted=True
-        ).all()
-        assigned_task_ids = [a.task_id for a in accepted_assignments]
-        query = Task.query.options(
-            joinedload(Task.creator)
-        ).filter(
-            or_(
-                Task.id.in_(assigned_task_ids),
-                Task.creator_id == current_user.id
-            )
-        )
+    # Base query theo role (HR/Accountant: only their tasks)
+    # ===== ✅ EAGER LOAD CREATOR =====
+    query = visible_tasks_query(current_user, query=Task.query.options(
+        joinedload(Task.creator)
+    ))
 
     # Apply date filters
-    if date_from:
+    if filters['date_from']:
         try:
-            date_from_dt = datetime.strptime(date_from, '%Y-%m-%d')
-            from app.utils import vn_to_utc
-            date_from_utc = vn_to_utc(date_from_dt)
-            query = query.filter(Task.created_at >= date_from_utc)
+            date_from_dt = datetime.strptime(filters['date_from'], '%Y-%m-%d')
+            query = query.filter(Task.created_at >= vn_to_utc(date_from_dt))
         except:
             pass
 
-    if date_to:
+    if filters['date_to']:
         try:
-            date_to_dt = datetime.strptime(date_to, '%Y-%m-%d')
+            date_to_dt = datetime.strptime(filters['date_to'], '%Y-%m-%d')
             date_to_dt = date_to_dt.replace(hour=23, minute=59, second=59)
-            from app.utils import vn_to_utc
-            date_to_utc = vn_to_utc(date_to_dt)
-            query = query.filter(Task.created_at <= date_to_utc)
+            query = query.filter(Task.created_at <= vn_to_utc(date_to_dt))
         except:
             pass
 
+    # Cột DONE mặc định chỉ gồm task hoàn thành gần đây (không lọc khi đã chọn khoảng ngày)
+    if filters['done_days'] > 0 and not (filters['date_from'] or filters['date_to']):
+        done_since = datetime.utcnow() - timedelta(days=filters['done_days'])
+        query = query.filter(or_(Task.status != 'DONE', Task.updated_at >= done_since))
+
     # Apply filters
-    if assigned_user:
-        task_ids = [a.task_id for a in TaskAssignment.query.filter_by(
-            user_id=int(assigned_user),
-            accepted=True
-        ).all()]
-        query = query.filter(Task.id.in_(task_ids))
+    if filters['assigned_user']:
+        query = query.filter(assigned_to(int(filters['assigned_user'])))
 
-    if tag_filter == 'urgent':
+    if filters['tag'] == 'urgent':
         query = query.filter_by(is_urgent=True)
-    elif tag_filter == 'important':
+    elif filters['tag'] == 'important':
         query = query.filter_by(is_important=True)
-    elif tag_filter == 'recurring':
+    elif filters['tag'] == 'recurring':
         query = query.filter_by(is_recurring=True)
 
-    if search:
-        query = query.filter(Task.title.ilike(f'%{search}%'))
-
-    # ===== ✅ TỐI ƯU: SORT BẰNG SQL THAY VÌ PYTHON =====
-    # Sort priority cho PENDING và IN_PROGRESS
-    priority_order = case(
-        (Task.due_date < func.now(), 1),  # Overdue first
-        (Task.is_urgent == True, 2),
-        (Task.is_important == True, 3),
-        (Task.is_recurring == True, 4),
-        else_=5
-    )
+    if filters['search']:
+        query = query.filter(Task.title.ilike(f'%{filters["search"]}%'))
 
-    # Query cho từng status với sorting SQL
-    pending_tasks = query.filter(Task.status == 'PENDING').order_by(
-        priority_order.asc(),
-        Task.created_at.desc()
-    ).all()
+    return query
 
-    in_progress_tasks = query.filter(Task.status == 'IN_PROGRESS').order_by(
-        priority_order.asc(),
-        Task.created_at.desc()
-    ).all()
 
-    done_tasks = query.filter(Task.status == 'DONE').order_by(
-        Task.updated_at.desc()
+def _attach_assignments(tasks):
+    """Batch load assignments + users của các thẻ trong 1 query"""
+    from sqlalchemy.orm import joinedload
+
+    if not tasks:
+        return
+
+    all_assignments = db.session.query(TaskAssignment).options(
+        joinedload(TaskAssignment.user)
+    ).filter(
+        TaskAssignment.task_id.in_([task.id for task in tasks])
     ).all()
 
-    # ===== ✅ BATCH LOAD ASSIGNMENTS CHO TẤT CẢ TASKS =====
-    all_tasks = pending_tasks + in_progress_tasks + done_tasks
+    # Tạo dictionary: task_id -> list of assignments
+    assignments_by_task = {}
+    for assignment in all_assignments:
+        assignments_by_task.setdefault(assignment.task_id, []).append(assignment)
 
-    if all_tasks:
-        task_ids = [task.id for task in all_tasks]
+    for task in tasks:
+        task._cached_assignments = assignments_by_task.get(task.id, [])
 
-        # Load tất cả assignments + users trong 1 query
-        all_assignments = db.session.query(TaskAssignment).options(
-            joinedload(TaskAssignment.user)
-        ).filter(
-            TaskAssignment.task_id.in_(task_ids)
-        ).all()
 
-        # Tạo dictionary: task_id -> list of assignments
-        assignments_by_task = {}
-        for assignment in all_assignments:
-            if assignment.task_id not in assignments_by_task:
-                assignments_by_task[assignment.task_id] = []
-            assignments_by_task[assignment.task_id].append(assignment)
+@bp.route('/kanban')
+@login_required
+def kanban():
+    """Kanban Board - Hiển thị tasks theo dạng cột, mỗi cột render trang đầu, cuộn để tải thêm"""
+    filters = _kanban_filters()
+    now = datetime.utcnow()
+    limit = current_app.config.get('KANBAN_PAGE_SIZE', 20)
+    query = _kanban_query(filters)
 
-        # Gán vào tasks
-        for task in all_tasks:
-            task._cached_assignments = assignments_by_task.get(task.id, [])
+    # Số thẻ mỗi cột: 1 query GROUP BY thay vì đếm danh sách đã load
+    counts = dict.fromkeys(KANBAN_STATUSES, 0)
+    counts.update(query.order_by(None).with_entities(Task.status, func.count(Task.id)).group_by(Task.status).all())
+
+    tasks_by_status = {}
+    next_cursors = {}
+    for status in KANBAN_STATUSES:
+        tasks_by_status[status], next_cursors[status] = kanban_page(query, status, now, limit=limit)
+
+    _attach_assignments([task for tasks in tasks_by_status.values() for task in tasks])
 
     # Get all users for filter
     all_users = None
@@ -1631,17 +1410,43 @@ def kanban():
         all_users = User.query.filter_by(is_active=True).order_by(User.full_name).all()
 
     return render_template('kanban.html',
-                           pending_tasks=pending_tasks,
-                           in_progress_tasks=in_progress_tasks,
-                           done_tasks=done_tasks,
+                           tasks_by_status=tasks_by_status,
+                           next_cursors=next_cursors,
+                           counts=counts,
                            all_users=all_users,
-                           assigned_user=assigned_user,
-                           tag_filter=tag_filter,
-                           search=search,
-                           date_from=date_from,
-                           date_to=date_to,
+                           assigned_user=filters['assigned_user'],
+                           tag_filter=filters['tag'],
+                           search=filters['search'],
+                           date_from=filters['date_from'],
+                           date_to=filters['date_to'],
+                           done_days=filters['done_days'],
                            now=now)
 
+
+@bp.route('/kanban/cards')
+@login_required
+def kanban_cards():
+    """Trang tiếp theo của 1 cột Kanban (HTML thẻ + cursor) - gọi khi cuộn tới cuối cột"""
+    status = request.args.get('status', '')
+    if status not in KANBAN_STATUSES:
+        return jsonify({'error': 'Trạng thái không hợp lệ'}), 400
+
+    now = datetime.utcnow()
+    tasks, next_cursor = kanban_page(
+        _kanban_query(_kanban_filters()),
+        status,
+        now,
+        cursor=request.args.get('cursor'),
+        limit=current_app.config.get('KANBAN_PAGE_SIZE', 20)
+    )
+    _attach_assignments(tasks)
+
+    return jsonify({
+        'html': render_template('components/kanban_cards.html', tasks=tasks, now=now),
+        'count': len(tasks),
+        'next_cursor': next_cursor
+    })
+
 # ============================================
 #  Priority ROUTES
 # ============================================
@@ -2178,33 +1983,13 @@ def add_comment(task_id):
             if assignment.user_id != current_user.id:
                 notification_recipients.add(assignment.user_id)
 
-        for recipient_id in notification_recipients:
-            existing_notif = Notification.query.filter_by(
-                user_id=recipient_id,
-                type='task_comment',
-                link=f'/tasks/{task_id}/discussion',
-                read=False  # ← CHỈ TÌM NOTIFICATION CHƯA ĐỌC
-            ).order_by(Notification.created_at.desc()).first()
-
-            if existing_notif:
-                # Đếm comments sau notification
-                unread_count = TaskComment.query.filter(
-                    TaskComment.task_id == task_id,
-                    TaskComment.created_at > existing_notif.created_at
-                ).count()
-
-                existing_notif.title = f'💬 {unread_count} tin nhắn mới trong nhiệm vụ {task.title}'
-                existing_notif.body = f'{current_user.full_name} đã bình luận'
-                existing_notif.read = False
-            else:
-                notif = Notification(
-                    user_id=recipient_id,
-                    type='task_comment',
-                    title=f'💬 Tin nhắn mới trong nhiệm vụ {task.title}',
-                    body=f'{current_user.full_name} đã bình luận',
-                    link=f'/tasks/{task_id}/discussion'
-                )
-                db.session.add(notif)
+        # Gộp vào thông báo chưa đọc của từng người (1 câu upsert cho mọi người nhận)
+        notification_service.notify_coalesced(
+            notification_recipients,
+            subject=task.title,
+            body=f'{current_user.full_name} đã bình luận',
+            link=f'/tasks/{task_id}/discussion'
+        )
 
         db.session.commit()
 
@@ -2261,7 +2046,7 @@ def add_comment(task_id):
 @login_required
 def delete_comment(task_id, comment_id):
     """Xóa comment (và TẤT CẢ file đính kèm)"""
-    from app.models import TaskComment, TaskCommentAttachment
+    from app.models import TaskComment, TaskCommentAttachment, CommentTombstone
 
     comment = TaskComment.query.get_or_404(comment_id)
 
@@ -2300,6 +2085,9 @@ def delete_comment(task_id, comment_id):
 
         # 3. Xóa comment trong database (cascade sẽ tự động xóa attachments)
         db.session.delete(comment)
+
+        # 4. Tombstone để SSE / client đồng bộ xóa theo id
+        CommentTombstone.record('task', task_id, comment_id)
         db.session.commit()
 
         return jsonify({'success': True})
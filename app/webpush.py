@@ -0,0 +1,269 @@
+"""
+Web Push (VAPID) - báo thông báo tới thiết bị kể cả khi không mở tab nào
+- Subscription lưu theo từng trình duyệt / thiết bị (bảng push_subscriptions)
+- Không gửi trên request: thông báo commit -> hàng đợi trong process -> 1 thread nền gom lô,
+  nạp subscription của cả lô bằng 1 query rồi gửi song song
+- pywebpush là dependency tùy chọn: chưa cài hoặc chưa có VAPID_PRIVATE_KEY -> tắt Web Push
+- WEB_PUSH_MOCK=true: POST payload JSON thô (không mã hóa) tới endpoint của subscription.
+  Test local: tạo PushSubscription với endpoint http://localhost:5000/notifications/push/mock
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+
+try:
+    from pywebpush import webpush, WebPushException
+except ImportError:
+    webpush = None
+    WebPushException = None
+
+PUSH_QUEUE_SIZE = 5000
+PUSH_BATCH_SIZE = 200
+PUSH_FLUSH_INTERVAL = 2       # giây chờ gom thêm sự kiện vào 1 lô
+PUSH_CONCURRENCY = 10
+PUSH_TTL = 86400              # push service giữ tối đa 1 ngày khi thiết bị offline
+PUSH_TIMEOUT = 10
+PUSH_MAX_FAILURES = 5         # lỗi liên tiếp -> bỏ subscription
+PUSH_GONE_STATUSES = (404, 410)
+MOCK_INBOX_SIZE = 100
+
+_PENDING_KEY = 'webpush_pending'
+_events_registered = False
+
+# Payload nhận được qua /notifications/push/mock (chỉ dùng khi WEB_PUSH_MOCK)
+mock_inbox = deque(maxlen=MOCK_INBOX_SIZE)
+
+
+# ============================================================
+# SENDERS - trả về HTTP status (None nếu lỗi kết nối)
+# ============================================================
+class VapidSender:
+    """Gửi qua push service của trình duyệt (mã hóa aes128gcm + chữ ký VAPID)"""
+
+    def __init__(self, private_key, subject):
+        self.private_key = private_key
+        self.subject = subject
+
+    def __call__(self, subscription_info, data):
+        try:
+            response = webpush(
+                subscription_info,
+                data,
+                vapid_private_key=self.private_key,
+                vapid_claims={'sub': self.subject},
+                ttl=PUSH_TTL,
+                timeout=PUSH_TIMEOUT
+            )
+            return response.status_code
+        except WebPushException as e:
+            return e.response.status_code if e.response is not None else None
+        except Exception:
+            return None
+
+
+class MockSender:
+    """POST payload JSON thô tới endpoint - không cần pywebpush / VAPID"""
+
+    def __call__(self, subscription_info, data):
+        request = urllib.request.Request(
+            subscription_info['endpoint'],
+            data=data.encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'TTL': str(PUSH_TTL)},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=PUSH_TIMEOUT) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (urllib.error.URLError, OSError):
+            return None
+
+
+# ============================================================
+# DISPATCHER
+# ============================================================
+class PushDispatcher:
+    """Hàng đợi push của 1 worker - thread nền khởi động ở lần enqueue đầu tiên"""
+
+    def __init__(self, app, sender):
+        self.app = app
+        self.sender = sender
+        self.queue = queue.Queue(maxsize=PUSH_QUEUE_SIZE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=PUSH_CONCURRENCY, thread_name_prefix='webpush')
+        self.sent = 0
+        self.failed = 0
+        self.removed = 0
+        self.dropped = 0
+
+    def enqueue(self, user_ids, payload):
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait((tuple(user_ids), payload))
+        except queue.Full:
+            # Push chỉ là kênh báo phụ - thông báo vẫn nằm trong DB
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='webpush-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + PUSH_FLUSH_INTERVAL
+        while len(batch) < PUSH_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                with self.app.app_context():
+                    self.flush(batch)
+            except Exception as e:
+                self.app.logger.error(f"Web push dispatch error: {e}")
+
+    def flush(self, batch):
+        """Gửi 1 lô (cần app context): 1 query subscription cho mọi user trong lô"""
+        from app import db
+        from app.models import PushSubscription
+
+        user_ids = {user_id for ids, _ in batch for user_id in ids}
+        by_user = {}
+        for subscription in PushSubscription.query.filter(PushSubscription.user_id.in_(user_ids)):
+            by_user.setdefault(subscription.user_id, []).append(subscription)
+        if not by_user:
+            return
+
+        jobs = []
+        for ids, payload in batch:
+            data = json.dumps(payload, ensure_ascii=False)
+            for user_id in ids:
+                for subscription in by_user.get(user_id, ()):
+                    jobs.append((subscription, subscription.info(), data))
+
+        statuses = self._pool.map(lambda job: self.sender(job[1], job[2]), jobs)
+
+        now = datetime.utcnow()
+        gone = set()
+        for (subscription, _, _), status in zip(jobs, statuses):
+            if subscription.id in gone:
+                continue
+            if status is not None and 200 <= status < 300:
+                subscription.failure_count = 0
+                subscription.last_success_at = now
+                self.sent += 1
+                continue
+
+            self.failed += 1
+            subscription.failure_count = (subscription.failure_count or 0) + 1
+            if status in PUSH_GONE_STATUSES or subscription.failure_count >= PUSH_MAX_FAILURES:
+                gone.add(subscription.id)
+                db.session.delete(subscription)
+                self.removed += 1
+
+        db.session.commit()
+
+    def stats(self):
+        return {
+            'sender': type(self.sender).__name__,
+            'queued': self.queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'removed_subscriptions': self.removed,
+            'dropped': self.dropped
+        }
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+def init_app(app):
+    if app.config.get('WEB_PUSH_MOCK'):
+        sender = MockSender()
+    elif webpush is not None and app.config.get('VAPID_PRIVATE_KEY'):
+        sender = VapidSender(app.config['VAPID_PRIVATE_KEY'], app.config.get('VAPID_SUBJECT'))
+    else:
+        sender = None
+
+    app.extensions['webpush'] = PushDispatcher(app, sender) if sender is not None else None
+    _register_events()
+
+
+def get_dispatcher():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('webpush')
+
+
+def is_enabled():
+    return get_dispatcher() is not None
+
+
+def payload_for(title, body=None, link=None):
+    return {
+        'title': title,
+        'body': body or '',
+        'link': link or '/notifications/',
+        # Cùng tag -> thiết bị thay thông báo cũ thay vì xếp chồng
+        'tag': link or title
+    }
+
+
+def queue_push(session, user_ids, payload):
+    """Đăng ký push gắn với transaction hiện tại - chỉ vào hàng đợi khi session commit"""
+    if not user_ids or not is_enabled():
+        return
+    session.info.setdefault(_PENDING_KEY, []).append((tuple(user_ids), payload))
+
+
+# ============================================================
+# SESSION HOOKS
+# ============================================================
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    dispatcher = get_dispatcher()
+    if dispatcher is None:
+        return
+    for user_ids, payload in pending:
+        dispatcher.enqueue(user_ids, payload)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _register_events():
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', lambda session, previous: _after_rollback(session))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Benchmark: /hub/api/realtime-stats - ~13 query scalar (cũ) vs 1 query CTE/FILTER (app/hub_stats.py) vs cache TTL
+Usage: python bench_hub_stats.py [số task]   (mặc định 100000)
+
+Dữ liệu seed giống bench_task_visibility.py (BENCH_DATABASE_URL, mặc định sqlite:///bench_tasks.db).
+KHÔNG trỏ vào database thật - script xóa và tạo lại toàn bộ bảng.
+"""
+
+from app import create_app, db, hub_stats, notification_service, task_stats
+from app.models import User, Task, TaskAssignment, News, NewsConfirmation, Penalty, Advance
+from bench_task_visibility import BenchConfig, TASK_COUNT, seed, timed
+from sqlalchemy import insert, func
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import time
+
+NEWS_COUNT = 200
+
+
+def seed_extra(user_ids):
+    """Tin tức (mỗi user đã xác nhận 1 nửa), phạt / tạm ứng chưa trừ lương"""
+    today = datetime.utcnow().date()
+    db.session.execute(insert(News), [
+        {'title': f'News {i}', 'content': '-', 'author_id': user_ids[0]}
+        for i in range(NEWS_COUNT)
+    ])
+    news_ids = [news_id for news_id, in db.session.query(News.id)]
+    db.session.execute(insert(NewsConfirmation), [
+        {'news_id': news_id, 'user_id': user_id}
+        for user_id in user_ids
+        for news_id in news_ids[::2]
+    ])
+    db.session.execute(insert(Penalty), [
+        {'employee_name': f'Employee {i % 50}', 'penalty_date': today, 'amount': 100000, 'reason': '-',
+         'is_deducted': i % 3 == 0, 'created_by': user_ids[0]}
+        for i in range(300)
+    ])
+    db.session.execute(insert(Advance), [
+        {'employee_name': f'Employee {i % 50}', 'advance_date': today, 'amount': 500000, 'reason': '-',
+         'is_deducted': i % 2 == 0, 'created_by': user_ids[0]}
+        for i in range(300)
+    ])
+    db.session.commit()
+
+
+def old_realtime_stats(user):
+    """Bản cũ của hub.get_realtime_stats (trước app/hub_stats.py)"""
+    now = datetime.utcnow()
+    my_task_ids_subq = db.session.query(TaskAssignment.task_id).filter(
+        TaskAssignment.user_id == user.id,
+        TaskAssignment.accepted == True
+    ).scalar_subquery()
+
+    def count(*criteria, model=Task):
+        return db.session.query(func.count(model.id)).filter(*criteria).scalar() or 0
+
+    stats = {
+        'my_overdue': count(Task.id.in_(my_task_ids_subq), Task.due_date < now,
+                            Task.status.in_(['PENDING', 'IN_PROGRESS'])),
+        'my_due_soon': count(Task.id.in_(my_task_ids_subq), Task.due_date >= now,
+                             Task.due_date <= now + timedelta(days=3), Task.status.in_(['PENDING', 'IN_PROGRESS'])),
+        'my_pending_tasks': count(Task.id.in_(my_task_ids_subq), Task.status == 'PENDING'),
+        'my_in_progress': count(Task.id.in_(my_task_ids_subq), Task.status == 'IN_PROGRESS'),
+        'unread_notifications': notification_service.get_unread_count(user.id),
+        'unconfirmed_news': count(~News.confirmations.any(user_id=user.id), model=News),
+        'team_overdue': 0,
+        'team_pending': 0,
+        'tasks_need_rating': 0,
+        'my_tasks_need_rating': 0,
+        'tasks_need_approval': 0,
+        'pending_penalties': 0,
+        'pending_advances': 0,
+    }
+
+    if user.role in ['director', 'manager']:
+        stats['team_overdue'] = count(Task.due_date < now, Task.status.in_(['PENDING', 'IN_PROGRESS']))
+        stats['team_pending'] = count(Task.status == 'PENDING')
+        stats['tasks_need_rating'] = count(Task.status == 'DONE', Task.performance_rating == None)
+        stats['my_tasks_need_rating'] = count(Task.creator_id == user.id, Task.status == 'DONE',
+                                              Task.performance_rating == None)
+        approval_query = Task.query.filter(Task.requires_approval == True, Task.approved == None)
+        if user.role == 'manager':
+            approval_query = approval_query.join(User, Task.creator_id == User.id).filter(User.role == 'hr')
+        stats['tasks_need_approval'] = approval_query.count()
+
+    if user.role in ['director', 'accountant']:
+        stats['pending_penalties'] = count(Penalty.is_deducted == False, model=Penalty)
+        stats['pending_advances'] = count(Advance.is_deducted == False, model=Advance)
+
+    return stats
+
+
+def run(users):
+    print(f"{'User':<28}{'13 query (ms)':>15}{'1 query (ms)':>15}{'cache (ms)':>13}{'x':>8}")
+    for user in users:
+        # timed() expire_all -> dùng bản sao id / role để đường cache không phát sinh query load lại User
+        user = SimpleNamespace(id=user.id, role=user.role)
+        new = hub_stats.compute(user.id, user.role)
+        old = old_realtime_stats(user)
+        assert all(new[key] == value for key, value in old.items()), (user.role, old, new)
+
+        hub_stats.stats_cache.invalidate()
+        hub_stats.get(user)
+
+        old_ms = timed(lambda: old_realtime_stats(user))
+        new_ms = timed(lambda: hub_stats.compute(user.id, user.role))
+        cached_ms = timed(lambda: hub_stats.get(user))
+        print(f"{user.role + ' #' + str(user.id):<28}{old_ms:>15.2f}{new_ms:>15.2f}{cached_ms:>13.3f}{old_ms / new_ms:>8.1f}")
+
+
+if __name__ == '__main__':
+    app = create_app(BenchConfig)
+    with app.app_context():
+        print(f"Seeding {TASK_COUNT} tasks vào {db.engine.url}...")
+        started = time.perf_counter()
+        employee = seed()
+        user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+        seed_extra(user_ids)
+        days = task_stats.rebuild()
+        print(f"Seeded trong {time.perf_counter() - started:.1f}s ({days} ngày task_stats)\n")
+
+        users = [
+            User.query.filter_by(role='director').first(),
+            User.query.filter_by(role='manager').first(),
+            employee
+        ]
+        run(users)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Benchmark: lọc task theo người được giao - IN list (cũ) vs EXISTS (app/task_queries.py)
+Usage: python bench_task_visibility.py [số task]   (mặc định 100000)
+
+Dùng database riêng: BENCH_DATABASE_URL (mặc định sqlite:///bench_tasks.db trong thư mục hiện tại).
+KHÔNG trỏ vào database thật - script xóa và tạo lại toàn bộ bảng.
+"""
+
+from app import create_app, db
+from app.models import User, Task, TaskAssignment
+from app.task_queries import assigned_to, visible_tasks_query
+from config import Config
+from sqlalchemy import insert, func, case, or_
+from datetime import datetime, timedelta
+import os
+import random
+import statistics
+import sys
+import time
+
+TASK_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+USER_COUNT = 30
+RUNS = 20
+BATCH = 5000
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///' + os.path.abspath('bench_tasks.db'))
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+
+    roles = ['director', 'manager'] + ['accountant', 'hr'] * (USER_COUNT // 2)
+    db.session.execute(insert(User), [
+        {
+            'email': f'bench{i}@company.com',
+            'password_hash': '-',
+            'full_name': f'Bench User {i}',
+            'role': roles[i],
+            'is_active': True
+        }
+        for i in range(USER_COUNT)
+    ])
+    user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+
+    random.seed(42)
+    now = datetime.utcnow()
+    # Phân bố lệch: vài nhân viên "lâu năm" có rất nhiều task
+    weights = [1 + (i % 5) ** 3 for i in range(len(user_ids))]
+
+    for start in range(0, TASK_COUNT, BATCH):
+        size = min(BATCH, TASK_COUNT - start)
+        tasks = []
+        for offset in range(size):
+            created = now - timedelta(minutes=random.randint(0, 3 * 365 * 24 * 60))
+            tasks.append({
+                'id': start + offset + 1,
+                'title': f'Task {start + offset}',
+                'creator_id': random.choice(user_ids[:2]),
+                'status': random.choice(['PENDING', 'IN_PROGRESS', 'DONE', 'DONE', 'DONE']),
+                'is_urgent': random.random() < 0.1,
+                'is_important': random.random() < 0.2,
+                'due_date': created + timedelta(days=random.randint(1, 30)),
+                'created_at': created,
+                'updated_at': created
+            })
+        db.session.execute(insert(Task), tasks)
+
+        assignments = []
+        for task in tasks:
+            for user_id in set(random.choices(user_ids, weights=weights, k=random.randint(1, 3))):
+                assignments.append({
+                    'task_id': task['id'],
+                    'user_id': user_id,
+                    'assigned_by': task['creator_id'],
+                    'accepted': True,
+                    'created_at': task['created_at']
+                })
+        db.session.execute(insert(TaskAssignment), assignments)
+        db.session.commit()
+
+    # Nhân viên nhiều task nhất
+    return db.session.query(User).join(TaskAssignment, TaskAssignment.user_id == User.id).filter(
+        User.role.notin_(['director', 'manager'])
+    ).group_by(User.id).order_by(func.count(TaskAssignment.id).desc()).first()
+
+
+def timed(fn):
+    samples = []
+    for _ in range(RUNS):
+        db.session.expire_all()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        db.session.rollback()
+    return statistics.median(samples)
+
+
+def old_ids(user_id):
+    return [a.task_id for a in TaskAssignment.query.filter_by(user_id=user_id, accepted=True).all()]
+
+
+def dashboard_stats(condition):
+    return db.session.query(
+        func.count(Task.id),
+        func.sum(case((Task.status == 'DONE', 1), else_=0)),
+        func.sum(case((Task.is_urgent == True, 1), else_=0))
+    ).filter(condition).one()
+
+
+def run(employee, director):
+    cases = {
+        'list_tasks (nhân viên, trang 1)': (
+            lambda: Task.query.filter(or_(Task.id.in_(old_ids(employee.id)), Task.creator_id == employee.id))
+            .order_by(Task.created_at.desc(), Task.id).limit(10).all(),
+            lambda: visible_tasks_query(employee)
+            .order_by(Task.created_at.desc(), Task.id).limit(10).all()
+        ),
+        'dashboard (lọc assigned_user)': (
+            lambda: dashboard_stats(Task.id.in_(old_ids(employee.id))),
+            lambda: dashboard_stats(assigned_to(employee.id))
+        ),
+        'performance_review (count DONE)': (
+            lambda: Task.query.filter(Task.id.in_(old_ids(employee.id))).filter_by(status='DONE').count(),
+            lambda: visible_tasks_query(director, assigned_user=employee.id).filter_by(status='DONE').count()
+        ),
+    }
+
+    print(f"{'Trường hợp':<36}{'IN list (ms)':>14}{'EXISTS (ms)':>14}{'x':>8}")
+    for name, (old, new) in cases.items():
+        assert old() == new(), name
+        old_ms = timed(old)
+        new_ms = timed(new)
+        print(f"{name:<36}{old_ms:>14.2f}{new_ms:>14.2f}{old_ms / new_ms:>8.1f}")
+
+
+if __name__ == '__main__':
+    app = create_app(BenchConfig)
+    with app.app_context():
+        print(f"Seeding {TASK_COUNT} tasks vào {db.engine.url}...")
+        started = time.perf_counter()
+        employee = seed()
+        director = User.query.filter_by(role='director').first()
+        print(f"Seeded trong {time.perf_counter() - started:.1f}s - "
+              f"{employee.full_name} có {len(old_ids(employee.id))} task được giao\n")
+        run(employee, director)
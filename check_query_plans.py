@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Kiểm tra query plan: các query nóng phải dùng đúng index (chạy lại sau mỗi thay đổi index / query)
+Usage: python check_query_plans.py [số thông báo]   (mặc định 1000000)
+
+- Seed bảng notifications (mặc định 1 triệu dòng) + tasks / task_assignments, ANALYZE,
+  rồi EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (PostgreSQL) từng query và assert tên index trong plan
+- Kiểm tra luôn flask sync-indexes: index đã thay thế (app/schema.py REPLACED_INDEXES) bị xóa
+- Thoát với mã 1 nếu có query không dùng index mong đợi
+
+Dùng database riêng: BENCH_DATABASE_URL (mặc định sqlite:///bench_plans.db trong thư mục hiện tại).
+KHÔNG trỏ vào database thật - script xóa và tạo lại toàn bộ bảng.
+"""
+
+from app import create_app, db, schema
+from app.models import User, Task, TaskAssignment, Notification
+from app.task_queries import assigned_to, visible_tasks_query, kanban_priority
+from config import Config
+from sqlalchemy import insert, select, func, text
+from datetime import datetime, timedelta
+import os
+import random
+import sys
+import time
+
+NOTIFICATION_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+TASK_COUNT = 20000
+USER_COUNT = 30
+BATCH = 20000
+
+
+class PlanConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///' + os.path.abspath('bench_plans.db'))
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(insert(User), [
+        {
+            'email': f'plan{i}@company.com',
+            'password_hash': '-',
+            'full_name': f'Plan User {i}',
+            'role': 'director' if i == 0 else 'hr',
+            'is_active': True
+        }
+        for i in range(USER_COUNT)
+    ])
+    user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+
+    random.seed(7)
+    now = datetime.utcnow()
+
+    for start in range(0, TASK_COUNT, BATCH):
+        tasks = []
+        for task_id in range(start + 1, min(start + BATCH, TASK_COUNT) + 1):
+            created = now - timedelta(minutes=random.randint(0, 365 * 24 * 60))
+            tasks.append({
+                'id': task_id,
+                'title': f'Task {task_id}',
+                'creator_id': user_ids[0],
+                'status': random.choice(['PENDING', 'IN_PROGRESS', 'DONE', 'DONE']),
+                'due_date': created + timedelta(days=random.randint(1, 30)),
+                'created_at': created,
+                'updated_at': created
+            })
+        db.session.execute(insert(Task), tasks)
+        db.session.execute(insert(TaskAssignment), [
+            {
+                'task_id': task['id'],
+                'user_id': random.choice(user_ids[1:]),
+                'assigned_by': user_ids[0],
+                'accepted': random.random() < 0.9,
+                'created_at': task['created_at']
+            }
+            for task in tasks
+        ])
+
+    # Phần lớn thông báo đã đọc - giống dữ liệu thật sau vài tháng
+    for start in range(0, NOTIFICATION_COUNT, BATCH):
+        db.session.execute(insert(Notification), [
+            {
+                'user_id': random.choice(user_ids),
+                'type': 'info',
+                'title': f'Notification {i}',
+                'read': random.random() < 0.95,
+                'created_at': now - timedelta(seconds=random.randint(0, 180 * 24 * 3600))
+            }
+            for i in range(start, min(start + BATCH, NOTIFICATION_COUNT))
+        ])
+        db.session.commit()
+
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+    return user_ids
+
+
+def explain(statement):
+    """Plan dạng text của statement (tham số bind giữ nguyên như khi chạy thật)"""
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.connection().exec_driver_sql(prefix + str(compiled), params).all()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def hot_queries(user_id, now):
+    employee = db.session.get(User, user_id)
+    unread = (Notification.user_id == user_id, Notification.read == False)
+
+    # (tên, statement, index chấp nhận được - plan phải chứa ít nhất 1)
+    return [
+        ('notifications: chưa đọc mới nhất (SSE / dropdown)',
+         select(Notification.id).where(*unread).order_by(Notification.created_at.desc()).limit(10),
+         ('idx_notification_user_unread', 'idx_notification_user_read_created')),
+        ('notifications: đếm chưa đọc',
+         select(func.count(Notification.id)).where(*unread),
+         ('idx_notification_user_unread', 'idx_notification_user_read_created')),
+        ('notifications: trang /notifications (keyset)',
+         select(Notification.id).where(Notification.user_id == user_id)
+         .order_by(Notification.created_at.desc(), Notification.id.desc()).limit(51),
+         ('idx_notification_user_created_id',)),
+        ('task_assignments: task đã nhận của user',
+         select(TaskAssignment.task_id).where(TaskAssignment.user_id == user_id, TaskAssignment.accepted == True),
+         ('idx_assignment_user_accepted_task',)),
+        ('tasks: danh sách task nhân viên (EXISTS)',
+         visible_tasks_query(employee).with_entities(Task.id)
+         .order_by(Task.created_at.desc(), Task.id).limit(10).statement,
+         ('idx_assignment_user_accepted_task',)),
+        ('tasks: cột Kanban IN_PROGRESS (director)',
+         select(Task.id).where(Task.status == 'IN_PROGRESS')
+         .order_by(kanban_priority(now), Task.created_at.desc(), Task.id.desc()).limit(21),
+         ('idx_task_status', 'idx_task_status_due_date')),
+        ('tasks: cột Kanban IN_PROGRESS (nhân viên)',
+         select(Task.id).where(Task.status == 'IN_PROGRESS', assigned_to(user_id))
+         .order_by(kanban_priority(now), Task.created_at.desc(), Task.id.desc()).limit(21),
+         ('idx_assignment_user_accepted_task',)),
+    ]
+
+
+def check_replaced_indexes():
+    """Index cũ còn trên DB (bản nâng cấp từ phiên bản trước) -> sync_indexes phải xóa"""
+    failures = []
+    with db.engine.begin() as connection:
+        for name, (table, columns) in schema.REPLACED_INDEXES.items():
+            connection.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+    schema.sync_indexes(db)
+
+    for name, (table, _) in schema.REPLACED_INDEXES.items():
+        status = 'OK' if name not in schema.existing_indexes(db.engine, table) else 'FAIL'
+        print(f"{status:<6}sync-indexes xóa {name} ({table})")
+        if status == 'FAIL':
+            failures.append(name)
+    return failures
+
+
+def run(user_ids):
+    now = datetime.utcnow()
+    failures = []
+
+    for name, statement, expected in hot_queries(user_ids[1], now):
+        plan = explain(statement)
+        ok = any(index in plan for index in expected)
+        print(f"{'OK' if ok else 'FAIL':<6}{name}")
+        if not ok:
+            failures.append(name)
+            print(f"      cần: {' | '.join(expected)}")
+            print('      ' + plan.replace('\n', '\n      '))
+
+    failures += check_replaced_indexes()
+    return failures
+
+
+if __name__ == '__main__':
+    app = create_app(PlanConfig)
+    with app.app_context():
+        print(f"Seeding {NOTIFICATION_COUNT} thông báo, {TASK_COUNT} tasks vào {db.engine.url}...")
+        started = time.perf_counter()
+        user_ids = seed()
+        print(f"Seeded trong {time.perf_counter() - started:.1f}s\n")
+
+        failures = run(user_ids)
+        print(f"\n{len(failures)} lỗi" if failures else "\nMọi query dùng đúng index")
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Kiểm tra task_stats: số liệu cập nhật dần (mapper events / remove_tasks) phải khớp bản tính lại toàn bộ
+Usage: python check_task_stats.py
+
+- Tạo task + assignment, rồi thao tác qua đúng các route / ORM như người dùng:
+  đổi trạng thái, giao / bỏ giao, xóa 1 task đang được giao (/tasks/<id>/delete), xóa hàng loạt
+- Sau mỗi bước: so bảng task_stats với task_stats.rebuild() và số task của người được giao
+- Thoát với mã 1 nếu có bước lệch
+
+Dùng database riêng: BENCH_DATABASE_URL (mặc định sqlite:///bench_task_stats.db trong thư mục hiện tại).
+KHÔNG trỏ vào database thật - script xóa và tạo lại toàn bộ bảng.
+"""
+
+from app import create_app, db, task_stats
+from app.models import User, Task, TaskAssignment, TaskStat
+from config import Config
+from flask import current_app
+from datetime import datetime, timedelta
+import os
+import sys
+
+PASSWORD = 'check-task-stats'
+
+
+class CheckConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'BENCH_DATABASE_URL', 'sqlite:///' + os.path.abspath('bench_task_stats.db')
+    )
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+    WTF_CSRF_ENABLED = False
+    NOTIFICATION_OUTBOX = False
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+
+    users = {}
+    for role in ('director', 'hr', 'accountant'):
+        user = User(email=f'{role}@check.local', full_name=f'Check {role}', role=role, is_active=True)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        users[role] = user
+    db.session.flush()
+
+    now = datetime.utcnow()
+    for i in range(6):
+        task = Task(
+            title=f'Check {i}',
+            creator_id=users['director'].id,
+            status='PENDING' if i % 2 else 'IN_PROGRESS',
+            due_date=now + timedelta(days=3),
+            created_at=now - timedelta(days=i)
+        )
+        db.session.add(task)
+        db.session.flush()
+        for role in ('hr', 'accountant'):
+            db.session.add(TaskAssignment(
+                task_id=task.id, user_id=users[role].id, assigned_by=users['director'].id, accepted=True
+            ))
+    db.session.commit()
+    task_stats.rebuild()
+    return {role: user.id for role, user in users.items()}
+
+
+def snapshot():
+    return {
+        (row.user_id, row.day, row.status, row.is_urgent, row.is_important, row.is_recurring, row.rated): row.task_count
+        for row in TaskStat.query if row.task_count
+    }
+
+
+def assigned_count(user_id):
+    return Task.query.filter(Task.assignments.any(
+        (TaskAssignment.user_id == user_id) & (TaskAssignment.accepted == True)
+    )).count()
+
+
+def check(name, user_ids):
+    """So task_stats hiện tại với bản tính lại + tổng task của từng người được giao"""
+    db.session.expire_all()
+    live = snapshot()
+    totals = {user_id: task_stats.summary(user_id)['total_tasks'] for user_id in user_ids}
+    expected_totals = {user_id: assigned_count(user_id) for user_id in user_ids}
+
+    task_stats.rebuild()
+    ok = live == snapshot() and totals == expected_totals
+    print(f"{'OK' if ok else 'FAIL':<6}{name}")
+    if not ok:
+        print(f"      tổng theo user: {totals}, cần: {expected_totals}")
+    return ok
+
+
+def run(user_ids):
+    client = current_app.test_client()
+    client.post('/auth/login', data={'email': 'director@check.local', 'password': PASSWORD})
+    assignees = [user_ids['hr'], user_ids['accountant']]
+    results = [check('sau khi seed', assignees)]
+
+    task = Task.query.order_by(Task.id).first()
+    task.status = 'DONE'
+    task.performance_rating = 'good'
+    db.session.commit()
+    results.append(check('đổi trạng thái / đánh giá (ORM)', assignees))
+
+    assignment = TaskAssignment.query.filter_by(user_id=user_ids['accountant']).first()
+    assignment.accepted = False
+    db.session.add(TaskAssignment(
+        task_id=assignment.task_id, user_id=user_ids['director'], assigned_by=user_ids['director'], accepted=True
+    ))
+    db.session.commit()
+    results.append(check('bỏ nhận / giao thêm người (ORM)', assignees + [user_ids['director']]))
+
+    task_id = db.session.query(TaskAssignment.task_id).filter_by(user_id=user_ids['hr']).order_by(
+        TaskAssignment.task_id.desc()
+    ).first()[0]
+    # Request chạy session riêng: kết thúc transaction đọc của script trước
+    db.session.rollback()
+    client.post(f'/tasks/{task_id}/delete')
+    results.append(check(f'xóa task đang được giao (/tasks/{task_id}/delete)', assignees)
+                   and db.session.get(Task, task_id) is None)
+
+    task_ids = [task_id for task_id, in db.session.query(Task.id).order_by(Task.id).limit(2)]
+    db.session.rollback()
+    client.post('/tasks/bulk-delete', data={'task_ids[]': [str(task_id) for task_id in task_ids]})
+    results.append(check(f'xóa hàng loạt {task_ids} (/tasks/bulk-delete)', assignees))
+
+    return results.count(False)
+
+
+if __name__ == '__main__':
+    app = create_app(CheckConfig)
+    with app.app_context():
+        print(f"Seeding vào {db.engine.url}...\n")
+        failures = run(seed())
+        print(f"\n{failures} lỗi" if failures else "\ntask_stats khớp bản tính lại ở mọi bước")
+        sys.exit(1 if failures else 0)
@@ -33,6 +33,54 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_FILE_SIZE', 15728640))
     ALLOWED_EXTENSIONS = set(os.environ.get('ALLOWED_EXTENSIONS', 'pdf,docx,xlsx,png,jpg,jpeg').split(','))
     WTF_CSRF_ENABLED = True
+
+    # Realtime event bus: 'auto' (postgres nếu DB là PostgreSQL), 'postgres', 'memory'
+    REALTIME_BACKEND = os.environ.get('REALTIME_BACKEND', 'auto')
+
+    # SSE giữ DB session: 'per_batch' (trả connection về pool trước khi stream,
+    # feeder checkout lại cho từng lượt query) hoặc 'request' (giữ suốt stream như cũ)
+    SSE_DB_SESSION_MODE = os.environ.get('SSE_DB_SESSION_MODE', 'per_batch')
+
+    # Số stream SSE tối đa / worker (gunicorn --worker-connections 100 -> chừa 40 cho request thường)
+    SSE_MAX_STREAMS_PER_WORKER = int(os.environ.get('SSE_MAX_STREAMS_PER_WORKER', 60))
+
+    # Thông báo: số dòng mỗi trang, thông báo đã đọc cũ hơn N ngày chuyển sang notification_archive,
+    # bản lưu trữ giữ thêm M ngày rồi xóa hẳn (0 = giữ vĩnh viễn)
+    NOTIFICATIONS_PER_PAGE = int(os.environ.get('NOTIFICATIONS_PER_PAGE', 50))
+    NOTIFICATION_ARCHIVE_AFTER_DAYS = int(os.environ.get('NOTIFICATION_ARCHIVE_AFTER_DAYS', 30))
+    NOTIFICATION_ARCHIVE_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_ARCHIVE_RETENTION_DAYS', 365))
+
+    # Kanban: số thẻ mỗi lần tải / cột, cột "Hoàn thành" mặc định chỉ hiện N ngày gần đây (0 = tất cả)
+    KANBAN_PAGE_SIZE = int(os.environ.get('KANBAN_PAGE_SIZE', 20))
+    KANBAN_DONE_DAYS = int(os.environ.get('KANBAN_DONE_DAYS', 30))
+
+    # Cache (app/cache.py): 'memory' (từng worker), 'filesystem' (CACHE_DIR, dùng chung các worker trên 1 máy),
+    # 'redis' (CACHE_REDIS_URL, cần package redis)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_DIR = os.environ.get('CACHE_DIR')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_LOCAL_MAX_ITEMS = int(os.environ.get('CACHE_LOCAL_MAX_ITEMS', 5000))
+    # Nhớ generation của namespace N giây trong worker: xóa cache từ worker khác thấy chậm tối đa N giây
+    CACHE_GENERATION_TTL = int(os.environ.get('CACHE_GENERATION_TTL', 1))
+
+    # Hub: cache badge (/hub/api/realtime-stats) theo user trong N giây (0 = tắt cache)
+    HUB_STATS_CACHE_TTL = int(os.environ.get('HUB_STATS_CACHE_TTL', 5))
+
+    # Chế độ tổng hợp (digest): chu kỳ gửi thông báo tổng hợp cho director / manager đã bật
+    NOTIFICATION_DIGEST_INTERVAL_MINUTES = int(os.environ.get('NOTIFICATION_DIGEST_INTERVAL_MINUTES', 60))
+
+    # Web Push (VAPID) - cần pywebpush; tạo khóa: `vapid --gen` hoặc `npx web-push generate-vapid-keys`
+    # WEB_PUSH_MOCK=true: gửi JSON thô, không mã hóa (test với /notifications/push/mock)
+    VAPID_PUBLIC_KEY = os.environ.get('VAPID_PUBLIC_KEY')
+    VAPID_PRIVATE_KEY = os.environ.get('VAPID_PRIVATE_KEY')
+    VAPID_SUBJECT = os.environ.get('VAPID_SUBJECT', 'mailto:admin@localhost')
+    WEB_PUSH_MOCK = os.environ.get('WEB_PUSH_MOCK') == 'true'
+
+    # Transactional outbox cho thông báo (mặc định tắt = tạo thông báo ngay trong request như trước).
+    # Bật (true): thông báo chỉ được tạo khi có tiến trình xử lý notification_outbox - thread nền của
+    # web worker (tự chạy ở process bật cờ này) hoặc job process_notification_outbox của scheduler
+    # (run_scheduler.py). Process ghi thông báo mà không có 2 thứ trên (CLI, service khác) -> người nhận chờ
+    NOTIFICATION_OUTBOX = os.environ.get('NOTIFICATION_OUTBOX', 'false') == 'true'
     VERSION = '2.5.7'
 
     #  AI Summary - Groq
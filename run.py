@@ -28,6 +28,64 @@ def init_db():
     print("Database initialized!")
 
 
+@app.cli.command()
+def sync_indexes():
+    """Tạo các index khai báo trong models còn thiếu trên database đang chạy, xóa index đã được thay thế."""
+    from app import schema
+
+    checked, dropped = schema.sync_indexes(db)
+    if dropped:
+        print(f"Dropped replaced indexes: {', '.join(dropped)}")
+    print(f"Indexes synced ({checked} checked)!")
+
+
+# Cột thêm sau bản phát hành đầu (upgrade-notifications tự thêm nếu thiếu)
+NOTIFICATION_COLUMNS = {
+    'notifications': {
+        'target_type': 'VARCHAR(20)',
+        'target_id': 'INTEGER',
+        'item_count': 'INTEGER NOT NULL DEFAULT 1',
+    },
+    'users': {
+        'notification_digest': 'BOOLEAN DEFAULT FALSE',
+        'last_digest_at': 'TIMESTAMP',
+    },
+}
+
+
+@app.cli.command()
+def upgrade_notifications():
+    """Thêm các cột mới cho thông báo (nếu thiếu), điền target từ link cũ, tạo index, đếm counter."""
+    from sqlalchemy import inspect, text
+    from app import notification_service
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table, new_columns in NOTIFICATION_COLUMNS.items():
+            columns = {column['name'] for column in inspector.get_columns(table)}
+            for name, ddl in new_columns.items():
+                if name not in columns:
+                    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+
+    updated = notification_service.backfill_targets()
+    sync_indexes.callback()
+    # Counter cho mọi user: lần đọc badge sau đó chỉ còn 1 lần đọc theo khóa chính
+    notification_service.recount_counters()
+    db.session.commit()
+    print(f"Notifications upgraded ({updated} targets backfilled)!")
+
+
+@app.cli.command()
+def rebuild_task_stats():
+    """Tạo bảng task_stats (nếu thiếu) và tính lại toàn bộ số liệu tổng hợp từ tasks."""
+    from app import task_stats
+    from app.models import TaskStat
+
+    TaskStat.__table__.create(bind=db.engine, checkfirst=True)
+    days = task_stats.rebuild()
+    print(f"Task stats rebuilt ({days} days)!")
+
+
 if __name__ == '__main__':
     # Chỉ chạy development server khi chạy trực tiếp file này
     port = int(os.environ.get('PORT', 5000))